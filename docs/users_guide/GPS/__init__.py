@@ -10777,6 +10777,21 @@ class VCS2(object):
         :param str repo_version:
         """
 
+    def _set_relative_files_status(self, paths, status, version, repo_version):
+        """
+        Modifies self's cache, like :func:`GPS.VCS2._set_file_status`, for
+        files given by their path relative to the working directory. This
+        avoids creating one :class:`GPS.File` per file when setting the
+        status of a large number of files.
+        This function is meant to be called only by the implementation of
+        specific VCS engines.
+
+        :param List(str) paths:
+        :param GPS.VCS2.Status status:
+        :param str version:
+        :param str repo_version:
+        """
+
     def _override_status_display(self, status, label, icon_name):
         """
         Override the label and icon to use for a given status.
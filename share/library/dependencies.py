@@ -18,6 +18,8 @@ files.
 
 To run this script, you must first compile your project, since this script
 relies on information found in the .ali files generated by the Ada compiler.
+The analysis runs in the background. The dependencies of each file are kept
+between runs, and only computed again when its .ali file has changed.
 
 The output of this script can be viewed either as textual output in the
 GPS Messages window (which you can then save to a text file, or through a
@@ -28,11 +30,14 @@ graphical tree widget, which you can dynamically manipulate.
 # No user customization below this line
 #
 
+import GPS
 from GPS import Console, EditorBuffer, File, Preference, Project, XMLViewer
 from gs_utils import interactive
 import traceback
 import re
 import os
+import time
+import workflows
 
 Preference("Plugins/dependencies/show_source").create(
     "Show source",
@@ -65,6 +70,24 @@ show_single_file = True
 # between two projects. Otherwise, we show all file dependencies. Setting this
 # to False will make the computation much slower though
 
+XML_REFRESH_PERIOD = 1.0
+# Minimal delay, in seconds, between two refreshes of the XML viewer while
+# the dependencies are computed. The document must also have doubled in size
+# since the previous refresh, so that parsing the partial documents costs
+# at most twice as much as parsing the final one.
+
+STEP_DURATION = 0.05
+# Time, in seconds, spent computing dependencies before letting the UI
+# process events
+
+logger = GPS.Logger("DEPENDENCIES")
+
+_imports_cache = {}
+# For each source file, a tuple (timestamp of its .ali file, imports) where
+# imports is the list of (file, project) it depends on. This avoids querying
+# the cross-references again for the units that were not recompiled. This
+# cache is reset when the cross-references are updated.
+
 
 class Output:
     def __init__(self):
@@ -98,25 +121,40 @@ class Output:
 
 class XMLOutput:
     def __init__(self):
-        self.xml = "<?xml version='1.0' ?>\n<projects>\n"
+        # The document is built as a list of parts, and sent to the viewer
+        # periodically while the dependencies are being computed
+        self.parts = ["<?xml version='1.0' ?>\n<projects>\n"]
+        self.size = len(self.parts[0])
+        self.refreshed_size = self.size
         self.current_project = None
         self.current_dep = None
+        self.view = None
+        self.last_refresh = time.time()
+
+    def append(self, part):
+        self.parts.append(part)
+        self.size += len(part)
 
     def close_dependency(self):
         if self.current_dep:
-            self.xml = self.xml + "</dependency>\n"
+            self.append("</dependency>\n")
             self.current_dep = None
 
     def close_project(self):
         self.close_dependency()
         if self.current_project:
-            self.xml = self.xml + "</project>\n"
+            self.append("</project>\n")
             self.current_project = None
+            if (
+                time.time() - self.last_refresh > XML_REFRESH_PERIOD
+                and self.size >= 2 * self.refreshed_size
+            ):
+                self.refresh()
 
     def set_current_project(self, project):
         self.close_project()
         self.current_project = project
-        self.xml = self.xml + "<project name='" + project.name() + "'>\n"
+        self.append("<project name='" + project.name() + "'>\n")
 
     def add_dependency(self, dependency, newdep=True, removed=False):
         self.close_dependency()
@@ -127,19 +165,12 @@ class XMLOutput:
             extra = "extra=' (should be added)'"
         else:
             extra = "extra=''"
-        self.xml = (
-            self.xml
-            + "<dependency name='"
-            + dependency.file().path
-            + "' "
-            + extra
-            + ">\n"
+        self.append(
+            "<dependency name='" + dependency.file().path + "' " + extra + ">\n"
         )
 
     def explain_dependency(self, file, depends_on):
-        self.xml = (
-            self.xml + "<file src='" + file.path + "'>" + depends_on.path + "</file>\n"
-        )
+        self.append("<file src='" + file.path + "'>" + depends_on.path + "</file>\n")
 
     def parse_attrs(self, attrs):
         """Parse an XML attribute string  attr='foo' attr="bar" """
@@ -166,69 +197,133 @@ class XMLOutput:
             return [os.path.basename(attr["src"]), os.path.basename(value)]
         return []
 
+    def refresh(self):
+        """Show the projects output so far in the viewer"""
+        if self.view is None:
+            self.view = XMLViewer(
+                name="Project dependencies",
+                columns=2,
+                sorted=True,
+                parser=self.parse_xml_node,
+                on_click=self.on_node_clicked,
+            )
+        self.parts = ["".join(self.parts)]
+        self.view.parse_string(self.parts[0] + "</projects>\n")
+        self.refreshed_size = self.size
+        self.last_refresh = time.time()
+
     def close(self):
         self.close_project()
-        self.xml = self.xml + "</projects>\n"
-        view = XMLViewer(
-            name="Project dependencies",
-            columns=2,
-            sorted=True,
-            parser=self.parse_xml_node,
-            on_click=self.on_node_clicked,
-        )
-        view.parse_string(self.xml)
-        self.xml = ""
+        self.refresh()
+        self.parts = []
 
 
-def compute_project_dependencies(output):
+def get_ali_stamps(project):
+    """
+    Return the timestamps of the .ali files in the object directories of
+    project, indexed by base name.
+    """
+    result = {}
+    for d in project.object_dirs(recursive=False):
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.name.endswith(".ali"):
+                        st = entry.stat()
+                        result.setdefault(entry.name, (st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return result
+
+
+def get_imports(source, ali_stamps):
+    """
+    Return the list of (file, project) imported by source, reusing the
+    result of a previous run if the .ali file of source has not changed.
+    """
+    ali = os.path.splitext(source.base_name())[0] + ".ali"
+    key = ali_stamps.get(ali)
+    cached = _imports_cache.get(source.path)
+    if cached is not None and key is not None and cached[0] == key:
+        return cached[1]
+
+    imports = [
+        (imp, imp.project(default_to_root=False))
+        for imp in source.imports(include_implicit=True, include_system=False)
+    ]
+    _imports_cache[source.path] = (key, imports)
+    return imports
+
+
+def compute_project_dependencies(task, output):
     try:
-        depends_on = dict()
-        current_deps = dict()
-        for p in Project.root().dependencies(recursive=True):
-            current_deps[p] = [cur for cur in p.dependencies(recursive=False)]
-            tmp = dict()
+        start = time.time()
+        step_start = start
+        projects = Project.root().dependencies(recursive=True)
+        no_source_projects = [
+            s.strip().lower()
+            for s in Preference("Plugins/dependencies/no_src_prj").get().split(",")
+        ]
+
+        for index, p in enumerate(projects):
+            task.set_progress(index, len(projects))
+            current_deps = [cur for cur in p.dependencies(recursive=False)]
+            ali_stamps = get_ali_stamps(p)
+            depends_on = dict()
             previous = p
             for s in p.sources(recursive=False):
-                for imp in s.imports(include_implicit=True, include_system=False):
-                    ip = imp.project(default_to_root=False)
+                for imp, ip in get_imports(s, ali_stamps):
                     if ip and ip != p:
                         if show_single_file:
                             if ip != previous:
-                                tmp[ip] = [(s, imp)]
+                                depends_on[ip] = [(s, imp)]
                         else:
                             try:
-                                tmp[ip].append((s, imp))
+                                depends_on[ip].append((s, imp))
                             except KeyError:
-                                tmp[ip] = [(s, imp)]
+                                depends_on[ip] = [(s, imp)]
                         previous = ip
-            depends_on[p] = tmp
-
-        no_source_projects = [
-            s.strip().lower()
-            for s in Preference("Plugins/dependencies/no_src_prj").get().split(",")
-        ]
 
-        for p in depends_on:
             output.set_current_project(p)
-            for dep in depends_on[p]:
-                output.add_dependency(dep, newdep=dep not in current_deps[p])
-                for reason in depends_on[p][dep]:
+            for dep in depends_on:
+                output.add_dependency(dep, newdep=dep not in current_deps)
+                for reason in depends_on[dep]:
                     output.explain_dependency(reason[0], reason[1])
 
                 try:
-                    current_deps[p].remove(dep)
+                    current_deps.remove(dep)
                 except ValueError:
                     pass
 
-            for dep in current_deps[p]:
+            for dep in current_deps:
                 if dep.name().lower() not in no_source_projects:
                     output.add_dependency(dep, newdep=False, removed=True)
 
+            # Let the UI process events from time to time
+            if time.time() - step_start > STEP_DURATION:
+                yield
+                step_start = time.time()
+
         output.close()
+        logger.log(
+            "analyzed %d projects in %.2fs" % (len(projects), time.time() - start)
+        )
     except Exception:
         Console().write("Unexpected exception " + traceback.format_exc())
 
 
+def reset_imports_cache(*args):
+    _imports_cache.clear()
+
+
+GPS.Hook("project_view_changed").add(reset_imports_cache)
+
+# The imports come from the cross-references database, which is updated
+# after the .ali files are written: the imports computed in between are
+# not up-to-date.
+GPS.Hook("xref_updated").add(reset_imports_cache)
+
+
 @interactive(
     name="check project dependencies to console",
     menu="/Analyze/Project Dependencies/Check (to console)",
@@ -238,7 +333,12 @@ def check_project_dependencies_to_console():
     Check whether there are dependencies between the project files that are
     in fact not needed. Output is displayed in the Messages window.
     """
-    compute_project_dependencies(Output())
+    workflows.task_workflow(
+        "project dependencies",
+        compute_project_dependencies,
+        active=True,
+        output=Output(),
+    )
 
 
 @interactive(
@@ -250,4 +350,9 @@ def check_project_dependencies_to_xml():
     Check whether there are dependencies between the project files that are
     in fact not needed. Output is displayed in a tree.
     """
-    compute_project_dependencies(XMLOutput())
+    workflows.task_workflow(
+        "project dependencies",
+        compute_project_dependencies,
+        active=True,
+        output=XMLOutput(),
+    )
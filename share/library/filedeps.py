@@ -17,60 +17,187 @@ second (for instance "file1" depends on "file2", which depends on "file3")
 #############################################################################
 
 import GPS
+import collections
 import os.path
 from gs_utils import interactive
 
 
-def internal_dependency_path(from_file, to_file, include_implicit):
-    # We do the computation starting from to_file, since it is more efficient
-    # to compute "imported" files than "importing files". Since we want to
-    # compute the path itself, do not do a recursive search.
-    deps = dict()
+class ImportGraph(object):
+    """
+    A cache of the dependencies between the source files of the project,
+    as reported by GPS.File.imports. The imports of a file are computed the
+    first time they are needed, and the reverse dependencies the first time
+    they are queried. The cache is reset when the project view changes or
+    a compilation finishes.
+    """
+
+    def __init__(self):
+        self.imports = ({}, {})  # for each include_implicit, file -> imports
+        self.importers = ({}, {})  # for each include_implicit, file -> importers
+        self.has_importers = [False, False]
+
+    def reset(self, *args):
+        self.__init__()
+
+    def get_imports(self, file, include_implicit):
+        """
+        Return the list of files that file depends on.
+        """
+        cache = self.imports[include_implicit]
+        result = cache.get(file)
+
+        if result is None:
+            result = [
+                f
+                for f in file.imports(
+                    include_implicit=include_implicit, include_system=False
+                )
+                if f
+            ]
+
+            # imports does not list the dependency from body to spec, so we
+            # add it explicitly if file is a body.
+
+            ext = os.path.splitext(file.path)
+            if ext[1] == ".adb" or (ext[1] == ".ada" and ext[0][-2:] == ".2"):
+                spec = file.other_file()
+                if spec and spec != file:
+                    result.append(spec)
+
+            cache[file] = result
+
+        return result
+
+    def get_importers(self, file, include_implicit):
+        """
+        Return the list of the project's source files that depend on file.
+        """
+        importers = self.importers[include_implicit]
+
+        if not self.has_importers[include_implicit]:
+            for f in GPS.Project.root().sources(recursive=True):
+                for imported in self.get_imports(f, include_implicit):
+                    importers.setdefault(imported, []).append(f)
+            self.has_importers[include_implicit] = True
+
+        return importers.get(file, [])
+
+    def shortest_path(self, from_file, to_file, include_implicit):
+        """
+        Return the shortest list of files from from_file to to_file, each
+        depending on the next one, or None if from_file does not depend on
+        to_file.
+        """
+        # Breadth-first search: deps maps each file reached to the file that
+        # imports it on a shortest path from from_file.
+        deps = {from_file: None}
+        to_analyze = collections.deque([from_file])
+
+        while to_analyze:
+            file = to_analyze.popleft()
+            if file == to_file:
+                path = []
+                while file is not None:
+                    path.append(file)
+                    file = deps[file]
+                path.reverse()
+                return path
+
+            for f in self.get_imports(file, include_implicit):
+                if f not in deps:
+                    deps[f] = file
+                    to_analyze.append(f)
+
+        return None
+
+    def all_paths(self, from_file, to_file, max_length, include_implicit):
+        """
+        Return all the lists of files from from_file to to_file, each
+        depending on the next one, with at most max_length dependencies.
+        """
+        result = []
+        path = [from_file]
+        on_path = {from_file}
+
+        # Files that cannot reach to_file in the remaining number of steps
+        # are not worth exploring: compute their distance to to_file.
+        distance = {to_file: 0}
+        to_analyze = collections.deque([to_file])
+        while to_analyze:
+            file = to_analyze.popleft()
+            if distance[file] < max_length:
+                for f in self.get_importers(file, include_implicit):
+                    if f not in distance:
+                        distance[f] = distance[file] + 1
+                        to_analyze.append(f)
+
+        def visit(file):
+            if file == to_file:
+                result.append(list(path))
+                return
+            for f in self.get_imports(file, include_implicit):
+                if (
+                    f not in on_path
+                    and distance.get(f, max_length + 1) + len(path) <= max_length
+                ):
+                    path.append(f)
+                    on_path.add(f)
+                    visit(f)
+                    on_path.discard(f)
+                    path.pop()
+
+        if distance.get(from_file, max_length + 1) <= max_length:
+            visit(from_file)
+        return result
 
-    # List of files to analyze. This is a list of tuples, the first element of
-    # which is the name of the file to analyze, and the second is the name of
-    # the parent that put it in the list
-    to_analyze = [(from_file, None)]
+    def dependents(self, file, include_implicit):
+        """
+        Return the set of files that depend, directly or not, on file.
+        """
+        result = set()
+        to_analyze = [file]
 
-    while len(to_analyze) != 0:
-        (file, because_of) = to_analyze.pop()
-        imports = file.imports(include_implicit=include_implicit, include_system=False)
+        while to_analyze:
+            for f in self.get_importers(to_analyze.pop(), include_implicit):
+                if f not in result:
+                    result.add(f)
+                    to_analyze.append(f)
 
-        # imports does not list the dependency from body to spec, so we add it
-        # explicitly if from_file is a body.
+        result.discard(file)
+        return result
 
-        ext = os.path.splitext(from_file.path)
-        if ext[1] == ".adb" or (ext[1] == ".ada" and ext[0][-2:] == ".2"):
-            imports.append(from_file.other_file())
 
-        deps[file] = because_of
-        if file == to_file:
-            break
+import_graph = ImportGraph()
 
-        for f in imports:
-            if f and f not in deps:
-                to_analyze.append((f, file))
 
-    target = to_file
-    result = ""
-    targets = []
+def internal_dependency_path(from_file, to_file, include_implicit):
+    path = import_graph.shortest_path(from_file, to_file, include_implicit)
+    if path is None:
+        return ("No dependency between these two files", [to_file])
+
+    result = "".join(" -> " + f.path + "\n" for f in path)
+    return (result, list(reversed(path)))
+
+
+def dependency_paths(from_file, to_file, max_length, include_implicit=False):
+    """Returns all the reasons why modifying to_file implies that from_file
+    needs to be recompiled, as lists of GPS.File where each file depends on
+    the next one. Only the paths with at most max_length dependencies are
+    returned."""
+    return import_graph.all_paths(from_file, to_file, max_length, include_implicit)
 
-    while target:
-        targets.append(target)
-        result = " -> " + target.path + "\n" + result
-        if target not in deps:
-            result = "No dependency between these two files"
-            break
-        target = deps[target]
-    return (result, targets)
+
+def dependent_files(file, include_implicit=False):
+    """Returns the set of GPS.File that need to be recompiled when file
+    is modified, i.e. that depend directly or indirectly on it."""
+    return import_graph.dependents(file, include_implicit)
 
 
 def dependency_path(from_file, to_file, fill_location=False, title=""):
     """Shows why modifying to_file implies that from_file needs to be
     recompiled. This information is computed from the cross-references
     database, and requires your application to have been compiled
-    properly. This function does not attempt to compute the shortest
-    dependency path, and just returns the first one it finds.
+    properly. This function returns the shortest dependency path.
     FROM_FILE and TO_FILE must be instances of GPS.File.
     If FILL_LOCATION is True, then the locations view will also be
     filled."""
@@ -96,6 +223,7 @@ def dependency_path(from_file, to_file, fill_location=False, title=""):
         )
 
     if fill_location and result != "No dependency between these two files":
+        added = False
         target = targets.pop()
 
         # Fill the locations view with the result
@@ -170,3 +298,7 @@ def interactive_dependency_path():
         return
 
     print_dependency_path(GPS.File(file1), GPS.File(file2))
+
+
+GPS.Hook("compilation_finished").add(import_graph.reset)
+GPS.Hook("project_view_changed").add(import_graph.reset)
@@ -1,14 +1,20 @@
 """Local history for files
 
 This script provides a local history for files: every time a file is saved,
-it is also committed in a local RCS directory, which can later be used to
+it is also stored in a local history directory, which can later be used to
 easily revert to a previous version.
 Compared to the standard undo feature in GPS, this provides a persistent
 undo across GPS sessions.
 
-You must install RCS. On Unix systems, this is generally available by
+By default, the history is stored by GPS itself: each revision is saved as
+a compressed copy of the file, shared by all the revisions with the same
+contents, and listed in a small index.
+Alternatively, the history can be committed in a local RCS directory. You
+must then install RCS. On Unix systems, this is generally available by
 default. On Windows, this is available through the cygwin environment.
-If RCS is not detected on your PATH, this module will do nothing.
+If RCS is not detected on your PATH, this backend will do nothing.
+Files which already have an RCS history keep using it with either backend,
+as long as RCS is found on the PATH, so that this history is not lost.
 
 A new contextual menu is shown for files that have a local history. This
 menu allows you to view the diff between the current version of the file
@@ -38,9 +44,23 @@ from GPS import (
 import os
 import shutil
 import datetime
+import hashlib
 import traceback
 import time
 import re
+import zlib
+from diff_match_patch import diff_match_patch
+
+Preference("Plugins/local_history/backend").create(
+    "Backend",
+    "enum",
+    """How the local history is stored:
+- "builtin" keeps compressed copies of the file, without spawning any process.
+- "rcs" commits each revision in a local RCS file, and requires RCS.""",
+    0,
+    "builtin",
+    "rcs",
+)
 
 Preference("Plugins/local_history/rcsdir").create(
     "Local RCS dir",
@@ -62,8 +82,8 @@ Preference("Plugins/local_history/maxrevisions").create(
 Preference("Plugins/local_history/diff_switches").create(
     "Diff switches",
     "string",
-    """Additional switches to pass to rcsdiff. In particular, this can be used
-to specify your preferred format for diff""",
+    """Additional switches to pass to rcsdiff, when using the "rcs" backend.
+In particular, this can be used to specify your preferred format for diff""",
     "-u",
 )
 
@@ -107,6 +127,11 @@ class LocalHistory:
         self.file = self.file.replace("\\", "/")
         self.rcs_file = self.rcs_file.replace("\\", "/")
 
+    def revision_name(self, revision):
+        """Return the name of the revision with the given number, as passed
+        to the other methods of this class"""
+        return "1.%s" % revision
+
     def get_revisions(self):
         """Extract all revisions and associated dates.
         Result is a list of tuples: (revision_number, date), where
@@ -295,21 +320,247 @@ class LocalHistory:
             os.chdir(pwd)
 
 
+class BuiltinLocalHistory(LocalHistory):
+
+    """A local history stored without any external tool: each revision is a
+    zlib-compressed copy of the file, named after the sha1 of its contents
+    so that identical revisions share the same copy, and an index lists
+    the revisions with their date and contents."""
+
+    def __init__(self, file):
+        LocalHistory.__init__(self, file)
+        self.store = os.path.join(self.rcs_dir, os.path.basename(self.file)) + ".hist"
+        self.index = os.path.join(self.store, "index")
+
+    def revision_name(self, revision):
+        return "%s" % revision
+
+    def read_index(self):
+        """Return the list of revisions, oldest first, as tuples
+        (revision_number, date, sha1)"""
+        try:
+            with open(self.index) as f:
+                result = []
+                for line in f:
+                    num, date, digest = line.split()
+                    result.append((int(num), date, digest))
+                return result
+        except IOError:
+            return []
+
+    def write_index(self, entries):
+        """Replace the index with the given list of revisions"""
+        with open(self.index + ".tmp", "w") as f:
+            f.writelines("%d %s %s\n" % e for e in entries)
+        os.replace(self.index + ".tmp", self.index)
+
+    def get_revisions(self):
+        if not self.rcs_dir:
+            return
+        return [(e[0], e[1]) for e in reversed(self.read_index())]
+
+    def add_to_history(self):
+        if not self.rcs_dir:
+            Logger("LocalHist").log("No RCS dir for file " + self.file)
+            return
+
+        with open(self.file, "rb") as f:
+            contents = f.read()
+        digest = hashlib.sha1(contents).hexdigest()
+
+        entries = self.read_index()
+        if entries and entries[-1][2] == digest:
+            return  # unchanged since the last revision
+
+        if not os.path.isdir(self.store):
+            os.makedirs(self.store)
+            Logger("LocalHist").log("creating directory %s" % self.store)
+
+        blob = os.path.join(self.store, digest)
+        if not os.path.isfile(blob):
+            with open(blob + ".tmp", "wb") as f:
+                f.write(zlib.compress(contents))
+            os.replace(blob + ".tmp", blob)
+
+        num = entries[-1][0] + 1 if entries else 1
+        with open(self.index, "a") as f:
+            f.write(
+                "%d %s %s\n"
+                % (num, datetime.datetime.now().strftime("%Y.%m.%d.%H.%M.%S"), digest)
+            )
+
+    def cleanup_history(self):
+        if not self.rcs_dir:
+            return
+
+        max_days = Preference("Plugins/local_history/maxdays").get()
+        older = datetime.datetime.now() - datetime.timedelta(days=max_days)
+        older = older.strftime("%Y.%m.%d.%H.%M.%S")
+        max_revisions = Preference("Plugins/local_history/maxrevisions").get()
+
+        entries = self.read_index()
+
+        # Always keep the most recent revision
+        kept = [
+            e
+            for e in entries[max(0, len(entries) - max_revisions) : -1]
+            if e[1] >= older
+        ]
+        kept.extend(entries[-1:])
+
+        if len(kept) < len(entries):
+            Logger("LocalHist").log(
+                "Truncating history of %s to %s revisions" % (self.file, len(kept))
+            )
+            self.write_index(kept)
+
+            used = set(e[2] for e in kept)
+            for e in entries:
+                if e[2] not in used:
+                    used.add(e[2])
+                    try:
+                        os.unlink(os.path.join(self.store, e[2]))
+                    except OSError:
+                        pass
+
+    def get_contents(self, revision):
+        """Return the contents of the file at the given revision, as bytes,
+        or None if the revision is unknown or its copy cannot be read"""
+        for num, date, digest in self.read_index():
+            if self.revision_name(num) == revision:
+                try:
+                    with open(os.path.join(self.store, digest), "rb") as f:
+                        return zlib.decompress(f.read())
+                except (IOError, zlib.error) as e:
+                    Logger("LocalHist").log(
+                        "Cannot read revision %s of %s: %s" % (revision, self.file, e)
+                    )
+                    return None
+        return None
+
+    def local_checkout(self, revision):
+        if self.rcs_dir and os.path.isdir(self.store):
+            contents = self.get_contents(revision)
+            if contents is not None:
+                local = os.path.join(self.rcs_dir, os.path.basename(self.file))
+                with open(local, "wb") as f:
+                    f.write(contents)
+                return local
+        return None
+
+    def show_diff(self, revision, date):
+        if self.rcs_dir and os.path.isdir(self.store):
+            old = self.get_contents(revision)
+            if old is None:
+                Console("Local History").write(
+                    "Revision at %s is no longer in the local history of %s\n"
+                    % (date, os.path.basename(self.file))
+                )
+                return
+
+            with open(self.file, "rb") as f:
+                new = f.read()
+            diff = unified_diff(
+                old.decode("utf-8", "replace"),
+                new.decode("utf-8", "replace"),
+                "%s\t%s" % (os.path.basename(self.file), date),
+                os.path.basename(self.file),
+            )
+            Console("Local History").clear()
+            Console("Local History").write("Local history at " + date + "\n")
+            Console("Local History").write(diff)
+
+    def has_local_history(self):
+        return os.path.isfile(self.index)
+
+
+def unified_diff(old, new, old_name, new_name, context=3):
+    """Return a unified diff between the two strings, computed line by line
+    with diff_match_patch"""
+    dmp = diff_match_patch()
+    chars1, chars2, lines = dmp.diff_linesToChars(old, new)
+    diffs = dmp.diff_main(chars1, chars2, False)
+    dmp.diff_charsToLines(diffs, lines)
+
+    # The lines of both texts, each with its operation
+    ops = []
+    for op, text in diffs:
+        ops.extend((op, line) for line in text.splitlines(True))
+
+    # Number of lines of each text before each entry in ops
+    old_pos = [0]
+    new_pos = [0]
+    for op, line in ops:
+        old_pos.append(old_pos[-1] + (op != dmp.DIFF_INSERT))
+        new_pos.append(new_pos[-1] + (op != dmp.DIFF_DELETE))
+
+    changed = [idx for idx, (op, line) in enumerate(ops) if op != dmp.DIFF_EQUAL]
+    result = ["--- %s\n" % old_name, "+++ %s\n" % new_name]
+    prefix = {dmp.DIFF_EQUAL: " ", dmp.DIFF_DELETE: "-", dmp.DIFF_INSERT: "+"}
+
+    idx = 0
+    while idx < len(changed):
+        # Merge the changes whose contexts overlap in a single hunk
+        start = max(0, changed[idx] - context)
+        while idx + 1 < len(changed) and changed[idx + 1] - changed[idx] <= 2 * context:
+            idx += 1
+        end = min(len(ops), changed[idx] + context + 1)
+        idx += 1
+
+        # An empty range starts at the line before it, as in GNU diff
+        old_len = old_pos[end] - old_pos[start]
+        new_len = new_pos[end] - new_pos[start]
+        result.append(
+            "@@ -%d,%d +%d,%d @@\n"
+            % (
+                old_pos[start] + (old_len > 0),
+                old_len,
+                new_pos[start] + (new_len > 0),
+                new_len,
+            )
+        )
+        for op, line in ops[start:end]:
+            if not line.endswith("\n"):
+                line += "\n\\ No newline at end of file\n"
+            result.append(prefix[op] + line)
+
+    return "".join(result)
+
+
+def get_local_history(file):
+    """Return the local history for file, using the backend selected in the
+    preferences, or RCS if the file already has an RCS history"""
+    hist = LocalHistory(file)
+    if Preference("Plugins/local_history/backend").get() == "rcs":
+        return hist
+    if hist.has_local_history() and has_RCS_on_path():
+        return hist
+    return BuiltinLocalHistory(file)
+
+
+_has_RCS_on_path = None
+# Cache for has_RCS_on_path
+
+
 def has_RCS_on_path():
     """True if RCS was found on the PATH"""
-    for path in os.getenv("PATH").split(os.pathsep):
-        if os.path.isfile(os.path.join(path, "ci")) or os.path.isfile(
-            os.path.join(path, "ci.exe")
-        ):
-            return True
-    return False
+    global _has_RCS_on_path
+    if _has_RCS_on_path is None:
+        _has_RCS_on_path = False
+        for path in os.getenv("PATH").split(os.pathsep):
+            if os.path.isfile(os.path.join(path, "ci")) or os.path.isfile(
+                os.path.join(path, "ci.exe")
+            ):
+                _has_RCS_on_path = True
+                break
+    return _has_RCS_on_path
 
 
 def on_file_saved(hook, file):
     """Called when a file has been saved"""
     try:
         Logger("LocalHist").log("saving file in local history: " + file.path)
-        hist = LocalHistory(file)
+        hist = get_local_history(file)
         hist.add_to_history()
         hist.cleanup_history()
     except Exception:
@@ -318,7 +569,7 @@ def on_file_saved(hook, file):
 
 def contextual_filter(context):
     try:
-        hist = LocalHistory(context.file())
+        hist = get_local_history(context.file())
         return hist.has_local_history()
     except Exception:
         return False
@@ -326,7 +577,7 @@ def contextual_filter(context):
 
 def contextual_factory(context):
     try:
-        hist = LocalHistory(context.file())
+        hist = get_local_history(context.file())
         revisions = hist.get_revisions()
 
         # Save in the context the result of parsing the file. This factory is
@@ -336,7 +587,7 @@ def contextual_factory(context):
         try:
             return context.revisions_menu
         except Exception:
-            context.revisions = ["1.%s" % a[0] for a in revisions]
+            context.revisions = [hist.revision_name(a[0]) for a in revisions]
             result = []
             for a in revisions:
                 date = datetime.datetime(
@@ -350,33 +601,34 @@ def contextual_factory(context):
 
 
 def on_revert(context, choice, choice_index):
-    hist = LocalHistory(context.file())
+    hist = get_local_history(context.file())
     hist.revert_file(context.revisions[choice_index])
 
 
 def on_diff(context, choice, choice_index):
-    hist = LocalHistory(context.file())
+    hist = get_local_history(context.file())
     hist.diff_file(
         context.revisions[choice_index], context.revisions_menu[choice_index]
     )
 
 
 def on_patch(context, choice, choice_index):
-    hist = LocalHistory(context.file())
+    hist = get_local_history(context.file())
     hist.show_diff(
         context.revisions[choice_index], context.revisions_menu[choice_index]
     )
 
 
 def on_view_all(context):
-    hist = LocalHistory(context.file())
+    hist = get_local_history(context.file())
     hist.view_all(context.revisions, context.revisions_menu)
 
 
 def register_module(hook):
-    """Activate this local history module if RCS is found on the path"""
+    """Activate this local history module, unless it is configured to use
+    RCS and RCS is not found on the path"""
 
-    if has_RCS_on_path():
+    if Preference("Plugins/local_history/backend").get() != "rcs" or has_RCS_on_path():
         Hook("file_saved").add(on_file_saved, last=True)
         Contextual("Local History/Revert to").create_dynamic(
             factory=contextual_factory,
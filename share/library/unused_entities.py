@@ -22,9 +22,11 @@ they might show references to entities even though these entities are in fact
 no longer used (which means GPS will not correctly report all cases of unused
 entities).
 
-Executing this script blocks the whole GPS interface, so it is normal that
-GPS becomes unresponsive. Depending of the size of your project, this can
-take a while to execute.
+When searching in a project, or in all projects, the references of all
+entities are first counted in a single pass over the source files, and then
+the unused entities are added to the Locations window as they are found.
+This runs in the background and can be interrupted from the Task Manager.
+Depending of the size of your project, this can take a while to execute.
 Note that you can save the contents of the Locations window, after execution,
 through the GPS.Locations.dump() method in the python console.
 """
@@ -35,6 +37,15 @@ through the GPS.Locations.dump() method in the python console.
 
 from GPS import Preference, Project, Console, Editor, File, Locations, EditorBuffer, MDI
 from gs_utils import interactive
+import time
+import workflows
+
+IGNORED_KINDS = ("declaration", "body", "label")
+# The kinds of references that do not count as a use of the entity
+
+STEP_DURATION = 0.05
+# Time, in seconds, spent counting references or examining entities before
+# giving control back to the UI
 
 xmlada_projects = [
     "xmlada_sax",
@@ -101,7 +112,7 @@ def GlobalIterator(where):
 def is_unused(entity):
     refs = entity.references(include_implicit=True, synchronous=True, show_kind=True)
     for loc, kind in refs.items():
-        if kind != "declaration" and kind != "body" and kind != "label":
+        if kind not in IGNORED_KINDS:
             return False
 
     # If we have a primitive operation, do not report it for now, since it
@@ -127,25 +138,96 @@ def UnusedIterator(where, globals_only):
             yield e
 
 
+def entity_key(entity):
+    """Return a key identifying entity in the references counts. This is
+    the internal id of the entity in the cross-references database, so it
+    does not require any query."""
+    return hash(entity)
+
+
+def count_references(task, files, counts):
+    """
+    Count the references to all entities from files, except for those
+    whose kind is in IGNORED_KINDS, and store the result in counts, indexed
+    by entity_key.
+    """
+    step_start = time.time()
+    for index, f in enumerate(files):
+        task.set_progress(index, len(files))
+        ignored = set()
+        for kind in IGNORED_KINDS:
+            for _, loc in f.references(kind=kind):
+                ignored.add((loc.line(), loc.column()))
+
+        for e, loc in f.references():
+            if (loc.line(), loc.column()) not in ignored:
+                key = entity_key(e)
+                counts[key] = counts.get(key, 0) + 1
+
+        # Let the UI process events from time to time
+        if time.time() - step_start > STEP_DURATION:
+            yield
+            step_start = time.time()
+
+
+def add_unused_entity(e):
+    Locations.add(
+        category="Unused entity",
+        file=e.declaration().file(),
+        line=e.declaration().line(),
+        column=e.declaration().column(),
+        message="unused entity " + e.name(),
+        highlight="Unused_Entities",
+        length=len(e.name()),
+    )
+
+
+def find_unused_entities(task, where, globals_only):
+    """
+    Workflow listing the unused entities from WHERE, using the references
+    counts computed for all the sources of the loaded projects.
+    """
+    counts = {}
+    yield count_references(task, Project.root().sources(recursive=True), counts)
+
+    if globals_only:
+        iter = GlobalIterator
+    else:
+        iter = EntityIterator
+
+    step_start = time.time()
+    for e in iter(where):
+        if counts.get(entity_key(e), 0) == 0 and not e.primitive_of():
+            add_unused_entity(e)
+
+        if time.time() - step_start > STEP_DURATION:
+            yield
+            step_start = time.time()
+
+    Console().write("Done searching for unused entities\n")
+
+
 def show_unused_entities(where, globals_only):
     """List all unused global entities from WHERE in the locations window"""
     Editor.register_highlighting("Unused_Entities", "blue")
     Locations.remove_category("Unused entity")
     MDI.get("Messages").raise_window()
 
-    for e in UnusedIterator(where, globals_only=globals_only):
-        Locations.add(
-            category="Unused entity",
-            file=e.declaration().file(),
-            line=e.declaration().line(),
-            column=e.declaration().column(),
-            message="unused entity " + e.name(),
-            highlight="Unused_Entities",
-            length=len(e.name()),
+    if isinstance(where, File):
+        # Few entities: querying their references one by one is faster than
+        # counting the references in all sources
+        for e in UnusedIterator(where, globals_only=globals_only):
+            add_unused_entity(e)
+        Console().write("Done searching for unused entities\n")
+    else:
+        workflows.task_workflow(
+            "unused entities",
+            find_unused_entities,
+            active=True,
+            where=where,
+            globals_only=globals_only,
         )
 
-    Console().write("Done searching for unused entities\n")
-
 
 @interactive(
     name="show unused entities from file",
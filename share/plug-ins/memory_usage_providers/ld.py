@@ -1,13 +1,25 @@
 import GPS
+import bisect
+from array import array
 import os.path
 import re
+import time
 from . import core
+from gs_utils import interactive
 from os_utils import locate_exec_on_path
 import traceback
 from workflows import run_as_workflow
+from workflows.promises import timeout
 
 MAP_FILE_BASE_NAME = "map.txt"
 
+PARSE_CHUNK_SIZE = 1 << 20
+# Approximate number of bytes of the map file parsed at once
+
+PARSE_TIME_SLICE = 0.05
+# Maximum time (in seconds) spent parsing the map file before giving back
+# control to the main loop
+
 xml = """
 <filter name="ld_supports_map_file" shell_lang="python"
         shell_cmd="memory_usage_providers.ld.LD.map_file_is_supported(
@@ -19,6 +31,13 @@ GPS.current_context())" />
 class LD(core.MemoryUsageProvider):
     _cache = {}
 
+    _map_cache = {}
+    # For each map file, its key (directory, mtime and size) and the
+    # MapFileParser that parsed it
+
+    _previous_map = {}
+    # For each map file, the MapFileParser of its previous version
+
     # The list of supported targets
     _supported_targets = [
         "arm-eabi",
@@ -95,13 +114,70 @@ class LD(core.MemoryUsageProvider):
     def is_enabled(self):
         return LD.map_file_is_supported(None)
 
-    @run_as_workflow
-    def async_fetch_memory_usage_data(self, visitor):
-        # Retrieve the memory map file generated by ld
+    @staticmethod
+    def map_file():
+        """
+        Return the path of the memory map file generated by ld, and the
+        directory it is in.
+        """
         project = GPS.Project.root()
         obj_dirs = project.object_dirs(recursive=False)
         map_dir = project.file().directory() if not obj_dirs else obj_dirs[0]
-        map_file_name = os.path.join(map_dir, MAP_FILE_BASE_NAME)
+        return (os.path.join(map_dir, MAP_FILE_BASE_NAME), map_dir)
+
+    @staticmethod
+    def parse_map_file(map_file_name, map_dir):
+        """
+        A generator that parses the given map file, and returns its
+        MapFileParser.
+
+        The result of the last parsing is reused if the map file has not
+        changed since then. Otherwise, the previous result is kept to be
+        compared with the new one.
+        """
+        st = os.stat(map_file_name)
+        key = (map_dir, st.st_mtime, st.st_size)
+        cached = LD._map_cache.get(map_file_name)
+        if cached is not None and cached[0] == key:
+            yield cached[1]
+            return
+
+        # Parse the memory map file to retrieve the memory regions and
+        # the path of the linked executable. The file is parsed by chunks,
+        # giving back control to the main loop between them so that large
+        # map files do not freeze GPS.
+
+        start = time.time()
+        parser = MapFileParser(map_dir)
+
+        with open(map_file_name, "r") as f:
+            deadline = time.time() + PARSE_TIME_SLICE
+            while True:
+                lines = f.readlines(PARSE_CHUNK_SIZE)
+                if not lines:
+                    break
+                parser.feed(lines)
+
+                if time.time() > deadline:
+                    yield timeout(0)
+                    deadline = time.time() + PARSE_TIME_SLICE
+
+        parser.flush_symbols()
+
+        if cached is not None:
+            LD._previous_map[map_file_name] = cached[1]
+        LD._map_cache[map_file_name] = (key, parser)
+
+        GPS.Logger("MEMORY_USAGE_VIEWS.LD").log(
+            "map file parsed in %.3fs (%d symbols)"
+            % (time.time() - start, len(parser.symbols))
+        )
+        yield parser
+
+    @run_as_workflow
+    def async_fetch_memory_usage_data(self, visitor):
+        # Retrieve the memory map file generated by ld
+        map_file_name, map_dir = LD.map_file()
 
         # If the map file is not found, it means that the ld linker has not
         # been invoked (e.g: when building a library). Return imediately in
@@ -111,191 +187,462 @@ class LD(core.MemoryUsageProvider):
             visitor.on_memory_usage_data_fetched([], [], [])
             return
 
-        # The information we want to fetch: memory regions and memory sections
-        # ??? Find a way to have a finer grain view (symbols? compilation
-        # units?)
-        regions = []
-        sections = []
-        modules_dict = {}
-        modules = []
-
-        # The regexps used to match the information we want to fetch
-        region_r = re.compile(
-            r"^(?P<name>\*?\w+\*?)\s+(?P<origin>0x[0-9a-f]+)"
-            + r"\s+(?P<length>0x[0-9a-f]+)\s+x?r?w?"
-        )
-        section_r = re.compile(
-            r"^(?P<name>[\w.]+)\s+(?P<origin>0x[0-9a-f]+)"
-            + r"\s+(?P<length>0x[0-9a-f]+)"
+        try:
+            parser = yield LD.parse_map_file(map_file_name, map_dir)
+            visitor.on_memory_usage_data_fetched(*parser.result())
+
+        except Exception:
+            logger = GPS.Logger("GPS.MEMORY_USAGE.SCRIPTS.LD")
+            logger.log("Exception caught while parsing ld's map file:")
+            logger.log(traceback.format_exc())
+
+
+class SymbolTable(object):
+    """
+    A compact store for the symbols found in a map file: each attribute of
+    the symbols is stored in its own array, and the names of the symbols,
+    of their sections and of their modules are stored as indexes in a
+    table of strings.
+    """
+
+    def __init__(self):
+        self.addresses = array("Q")
+        self.sizes = array("Q")
+        self.sections = array("L")
+        self.modules = array("L")
+        self.names = array("L")
+
+        self.strings = []
+        self.__string_ids = {}
+
+    def intern(self, string):
+        """
+        Return the index of string in the table of strings.
+        """
+        result = self.__string_ids.get(string)
+        if result is None:
+            result = len(self.strings)
+            self.__string_ids[string] = result
+            self.strings.append(string)
+        return result
+
+    def add(self, address, size, section, module, name):
+        """
+        Add a symbol.
+
+        :param int address: the address of the symbol
+        :param int size: its size, in bytes
+        :param str section: the name of its section
+        :param str module: the module (object file) that defines it
+        :param str name: the name of the symbol
+        """
+        self.addresses.append(address)
+        self.sizes.append(size)
+        self.sections.append(self.intern(section))
+        self.modules.append(self.intern(module))
+        self.names.append(self.intern(name))
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        """
+        Iterate over the symbols, as tuples
+        (address, size, section, module, name).
+        """
+        strings = self.strings
+        for idx in range(len(self.addresses)):
+            yield (
+                self.addresses[idx],
+                self.sizes[idx],
+                strings[self.sections[idx]],
+                strings[self.modules[idx]],
+                strings[self.names[idx]],
+            )
+
+
+class MapFileParser(object):
+    """
+    Parse the memory map file generated by ld, to retrieve the memory
+    regions, the allocated sections and the size taken by each object file
+    (module) in each section.
+
+    This only relies on the contents of the map file, so that it can be
+    fed with lines by chunks.
+    """
+
+    # The regexps used to match the information we want to fetch
+    region_r = re.compile(
+        r"^(?P<name>\*?\w+\*?)\s+(?P<origin>0x[0-9a-f]+)"
+        + r"\s+(?P<length>0x[0-9a-f]+)\s+x?r?w?"
+    )
+    section_r = re.compile(
+        r"^(?P<name>[\w.]+)\s+(?P<origin>0x[0-9a-f]+)" + r"\s+(?P<length>0x[0-9a-f]+)"
+    )
+    module_r = re.compile(
+        r"^\s+[\w.]*\s+(?P<origin>0x[0-9a-f]+)\s+"
+        + r"(?P<size>0x[0-9a-f]+) (?P<files>.+\.o\)?)"
+    )
+    symbol_r = re.compile(r"^\s+(?P<address>0x[0-9a-f]+)\s+(?P<name>\S+)\s*$")
+    files_r = re.compile(r"\(|\)")
+
+    not_alloc_sections_prefixes = (".debug", ".comment")
+
+    def __init__(self, map_dir):
+        """
+        :param str map_dir: the directory of the map file, where object
+           files with no directory information are assumed to be.
+        """
+        self.map_dir = map_dir
+
+        # The information we want to fetch: memory regions, memory
+        # sections, the size of each module in each section and the
+        # symbols they define
+        self.regions = []
+        self.sections = []
+        self.modules_dict = {}
+        self.symbols = SymbolTable()
+
+        # The input section (in a module) being parsed, as a tuple
+        # (end address, section name, module name), and the (address, name)
+        # of the symbols found in it so far. The size of a symbol is only
+        # known once the next one, or the end of the input section, is seen.
+        self.input_section = None
+        self.input_symbols = []
+
+        # The bounds of the regions, and for each interval between two
+        # bounds the name of the region that contains it: computed when
+        # the first section is found.
+        self.region_bounds = None
+        self.region_names = None
+
+    def __compute_region_bounds(self):
+        """
+        Compute the intervals used to find the region of an address. When
+        regions overlap, an address belongs to the first region declared.
+        """
+        ranges = []
+        for name, origin, length in self.regions:
+            region_addr = int(origin, 16)
+            ranges.append((region_addr, region_addr + length, name))
+
+        self.region_bounds = sorted(
+            set(r[0] for r in ranges) | set(r[1] for r in ranges)
         )
-        module_r = re.compile(
-            r"^\s+[\w.]*\s+(?P<origin>0x[0-9a-f]+)\s+"
-            + r"(?P<size>0x[0-9a-f]+) (?P<files>.+\.o\)?)"
+        self.region_names = []
+        for low in self.region_bounds:
+            name = ""
+            for region_start, region_end, region_name in ranges:
+                if region_start <= low < region_end:
+                    name = region_name
+                    break
+            self.region_names.append(name)
+
+    def region_name_from_address(self, addr):
+        """
+        Return the name of the region associated with the given address or
+        an empty string if not found.
+        """
+        if self.region_bounds is None:
+            self.__compute_region_bounds()
+
+        idx = bisect.bisect_right(self.region_bounds, addr) - 1
+        return self.region_names[idx] if idx >= 0 else ""
+
+    @classmethod
+    def is_section_allocated(cls, section):
+        """
+        Return True if the given section tuple is going to be allocated in
+        memory, False otherwise.
+
+        An allocated section is a memory section that will actually be
+        loaded by the target. Sections related with debug information,
+        code comments or that have null size are typically not allocated
+        and should be ignored.
+        """
+        return section[2] != 0 and not section[0].startswith(
+            cls.not_alloc_sections_prefixes
         )
 
-        def region_name_from_address(addr):
-            """
-            Return the name of the region associated with the given address or
-            an empty string if not found.
-            """
+    def try_match_region(self, line):
+        """
+        Try to match a region description in the given line.
 
-            for region in regions:
-                region_addr = int(region[1], 16)
-                region_size = region[2]
+        Return a tuple (name, origin, length) if a region was matched
+        and None otherwise.
+        """
 
-                if addr >= region_addr and addr < (region_addr + region_size):
-                    return region[0]
+        m = self.region_r.search(line)
+        if m:
+            return (m.group("name"), m.group("origin"), int(m.group("length"), 16))
+        else:
+            return None
 
-            return ""
+    def try_match_section(self, line):
+        """
+        Try to match an allocated section description in the given live.
 
-        def is_section_allocated(section):
-            """
-            Return True if the given section tuple is going to be allocated in
-            memory, False otherwise.
+        Return a tuple (name, origin, length, region_name) if a section was
+        matched and None otherwise.
+        """
 
-            An allocated section is a memory section that will actually be
-            loaded by the target. Sections related with debug information,
-            code comments or that have null size are typically not allocated
-            and should be ignored.
-            """
+        m = self.section_r.search(line)
 
-            not_alloc_sections_prefixes = [".debug", ".comment"]
+        if m:
+            section_addr = m.group("origin")
+            region_name = self.region_name_from_address(int(section_addr, 16))
+            section = (
+                m.group("name"),
+                section_addr,
+                int(m.group("length"), 16),
+                region_name,
+            )
 
-            for prefix in not_alloc_sections_prefixes:
-                if section[0].startswith(prefix):
-                    return False
+            return section
+        else:
+            return None
 
-            if section[2] == 0:
-                return False
+    def try_match_module(self, line):
+        """
+        Try to match a module description in the given line.
 
-            return True
+        A module description gives information about the size taken by
+        an object file in a given section.
+        """
 
-        def try_match_region(line):
-            """
-            Try to match a region description in the given line.
+        # Don't try to match a module if sections have not been parsed yet
+        if not self.sections:
+            return
 
-            Return a tuple (name, origin, length) if a region was matched
-            and None otherwise.
-            """
+        m = self.module_r.search(line)
+        if m:
+            files_info = m.group("files")
+            module_size = int(m.group("size"), 16)
+            section = self.sections[-1]
+            self.flush_symbols()
 
-            m = region_r.search(line)
-            if m:
-                return (m.group("name"), m.group("origin"), int(m.group("length"), 16))
-            else:
-                return None
-
-        def try_match_section(line):
-            """
-            Try to match an allocated section description in the given live.
-
-            Return a tuple (name, origin, length, region_name) if a section was
-            matched and None otherwise.
-            """
-
-            m = section_r.search(line)
-
-            if m:
-                section_addr = m.group("origin")
-                region_name = region_name_from_address(int(section_addr, 16))
-                section = (
-                    m.group("name"),
-                    section_addr,
-                    int(m.group("length"), 16),
-                    region_name,
-                )
+            # Do nothing if the module belongs to a section that will not
+            # be allocated or if it's size is null.
 
-                return section
-            else:
-                return None
+            if module_size == 0 or not self.is_section_allocated(section):
+                return
 
-        def try_match_module(line):
-            """
-            Try to match a module description in the given line.
+            section_name = section[0]
+            self.input_section = (
+                int(m.group("origin"), 16) + module_size,
+                section_name,
+                files_info,
+            )
+            module = self.modules_dict.get((files_info, section_name), None)
 
-            A module description gives information about the size taken by
-            an object file in a given section.
-            """
+            # If a previous module decription has been found for the same
+            # key, just add the size of this one to the previously found
+            # one.
 
-            # Don't try to match a module if sections have not been parsed yet
-            if not sections:
+            if module:
+                module[3] += module_size
                 return
 
-            m = module_r.search(line)
-            if m:
-                files_info = m.group("files")
-                files = re.split(r"\(|\)", files_info)
+            # Get the object file name and, if any, information about
+            # the library for which this file has been compiled.
 
-                # Get the object file name and, if any, information about
-                # the library for which this file has been compiled.
+            files = self.files_r.split(files_info)
+            obj_file = files[0] if len(files) == 1 else files[1]
+            lib_file = files[0] if len(files) > 1 else ""
 
-                obj_file = files[0] if len(files) == 1 else files[1]
-                lib_file = files[0] if len(files) > 1 else ""
-                module_size = int(m.group("size"), 16)
-                section = sections[-1]
+            # If the object file name does not contain any directory
+            # information assume that this file is located in the same
+            # directory as the map file.
 
-                # Do nothing if the module belongs to a section that will not
-                # be allocated or if it's size is null.
+            if not os.path.dirname(obj_file) and not lib_file:
+                obj_file = os.path.join(self.map_dir, obj_file)
 
-                if module_size == 0 or not is_section_allocated(section):
-                    return
+            region_name = section[3]
+            self.modules_dict[(files_info, section_name)] = [
+                obj_file,
+                lib_file,
+                m.group("origin"),
+                module_size,
+                region_name,
+                section_name,
+            ]
 
-                section_name = section[0]
-                module = modules_dict.get((files_info, section_name), None)
+    def try_match_symbol(self, line):
+        """
+        Try to match a symbol in the given line, which only contains its
+        address and name. Return True if a symbol was matched.
+        """
 
-                # If the object file name does not contain any directory
-                # information assume that this file is located in the same
-                # directory as the map file.
+        m = self.symbol_r.search(line)
+        if m:
+            if self.input_section is not None:
+                self.input_symbols.append(
+                    (int(m.group("address"), 16), m.group("name"))
+                )
+            return True
+        return False
 
-                if not os.path.dirname(obj_file) and not lib_file:
-                    obj_file = os.path.join(map_dir, obj_file)
+    def flush_symbols(self):
+        """
+        Store the symbols found in the current input section, now that
+        their size can be computed, and close this input section.
+        """
+        if self.input_symbols:
+            end, section_name, module_name = self.input_section
+            symbols = self.input_symbols
+            for idx, (address, name) in enumerate(symbols):
+                next_address = symbols[idx + 1][0] if idx + 1 < len(symbols) else end
+                self.symbols.add(
+                    address,
+                    max(0, next_address - address),
+                    section_name,
+                    module_name,
+                    name,
+                )
+            self.input_symbols = []
+        self.input_section = None
 
-                # If a previous module decription has been found for the same
-                # key, just add the size of this one to the previously found
-                # one.
+    def feed(self, lines):
+        """
+        Parse the given lines of the map file.
 
-                if module:
-                    module[3] += int(m.group("size"), 16)
+        :param List(str) lines: the next lines of the map file.
+        """
+        for line in lines:
+            # All descriptions contain addresses. Regions and sections start
+            # at the beginning of the line, modules are indented.
+            if "0x" not in line:
+                continue
+
+            if line[0] in " \t":
+                if not self.try_match_symbol(line):
+                    self.try_match_module(line)
+                continue
+
+            region = self.try_match_region(line)
+            if region:
+                self.regions.append(region)
+                self.region_bounds = None
+            else:
+                section = self.try_match_section(line)
+                if section:
+                    self.flush_symbols()
+                    self.sections.append(section)
                 else:
-                    region_name = section[3]
-                    module = [
-                        obj_file,
-                        lib_file,
-                        m.group("origin"),
-                        int(m.group("size"), 16),
-                        region_name,
-                        section_name,
-                    ]
-                    modules_dict[(files_info, section_name)] = module
+                    self.try_match_module(line)
 
-        # Parse the memory map file to retrieve the memory regions and
-        # the path of the linked executable.
+    def result(self):
+        """
+        Return the regions, allocated sections and modules found so far,
+        as expected by `on_memory_usage_data_fetched`.
+        """
+        modules = [tuple(module) for module in self.modules_dict.values()]
 
-        try:
-            with open(map_file_name, "r") as f:
-                for line in f:
-                    region = try_match_region(line)
-                    if not region:
-                        section = try_match_section(line)
-                        if section:
-                            sections.append(section)
-                        else:
-                            try_match_module(line)
-                    else:
-                        regions.append(region)
+        # Keep only the sections that will be allocated in memory
 
-            for module in modules_dict.values():
-                modules.append(tuple(module))
+        sections = [s for s in self.sections if self.is_section_allocated(s)]
 
-            # Keep only the sections that will be allocated in memory
+        return (list(self.regions), sections, modules)
 
-            sections = [s for s in sections if is_section_allocated(s)]
 
-            visitor.on_memory_usage_data_fetched(regions, sections, modules)
+def compute_sizes(parser):
+    """
+    Return the size used by each region, section, module and symbol in the
+    parsed map file, as a dict for each of these categories mapping names
+    to sizes. Modules are named after the section they contribute to, and
+    symbols after their module.
+    """
+    regions, sections, modules = parser.result()
+    sizes = {"regions": {}, "sections": {}, "modules": {}, "symbols": {}}
 
-        except Exception:
-            logger = GPS.Logger("GPS.MEMORY_USAGE.SCRIPTS.LD")
-            logger.log("Exception caught while parsing ld's map file:")
-            logger.log(traceback.format_exc())
+    for name, origin, length, region_name in sections:
+        sizes["sections"][name] = sizes["sections"].get(name, 0) + length
+        if region_name:
+            sizes["regions"][region_name] = (
+                sizes["regions"].get(region_name, 0) + length
+            )
+
+    for obj_file, lib_file, origin, size, region_name, section_name in modules:
+        module = "%s(%s)" % (lib_file, obj_file) if lib_file else obj_file
+        name = "%s (%s)" % (module, section_name)
+        sizes["modules"][name] = sizes["modules"].get(name, 0) + size
+
+    symbols = sizes["symbols"]
+    for address, size, section_name, module_name, name in parser.symbols:
+        key = "%s (%s)" % (name, module_name)
+        symbols[key] = symbols.get(key, 0) + size
+
+    return sizes
+
+
+def diff_memory_usage(previous, current):
+    """
+    Compare two parsed map files.
+
+    :param MapFileParser previous: the map file of the previous link
+    :param MapFileParser current: the map file of the last link
+    :return: for each category ("regions", "sections", "modules" and
+       "symbols"), a list of (name, previous size, current size) for all
+       the elements whose size changed, largest growth first. An element
+       that does not exist in one of the map files has a size of 0.
+    """
+    old_sizes = compute_sizes(previous)
+    new_sizes = compute_sizes(current)
+    result = {}
+
+    for category, new in new_sizes.items():
+        old = old_sizes[category]
+        changes = []
+        for name in set(old) | set(new):
+            old_size = old.get(name, 0)
+            new_size = new.get(name, 0)
+            if old_size != new_size:
+                changes.append((name, old_size, new_size))
+        changes.sort(key=lambda c: (c[1] - c[2], c[0]))
+        result[category] = changes
+
+    return result
+
+
+@interactive(
+    name="compare memory usage with previous link",
+    category="Memory Usage",
+    filter=LD.map_file_is_supported,
+)
+def compare_with_previous_link():
+    """
+    Display the growth of each memory region, section, module and symbol
+    between the two last links of the executable.
+    """
+    map_file_name, map_dir = LD.map_file()
+    if not os.path.isfile(map_file_name):
+        GPS.Console().write("No map file found: %s\n" % map_file_name)
+        return
+
+    current = yield LD.parse_map_file(map_file_name, map_dir)
+    previous = LD._previous_map.get(map_file_name)
+    if previous is None:
+        GPS.Console().write(
+            "No previous link to compare with: %s has not changed since"
+            " it was first loaded\n" % map_file_name
+        )
+        return
+
+    console = GPS.Console("Memory Usage Diff")
+    console.clear()
+    console.write(
+        "Memory usage of %s compared with the previous link\n" % map_file_name
+    )
+
+    for category, changes in diff_memory_usage(previous, current).items():
+        console.write("\n%s:\n" % category.capitalize())
+        if not changes:
+            console.write("  (no change)\n")
+        for name, old_size, new_size in changes:
+            console.write(
+                "  %+10d  %s (%d -> %d)\n"
+                % (new_size - old_size, name, old_size, new_size)
+            )
 
 
 GPS.parse_xml(xml)
@@ -69,6 +69,8 @@ class MDL_Language(GPS.Language):
     const_split = re.compile("#QGEN(.*)#")
     # The constant string used to create a construct id
     const_id = "#QGEN"
+    # The number of constructs created before giving control back to the UI
+    constructs_batch_size = 500
 
     # @overriding
     def __init__(self):
@@ -101,55 +103,39 @@ class MDL_Language(GPS.Language):
                 "Creating outline for %s" % file.name(), parse_model_tree, viewer=viewer
             )
 
-        @workflows.run_as_workflow
-        def fill_tree(
-            task,
-            viewer,
-            it_name,
-            it_id,
-            sloc_start,
-            sloc_end,
-            type,
-            idx,
-            offset,
-            task_max,
-        ):
-            c_id = "{0}{1}{2}#{3}".format(
-                it_name, MDL_Language.const_id, sloc_end[-1], it_id
-            )
-            c_name = (
-                it_name
-                if flat
-                else Diagram_Utils.block_split(it_name, count=1, backward=True)[-1]
-            )
-            viewer.constructs.append((c_name, c_id, sloc_start, sloc_end, type, it_id))
-            viewer.constructs_map[c_id] = (c_name, sloc_start, sloc_end, type, it_id)
-            task.set_progress(idx, task_max)
-
         def parse_model_tree(task, viewer):
             GPS.Console().write(
                 "Generating outline view for the model %s...\n" % viewer.file
             )
-            id, val = viewer.diags.index[0]
             idx = 0
-            offset = 1
             for it_name, it_id, sloc_start, sloc_end, type, task_max in process_item(
                 viewer
             ):
-                idx += 1
-                offset = max(offset, sloc_end[2]) + 1
-                yield fill_tree(
-                    task,
-                    viewer,
-                    it_name,
-                    it_id,
+                c_id = "{0}{1}{2}#{3}".format(
+                    it_name, MDL_Language.const_id, sloc_end[-1], it_id
+                )
+                c_name = (
+                    it_name
+                    if flat
+                    else Diagram_Utils.block_split(it_name, count=1, backward=True)[-1]
+                )
+                viewer.constructs.append(
+                    (c_name, c_id, sloc_start, sloc_end, type, it_id)
+                )
+                viewer.constructs_map[c_id] = (
+                    c_name,
                     sloc_start,
                     sloc_end,
                     type,
-                    idx,
-                    offset,
-                    task_max,
+                    it_id,
                 )
+                idx += 1
+
+                # Give control back to the UI after each batch of constructs
+                if idx % MDL_Language.constructs_batch_size == 0:
+                    task.set_progress(idx, task_max)
+                    yield timeout(0)
+
             viewer.parsing_done()
             GPS.Console().write("Outline view generated\n")
             GPS.Hook("file_edited").run(file)
@@ -166,50 +152,20 @@ class MDL_Language(GPS.Language):
             offset = 0
             item, children = viewer.diags.index[0]
             items_len = len(children)
-            item_stack = [(item, item, children, 0)]
-            item, item_id, children, start_offset = item_stack[-1]
             # The index entry contains a JSON_Array of entries with
             # a 'name' and 'diagram' fields. They respectively correspond
-            # to the simulink name of the item and its corresponding JSON id
+            # to the simulink name of the item and its corresponding JSON id.
+            # The stack contains the subsystems being traversed, with an
+            # iterator on their remaining children.
+            item_stack = [(item, item, iter(children), 0)]
             while item_stack:
-                children_cpy = list(children)
-                for child in children_cpy:
-                    child_name = child["name"]
-                    child_id = child["diagram"]
-                    for child_entry_name, child_children in viewer.diags.index:
-                        # Look for the child diagram in the index table
-                        if child_entry_name == child_id:
-                            offset = offset + 1
-                            items_len += len(child_children)
-                            item_stack.append(
-                                (child_name, child_id, list(child_children), offset)
-                            )
-                            break
-                    children.remove(child)
-                    # If the subsystem has no child, add the construct as a
-                    # leaf
-                    if not item_stack[-1][2]:
-                        it, it_id, _, start_offset = item_stack.pop()
-                        offset = offset + 1
-                        yield (
-                            it,
-                            it_id,
-                            (0, 0, start_offset),
-                            (0, 0, offset),
-                            constructs.CAT_CLASS,
-                            items_len,
-                        )
-                    else:
-                        break
+                item, item_id, children, start_offset = item_stack[-1]
+                child = next(children, None)
 
-                if item_stack:
-                    item, item_id, children, start_offset = item_stack[-1]
-                else:
-                    break
-
-                # If all the children of that subsystem have been processed add
-                # the containing subsystem construct
-                while not children:
+                if child is None:
+                    # All the children of that subsystem have been processed:
+                    # add the containing subsystem construct
+                    item_stack.pop()
                     offset = offset + 1
                     yield (
                         item,
@@ -219,12 +175,20 @@ class MDL_Language(GPS.Language):
                         constructs.CAT_CLASS,
                         items_len,
                     )
-                    item_stack.pop()
-
-                    if item_stack:
-                        item, item_id, children, start_offset = item_stack[-1]
-                    else:
-                        break
+                else:
+                    # Look for the child diagram in the index table
+                    child_children = viewer.diags.children.get(child["diagram"])
+                    if child_children is not None:
+                        offset = offset + 1
+                        items_len += len(child_children)
+                        item_stack.append(
+                            (
+                                child["name"],
+                                child["diagram"],
+                                iter(child_children),
+                                offset,
+                            )
+                        )
 
         viewer = QGEN_Diagram_Viewer.retrieve_active_qgen_viewer_for_file(file)
 
@@ -881,8 +845,7 @@ class QGEN_Diagram_Viewer(GPS.Browsers.View):
                     open(f), diagramFactory=QGEN_Diagram, load_styles=style
                 )
                 logger.log("Done loading")
-                viewer.diags.index.extend(loaded_diag.index)
-                viewer.diags.diagrams.extend(loaded_diag.diagrams)
+                viewer.diags.extend(loaded_diag)
 
     @staticmethod
     def get_or_create_from_model(model, on_loaded=None):
@@ -1266,6 +1229,9 @@ else:
 
     Project_Support.register_tool()
 
+    QGEN_VALUES_MARKER = "qgen_values"
+    # The first line output by the qgen_print_values command (gdb_scripts.py)
+
     class AsyncDebugger(object):
         __query_interval = 5
 
@@ -1273,6 +1239,7 @@ else:
             self._debugger = debugger
             self._this_promise = None
             self._symbol = None
+            self._symbols = None
             self._output = None
             self._timer = None
             self._deadline = None
@@ -1288,7 +1255,12 @@ else:
                 self._remove_timers()
 
                 # and if there's cmd to run, send it
-                if self._symbol is not None:
+                if self._symbols is not None:
+                    self._output = self._print_values(self._symbols)
+                    self._symbols = None
+                    self._this_promise.resolve(self._output)
+
+                elif self._symbol is not None:
                     if self._symbol != "":
                         self._output = self._debugger.value_of(self._symbol)
                         self._symbol = None
@@ -1311,6 +1283,7 @@ else:
             # answer the promise with the output
             if self._this_promise:
                 self._symbol = None
+                self._symbols = None
                 self._this_promise.resolve(self._output)
 
         def _remove_timers(self):
@@ -1331,6 +1304,47 @@ else:
                     pass
                 self._timer = None
 
+        def _print_values(self, symbols):
+            """
+            Compute the values of all symbols with a single command, defined
+            in gdb_scripts.py. Fall back to one command per symbol if that
+            script has not been loaded.
+            :return: a dict symbol => value
+            """
+            output = self._debugger.send(
+                "qgen_print_values %s"
+                % " ".join(
+                    '"%s"' % s.replace("\\", "\\\\").replace('"', '\\"')
+                    for s in symbols
+                ),
+                output=False,
+            )
+            lines = output.splitlines()
+            if QGEN_VALUES_MARKER not in lines:
+                return {s: self._debugger.value_of(s) for s in symbols}
+
+            values = {}
+            for line in lines[lines.index(QGEN_VALUES_MARKER) + 1 :]:
+                symbol, _, value = line.partition("\t")
+                values[symbol] = value
+            return values
+
+        def async_print_values(self, symbols, timeout=0):
+            """
+            Same as async_print_value, for a list of symbols.
+            Promise returned here will be answered with a dict
+            symbol => value.
+            """
+
+            self._this_promise = Promise()
+            self._symbols = symbols
+            self._output = None
+
+            self._timer = GPS.Timeout(self.__query_interval, self._is_busy)
+            if timeout > 0:
+                self._deadline = GPS.Timeout(timeout, self._on_cmd_timeout)
+            return self._this_promise
+
         def async_print_value(self, symbol, timeout=0, block=False):
             """
             Called by user on request for command within deadline (time)
@@ -1363,6 +1377,9 @@ else:
         previous_breakpoints = []
         debugger = None
 
+        # The number of signal values computed by a single debugger command
+        values_batch_size = 200
+
         @staticmethod
         def load_debug_info_for(f, d=None):
             if QGEN_Module.modeling_map is None:
@@ -1456,38 +1473,74 @@ else:
             for _, _, it in Diagram_Utils.forall_auto_items([diagram]):
                 item_parent = QGEN_Module.get_item_parent_to_display(it)
                 item_parent.hide()
+                it._displayed_value = None
             diagram.changed()
 
         @staticmethod
         def compute_all_item_values(task, debugger, diagram, viewer):
             # Compute the value for all items with an "auto" property
             QGEN_Module.display_tasks.append(task)
-            auto_items_list = list(Diagram_Utils.forall_auto_items([diagram]))
-            auto_items_len = len(auto_items_list)
-            idx = 0
+            cur_frame = QGEN_Module.get_current_frame(debugger) or ""
+
+            # The items to update for each symbol
+            items = {}
+            changed = False
             for diag, toplevel, it in Diagram_Utils.forall_auto_items([diagram]):
-                yield QGEN_Module.compute_item_values(
-                    debugger, diag, toplevel=toplevel, item=it
-                )
+                # Find the parent with an id. When item is the label of a
+                # link, the parent will be set to None, so we default to
+                # toplevel (the link, in that case)
+                parent = it.get_parent_with_id() or toplevel
+                ss = QGEN_Module.get_var_from_item(debugger, parent, cur_frame)
+                if ss is None:
+                    changed = QGEN_Module.set_item_value(it, None) or changed
+                else:
+                    items.setdefault(ss, []).append(it)
+
+            if changed:
                 diagram.changed()
-                idx = idx + 1
-                task.set_progress(idx, auto_items_len)
+
+            symbols = list(items)
+            async_debugger = AsyncDebugger(debugger)
+            batch_size = QGEN_Module.values_batch_size
+            for idx in range(0, len(symbols), batch_size):
+                batch = symbols[idx : idx + batch_size]
+                values = yield async_debugger.async_print_values(batch)
+                changed = False
+                for ss in batch:
+                    for it in items[ss]:
+                        if QGEN_Module.set_item_value(it, (values or {}).get(ss)):
+                            changed = True
+
+                # Redraw the diagram once per batch, if needed
+                if changed:
+                    diagram.changed()
+                task.set_progress(idx + len(batch), len(symbols))
             QGEN_Module.display_tasks.remove(task)
 
         @staticmethod
-        def get_var_from_item(debugger, item):
+        def get_current_frame(debugger):
+            """
+            Returns the name of the function of the current debugger frame
+            """
+            frames = debugger.frames()
+            if frames:
+                return frames[0][2]
+            return None
+
+        @staticmethod
+        def get_var_from_item(debugger, item, cur_frame=None):
             """
             Returns the variable name corresponding to the given item
             if possible.
+            :param str cur_frame: the function of the current debugger frame,
+               as returned by get_current_frame. It is computed if None.
             """
             symbols = QGEN_Module.modeling_map.get_symbols(blockid=item.id)
             # The list of symbols to compute from the debugger
             if symbols:
-                frames = debugger.frames()
-                cur_frame = None
+                if cur_frame is None:
+                    cur_frame = QGEN_Module.get_current_frame(debugger)
                 ret = None
-                if frames:
-                    cur_frame = frames[0][2]
 
                 for s in symbols:
                     # Signals can have a symbol that is a function call
@@ -1522,55 +1575,42 @@ else:
                 debugger.send("tree display %s\n" % ss, output=False)
 
         @staticmethod
-        @workflows.run_as_workflow
-        def compute_item_values(debugger, promise, toplevel, item):
-            """
-            Recompute the value for all symbols related to item, and update
-            the display of item to show their values.
-            :param GPS.Debugger debugger: the debugger to query.
-               It can be None when no debugger is running.
-            :param (GPS.Browsers.Item|GPS.Browsers.Link) toplevel: the
-               toplevel item (generally a link)
+        def set_item_value(item, value):
+            """
+            Update the display of item to show value, or hide it if value is
+            None or empty.
+            The displayed value is cached in the item, so that nothing is
+            done when it has not changed since the previous step.
             :param GPS.Browsers.Item item: the item that has an "auto"
                property that indicates its value should be displayed.
+            :return: True if the display of the item has changed
             """
 
-            item_parent = QGEN_Module.get_item_parent_to_display(item)
+            # Check whether the value is a float or is an integer
+            # with more than 6 digits then display it
+            # in scientific notation.
+            # Otherwise no formatting is done on the value
+            if value:
+                try:
+                    if len(value) >= 7 or float(value) != int(value):
+                        value = "%.2e" % float(value)
+                except ValueError:
+                    if len(value) >= 7:
+                        value = "%s .." % value[:6]
 
-            def update_item_value(value):
-                # Skip case when the variable is unknown
-                if value is None or "":
-                    item_parent.hide()
-                else:
-                    # Check whether the value is a float or is an integer
-                    # with more than 6 digits then display it
-                    # in scientific notation.
-                    # Otherwise no formatting is done on the value
-                    try:
-                        if len(value) >= 7 or float(value) != int(value):
-                            value = "%.2e" % float(value)
-                    except ValueError:
-                        if len(value) >= 7:
-                            value = "%s .." % value[:6]
-
-                    if value:
-                        item_parent.show()
-                        item.text = value
-                    else:
-                        item_parent.hide()
-
-            # Find the parent with an id. When item is the label of a link, the
-            # parent will be set to None, so we default to toplevel (the link,
-            # in that case)
-            parent = item.get_parent_with_id() or toplevel
-            logger.log("Computing value from link for %s " % parent.id)
-            ss = QGEN_Module.get_var_from_item(debugger, parent)
-            logger.log("Associating it to variable %s " % str(ss))
-            if ss is not None:
-                async_debugger = AsyncDebugger(debugger)
-                yield async_debugger.async_print_value(ss).then(update_item_value)
+            value = value or None
+            if hasattr(item, "_displayed_value") and item._displayed_value == value:
+                return False
+
+            item._displayed_value = value
+            item_parent = QGEN_Module.get_item_parent_to_display(item)
+            if value:
+                item_parent.show()
+                item.text = value
             else:
+                # Skip case when the variable is unknown
                 item_parent.hide()
+            return True
 
         @staticmethod
         @workflows.run_as_workflow
@@ -245,6 +245,33 @@ class Qgen_Set_Logpoint(gdb.Command):
 Qgen_Set_Logpoint()
 
 
+class Qgen_Print_Values(gdb.Command):
+    """
+    Print the values of several expressions at once, one per line, as
+    "expression<TAB>value". The value is empty if the expression cannot be
+    evaluated in the current frame.
+    """
+
+    marker = "qgen_values"
+
+    def __init__(self):
+        super(Qgen_Print_Values, self).__init__("qgen_print_values", gdb.COMMAND_NONE)
+
+    def invoke(self, args, from_tty):
+        # Args are the expressions to evaluate
+        lines = [self.marker]
+        for symbol in gdb.string_to_argv(args):
+            try:
+                value = str(gdb.parse_and_eval(symbol)).replace("\n", " ")
+            except (gdb.error, RuntimeError):
+                value = ""
+            lines.append("%s\t%s" % (symbol, value))
+        gdb.write("\n".join(lines) + "\n")
+
+
+Qgen_Print_Values()
+
+
 class Watchpoint_Cleaner(gdb.Breakpoint):
     def __init__(self, spec, ty, watchdog):
         super(Watchpoint_Cleaner, self).__init__(spec, ty, internal=True)
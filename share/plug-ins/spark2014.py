@@ -12,6 +12,8 @@ import os.path
 import tool_output
 import json
 import re
+from gi.repository import GLib
+from gs_utils import tool_probes
 from lal_utils import get_enclosing_subprogram
 from functools import reduce
 
@@ -502,6 +504,45 @@ def get_compunit_for_message(text, fn):
     return os.path.splitext(fname)[0]
 
 
+_spark_files = {}
+# For each .spark file: its modification time, size and the extra info it
+# contains, indexed by message id. See `load_spark_file`.
+
+
+def load_spark_file(fn):
+    """Return the extra info found in the JSON file "fn", as a dict
+    mapping message ids to extra info.
+    The json file, if it exists and is a valid JSON value, is a dict
+    with two entries "flow" and "proof" (both entries may be absent).
+    Each entry is mapped to a list of dictionaries. Some of these
+    dictionaries have the field "msg_id", these dictionaries are extra
+    information for the corresponding message.
+    The file is only parsed again when it has been modified.
+    """
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return {}
+
+    cached = _spark_files.get(fn)
+    if cached is not None and cached[0] == (st.st_mtime, st.st_size):
+        return cached[1]
+
+    result = {}
+    with open(fn, "r") as f:
+        try:
+            dict = json.load(f)
+            for kind in ("flow", "proof"):
+                for entry in dict.get(kind, []):
+                    if "msg_id" in entry:
+                        result[entry["msg_id"]] = entry
+        except ValueError:
+            pass
+
+    _spark_files[fn] = ((st.st_mtime, st.st_size), result)
+    return result
+
+
 class GNATprove_Parser(tool_output.OutputParser):
 
     """Class that parses messages of the gnatprove tool, and creates
@@ -513,9 +554,9 @@ class GNATprove_Parser(tool_output.OutputParser):
     The GNATprove parser strips the extra symbol from the message so that
     it's not visible in GPS, and builds up a mapping
       msg -> id
-    Once GNATprove is terminated, for each msg which has an entry in this
-    mapping, the parser opens the JSON file "unit.spark".
-    See the :func:`parsejson()` function for the format of this file.
+    For each msg which has an entry in this mapping, the parser opens the
+    JSON file "unit.spark" the first time the unit is seen.
+    See the :func:`load_spark_file()` function for the format of this file.
     Once this file is parsed, the GNATprove parser now knows the extra
     information associated to a message, if any. See
     :func:`act_on_extra_info()` to know what is done with this extra
@@ -548,10 +589,17 @@ class GNATprove_Parser(tool_output.OutputParser):
 
         gnatprove_plug.output_parser = self
 
-        # holds the unit names for which extra info is retrieved
-        self.units_with_extra_info = []
-        # holds the mapping "msg" -> msg_id
-        self.msg_id = {}
+        # holds the mapping unit -> object directory of its .spark file,
+        # computed the first time it is needed
+        self.unit_dirs = None
+        # holds the artifact directories of the project
+        self.artifact_dirs = []
+        # holds the mapping unit -> object directory for the units whose
+        # extra info has been loaded
+        self.imported_units = {}
+        # holds the messages parsed but not yet added to the Locations view
+        self.pending_messages = []
+        self.flush_id = None
         self.message_re = re.compile(
             r"(?P<filename>^[^: ]+)"
             r":"
@@ -563,7 +611,7 @@ class GNATprove_Parser(tool_output.OutputParser):
         )
         self.extra_re = re.compile(r"(?P<text>.*)" r"\[#(?P<extra>[0-9]+)\]$")
 
-        # holds the mapping "unit,msg_id" -> extra_info
+        # holds the mapping unit -> msg_id -> extra_info
         self.extra_info = {}
         self.has_analysis_messages = False
 
@@ -578,8 +626,7 @@ class GNATprove_Parser(tool_output.OutputParser):
         self.analysis_tool.add_rule("errors", "ERRORS")
 
         # create the SPARK rules from the '--list-categories' switch
-        process = GPS.Process("gnatprove --list-categories")
-        output = process.get_result()
+        output = tool_probes.probe("gnatprove", ["--list-categories"])
         for line in output.split("\n"):
             split_line = line.split(" - ")
             if len(split_line) == 4:
@@ -606,45 +653,6 @@ class GNATprove_Parser(tool_output.OutputParser):
                         lines.append(GPS.FileLocation(GPS.File(sl[0]), int(sl[1]), 1))
         return lines
 
-    def handle_entry(self, unit, list, session_map=None):
-        """code do handle one entry of the JSON file. See :func:`parsejson()`
-        for the details of the format.
-        """
-
-        for entry in list:
-            if "msg_id" in entry:
-                full_id = unit, entry["msg_id"]
-                ent = entry
-                self.extra_info[full_id] = ent
-
-    def parsejson(self, unit, fn):
-        """parse the json file "fn", which belongs to unit "unit" and fill
-        the "extra_info" mapping for any entry.
-        The json file, if it exists and is a valid JSON value, is a dict
-        with two entries "flow" and "proof" (both entries may be absent).
-        Each entry is mapped to a list of dictionaries. Some of these
-        dictionaries have the field "msg_id", these dictionaries are extra
-        information for the corresponding message for the current unit. For
-        those messages, we simply build up a mapping
-          (unit, id) -> extra_info
-        which is later used to act on this extra information for each
-        message.
-        """
-        if os.path.isfile(fn):
-            with open(fn, "r") as f:
-                try:
-                    dict = json.load(f)
-                    session_map = {}
-                    if "session_map" in dict:
-                        session_map = dict["session_map"]
-                        session_map = {int(k): v for k, v in session_map.items()}
-                    if "flow" in dict:
-                        self.handle_entry(unit, dict["flow"])
-                    if "proof" in dict:
-                        self.handle_entry(unit, dict["proof"], session_map)
-                except ValueError:
-                    pass
-
     def get_rule_id(self, output, extra):
         """return the rule ID associated to the output.
         The rule ID is retrieved from "extra" when it exists: otherwise,
@@ -748,6 +756,7 @@ class GNATprove_Parser(tool_output.OutputParser):
         corresponding preference is set."""
 
         self.command = command
+        self.flush_messages()
 
         if GPS.Preference(Display_Analysis_Report).get() and self.has_analysis_messages:
             GPS.Analysis.display_report(self.analysis_tool)
@@ -840,16 +849,11 @@ class GNATprove_Parser(tool_output.OutputParser):
             )
             self.previous_messages_removed = True
 
-        artifact_dirs = [
-            os.path.join(f, obj_subdir_name)
-            for f in GPS.Project.root().object_dirs(recursive=True)
-        ]
-        imported_units = {}  # map from unit to corresponding object directory
-
         lines = text.splitlines()
+        self.print_output("\n".join(line for line in lines if line))
+
         for line in lines:
-            msg_match = re.match(self.message_re, line)
-            self.print_output(line)
+            msg_match = self.message_re.match(line)
 
             if msg_match:
                 text = msg_match.group("text")
@@ -861,19 +865,14 @@ class GNATprove_Parser(tool_output.OutputParser):
                     column = 1
 
                 # Refined the output if extra information
-                extra_match = re.match(self.extra_re, text)
+                extra_match = self.extra_re.match(text)
                 if extra_match:
                     text = extra_match.group("text")
                     extra, unit = self.get_extra_info(
-                        extra_match.group("extra"),
-                        text,
-                        fn,
-                        command,
-                        imported_units,
-                        artifact_dirs,
+                        extra_match.group("extra"), text, fn
                     )
                 else:
-                    extra = {}
+                    extra, unit = {}, None
 
                 if msg_match.group("importance"):
                     importance = self.to_importance(msg_match.group("importance"))
@@ -881,56 +880,115 @@ class GNATprove_Parser(tool_output.OutputParser):
                 else:
                     importance = GPS.Message.Importance.HIGH
 
-                # Add action to the message
-                if extra:
-                    self.has_analysis_messages = True
-                    # Create the message and its secondaries
-                    message = self.split_in_secondary_messages(
-                        fn, lineno, column, text, importance, extra
-                    )
-                    self.act_on_extra_info(
-                        message, extra, imported_units[unit], command
-                    )
-                else:
-                    # Let the "location parser" handle non-spark messages
-                    GPS.Locations.add(
-                        messages_category,
-                        fn,
-                        lineno,
-                        column,
-                        text,
-                        look_for_secondary=True,
-                        importance=importance,
-                    )
+                self.pending_messages.append(
+                    (line, fn, lineno, column, text, importance, extra, unit, command)
+                )
 
-                    # Collect the non-spark output to detect potential
-                    # codefixes later
-                    self.non_spark_output += line + "\n"
+        # Add the messages to the Locations view in batches, once the
+        # output already received has been parsed
+        if self.pending_messages and self.flush_id is None:
+            self.flush_id = GLib.idle_add(self.flush_messages)
 
-    def get_extra_info(self, id, text, fn, command, imported_units, artifact_dirs):
+    def flush_messages(self):
+        """Add the pending messages to the Locations view"""
+        if self.flush_id is not None:
+            GLib.source_remove(self.flush_id)
+            self.flush_id = None
+
+        messages = self.pending_messages
+        self.pending_messages = []
+
+        for (
+            line,
+            fn,
+            lineno,
+            column,
+            text,
+            importance,
+            extra,
+            unit,
+            command,
+        ) in messages:
+            # Add action to the message
+            if extra:
+                self.has_analysis_messages = True
+                # Create the message and its secondaries
+                message = self.split_in_secondary_messages(
+                    fn, lineno, column, text, importance, extra
+                )
+                self.act_on_extra_info(
+                    message,
+                    extra,
+                    self.imported_units.get(unit, GPS.Project.root().artifacts_dir()),
+                    command,
+                )
+            else:
+                # Let the "location parser" handle non-spark messages
+                GPS.Locations.add(
+                    messages_category,
+                    fn,
+                    lineno,
+                    column,
+                    text,
+                    look_for_secondary=True,
+                    importance=importance,
+                )
+
+                # Collect the non-spark output to detect potential
+                # codefixes later
+                self.non_spark_output += line + "\n"
+
+        return False
+
+    def get_unit_dirs(self):
+        """Return the mapping unit -> artifact directory containing its
+        .spark file. The artifact directories are scanned once per run; when
+        several contain a .spark file for the same unit, the first one in the
+        project's object directories is used."""
+        if self.unit_dirs is None:
+            self.unit_dirs = {}
+            self.artifact_dirs = [
+                os.path.join(f, obj_subdir_name)
+                for f in GPS.Project.root().object_dirs(recursive=True)
+            ]
+            for artifact_dir in self.artifact_dirs:
+                try:
+                    entries = os.listdir(artifact_dir)
+                except OSError:
+                    continue
+                for name in entries:
+                    unit, ext = os.path.splitext(name)
+                    if ext == ".spark" and unit not in self.unit_dirs:
+                        self.unit_dirs[unit] = artifact_dir
+        return self.unit_dirs
+
+    def get_extra_info(self, id, text, fn):
         """Parse the .spark file of the corresponding unit to
         get the extra info.
         """
-        extra = {}
         unit = get_compunit_for_message(text, fn)
-        full_id = unit, int(id)
         # First time this unit is seen, identify the corresponding
         # object directory where extra info can be found for that unit.
-        if unit not in imported_units:
-            for artifact_dir in artifact_dirs:
-                sparkfile = os.path.join(artifact_dir, unit + ".spark")
-                if os.path.exists(sparkfile):
-                    self.parsejson(unit, sparkfile)
-                    imported_units[unit] = artifact_dir
-                    break
-        # If no object directory was identified, associate the default
-        # artifacts directory.
-        if unit not in imported_units:
-            imported_units[unit] = GPS.Project.root().artifacts_dir()
-
-        if full_id in self.extra_info:
-            extra = self.extra_info[full_id]
-        return extra, unit
+        if unit not in self.imported_units:
+            artifact_dir = self.get_unit_dirs().get(unit)
+            if artifact_dir is None:
+                # The .spark file might have been written since the
+                # artifact directories were scanned.
+                for d in self.artifact_dirs:
+                    if os.path.exists(os.path.join(d, unit + ".spark")):
+                        artifact_dir = self.unit_dirs[unit] = d
+                        break
+
+            # If no object directory was identified, the default artifacts
+            # directory is used, and the directories are checked again for
+            # the next message of the unit.
+            if artifact_dir is not None:
+                self.extra_info[unit] = load_spark_file(
+                    os.path.join(artifact_dir, unit + ".spark")
+                )
+                self.imported_units[unit] = artifact_dir
+
+        return self.extra_info.get(unit, {}).get(int(id), {}), unit
 
 
 def is_file_context(self):
@@ -3,12 +3,53 @@
 
 import GPS
 import os.path
+import time
 import tool_output
 import gs_utils
+from gi.repository import GLib
 
 
 cross_ref_runtime = GPS.Preference("Project:Cross-References/runtime")
 
+logger = GPS.Logger("XREF")
+
+COMPILATION_DEBOUNCE = 1000
+# Number of milliseconds to wait after a compilation before updating the
+# cross-references, so that a burst of compilations results in a single
+# run of gnatinspect.
+
+XREF_TARGETS = [
+    "Compile File",
+    "Build Main",
+    "Build All",
+    "Make",
+    "Compile All Sources",
+    "Build <current file>",
+    "Custom Build...",
+    "Check Semantic",
+    "Update file XRef",
+    "Update file XRef in background",
+]
+# The build targets after which the cross-references should be updated
+
+
+def get_ali_stamps():
+    """
+    Return the timestamps of the .ali files in the object directories of
+    the loaded projects, indexed by full path.
+    """
+    result = {}
+    for d in GPS.Project.root().object_dirs(recursive=True):
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.name.endswith(".ali"):
+                        st = entry.stat()
+                        result[entry.path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+    return result
+
 
 def runtime_switch():
     """
@@ -106,6 +147,17 @@ class Sqlite_Cross_References(object):
         self.gnatinspect_launch_registered = False
         self.gnatinspect_already_running = False
 
+        # The timestamps of the .ali files seen by the last run of
+        # gnatinspect, or None if a full update is needed.
+        self.ali_stamps = None
+
+        # The pending update after a compilation, see COMPILATION_DEBOUNCE
+        self.compilation_timeout = None
+
+        # The reason for and start time of the running gnatinspect
+        self.reason = ""
+        self.start_time = 0
+
         # Initialize self.trusted_mode and other preferences
         self.on_preferences_changed(None)
 
@@ -117,17 +169,31 @@ class Sqlite_Cross_References(object):
     def gnatinspect_completed(self):
         """Call this when gnatinspect completed working."""
         self.gnatinspect_already_running = False
+        logger.log(
+            "xref refresh (%s) took %.3fs"
+            % (self.reason, time.time() - self.start_time)
+        )
 
         if self.gnatinspect_launch_registered:
             # Aha, someone had requested a launch of gnatinspect while
-            # this one was running. Launch this now.
+            # this one was running. Launch this now: a full update was
+            # requested if self.ali_stamps was reset meanwhile.
             self.gnatinspect_launch_registered = False
-            self.recompute_xref()
+            self.recompute_xref(only_if_changed=True)
 
-    def recompute_xref(self, force=False, quiet=True):
+    def recompute_xref(self, force=False, quiet=True, only_if_changed=False):
         """Launch recompilation of the cross references.
         if Force is True, run regardless of a running gnatinspect
-        (this flag is used to protect against reentry)"""
+        (this flag is used to protect against reentry).
+        If only_if_changed is True, gnatinspect is not run when no .ali
+        file was written since its last run."""
+
+        self.cancel_compilation_update()
+
+        if not only_if_changed:
+            # Forget the .ali files seen so far, so that a full update is
+            # also done for a delayed launch.
+            self.ali_stamps = None
 
         if self.gnatinspect_already_running:
             # We are already running gnatinspect. If someone registers
@@ -144,9 +210,39 @@ class Sqlite_Cross_References(object):
         if not os.path.exists(GPS.Project.root().file().path):
             return
 
+        # Only look at the .ali files when the build is done locally:
+        # otherwise they might not be visible yet.
+        start = time.time()
+        previous = self.ali_stamps
+        self.ali_stamps = None
+        if GPS.is_server_local("Build_Server"):
+            self.ali_stamps = get_ali_stamps()
+
+        if previous is None or self.ali_stamps is None:
+            self.reason = "full"
+        else:
+            changed = sum(
+                1
+                for ali, stamp in self.ali_stamps.items()
+                if previous.get(ali) != stamp
+            )
+            removed = sum(1 for ali in previous if ali not in self.ali_stamps)
+            if changed == 0 and removed == 0:
+                logger.log(
+                    "no .ali file changed, xref refresh skipped (%.3fs)"
+                    % (time.time() - start,)
+                )
+                return
+            self.reason = "%d .ali files changed, %d removed" % (changed, removed)
+
+        logger.log(
+            "xref refresh (%s) prepared in %.3fs" % (self.reason, time.time() - start)
+        )
+
         # We are about to launch gnatinspect
         self.gnatinspect_launch_registered = False
         self.gnatinspect_already_running = True
+        self.start_time = time.time()
         target = GPS.BuildTarget("Load Xref Info")
 
         # This might fail if we have spaces in the name of the directory, but
@@ -162,20 +258,26 @@ class Sqlite_Cross_References(object):
             extra_args=extra_args,
         )
 
+    def cancel_compilation_update(self):
+        """Cancel the update scheduled after a compilation, if any"""
+        if self.compilation_timeout is not None:
+            GLib.source_remove(self.compilation_timeout)
+            self.compilation_timeout = None
+
+    def on_compilation_timeout(self):
+        self.compilation_timeout = None
+        self.recompute_xref(only_if_changed=True)
+        return False
+
     def on_compilation_finished(self, hook, category, target_name="", *args):
-        if target_name in [
-            "Compile File",
-            "Build Main",
-            "Build All",
-            "Make",
-            "Compile All Sources",
-            "Build <current file>",
-            "Custom Build...",
-            "Check Semantic",
-            "Update file XRef",
-            "Update file XRef in background",
-        ] or category in ["Makefile", "CodePeer"]:
-            self.recompute_xref()
+        if target_name in XREF_TARGETS or category in ["Makefile", "CodePeer"]:
+            if GPS.Logger("TESTSUITE").active:
+                self.recompute_xref(only_if_changed=True)
+            else:
+                self.cancel_compilation_update()
+                self.compilation_timeout = GLib.timeout_add(
+                    COMPILATION_DEBOUNCE, self.on_compilation_timeout
+                )
 
     def on_project_view_changed(self, hook):
         self.recompute_xref()
@@ -195,7 +297,10 @@ class GnatInspect_OnExit_Hook(tool_output.OutputParser):
 
     def on_exit(self, status, command):
         if status != 0:
-            GPS.Logger("XREF").log("gnatinspect returned with status %s" % status)
+            logger.log("gnatinspect returned with status %s" % status)
+            # The database might not be up-to-date for the .ali files
+            # seen by this run: do a full update next time.
+            r.ali_stamps = None
 
         r.gnatinspect_completed()
 
@@ -20,22 +20,164 @@ Note that GPS calls gcov so that the .gcov files are generated
 import GPS
 import os
 import re
+import time
 from gs_utils import interactive
 from GPS import MDI, Project, Process, CodeAnalysis
 
-# A class to display the output of gcov in a separate console.
+logger = GPS.Logger("GCOV")
 
+JOBS_PREF = "Plugins/gcov/jobs"
 
-class Gcov_Process(GPS.Console, GPS.Process):
+GPS.Preference(JOBS_PREF).create(
+    "Number of gcov processes",
+    "integer",
+    """Number of gcov processes run at the same time to compute the \
+coverage files. The .gcda files are split between the processes by object \
+directory. 0 means one process per CPU.""",
+    1,
+    0,
+    256,
+)
+
+COVERAGE_EXTENSIONS = (".gcda", ".gcno", ".gcov")
+
+
+def index_object_dirs(object_dirs):
+    """
+    Scan each of the object directories once, and index the coverage files
+    they contain.
+
+    :param List(str) object_dirs: the directories to scan, by order of
+       precedence.
+    :return: for each extension in COVERAGE_EXTENSIONS, a dict mapping the
+       unit names to the path of the file in the first object directory
+       that contains one.
+    """
+    index = {ext: {} for ext in COVERAGE_EXTENSIONS}
+
+    for object_dir in object_dirs:
+        try:
+            entries = os.scandir(object_dir)
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                unit, ext = os.path.splitext(entry.name)
+                files = index.get(ext)
+                if files is not None and unit not in files:
+                    files[unit] = object_dir + os.sep + entry.name
+
+    return index
+
+
+def shard_gcda_files(gcda_files, jobs):
+    """
+    Split the list of .gcda files in shards that can be processed by
+    concurrent gcov processes.
+
+    :param List(str) gcda_files: the .gcda files to process.
+    :param int jobs: the number of gcov processes that can run at the same
+       time.
+    :return: a list of lists of .gcda files: one per object directory, or
+       `jobs` chunks of similar sizes when there are not enough object
+       directories to keep all processes busy.
+    """
+    if jobs <= 1 or len(gcda_files) <= 1:
+        return [gcda_files]
+
+    by_dir = {}
+    for gcda in gcda_files:
+        by_dir.setdefault(os.path.dirname(gcda), []).append(gcda)
+
+    if len(by_dir) >= jobs:
+        return list(by_dir.values())
+
+    size = -(-len(gcda_files) // jobs)  # rounded up
+    return [gcda_files[idx : idx + size] for idx in range(0, len(gcda_files), size)]
+
+
+def merge_shard_outputs(shard_dirs, directory):
+    """
+    Move the .gcov files generated by concurrent gcov processes to
+    directory, and remove the directories they were generated in.
+
+    Each process runs in its own directory, since sources shared by several
+    units (specs, generics...) result in .gcov files with the same name.
+    As when a single gcov process handles all the .gcda files, the file
+    generated last, here by the last shard, is kept.
+
+    :param List(str) shard_dirs: the directories of the processes, in the
+       order of the shards.
+    :param str directory: where the .gcov files should be moved.
+    """
+    for shard_dir in shard_dirs:
+        try:
+            entries = os.scandir(shard_dir)
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(".gcov"):
+                    os.replace(entry.path, os.path.join(directory, entry.name))
+
+        try:
+            os.rmdir(shard_dir)
+        except OSError as e:
+            logger.log("could not remove %s: %s" % (shard_dir, e))
+
+
+# A class to run one gcov process, with its output in a Gcov_Console
+
+
+class Gcov_Process(GPS.Process):
     def on_output(self, unmatched, matched):
-        self.write(unmatched + matched)
+        self.console.write(unmatched + matched)
 
     def on_exit(self, status, remaining_output):
+        self.console.on_process_exit(self, status, remaining_output)
+
+    def __init__(self, console, process, args="", directory=""):
+        GPS.Process.__init__(
+            self,
+            process + " " + args,
+            ".+",
+            remote_server="Build_Server",
+            directory=directory,
+            on_exit=Gcov_Process.on_exit,
+            on_match=Gcov_Process.on_output,
+        )
+        self.console = console
+
+
+# A class to display the output of the gcov processes in a separate console.
+# At most `jobs` processes run at the same time, and the coverage data is
+# loaded when all of them have terminated.
+
+
+class Gcov_Console(GPS.Console):
+    def on_process_exit(self, process, status, remaining_output):
         self.write(remaining_output)
-        if status == 0:
+        self.running.remove(process)
+        if status != 0:
+            self.status = status
+
+        if self.pending:
+            self.start_next()
+        elif not self.running:
+            self.on_all_exit()
+
+    def on_all_exit(self):
+        if self.status == 0:
             self.write("process terminated successfully")
         else:
-            self.write("process terminated [" + str(status) + "]")
+            self.write("process terminated [" + str(self.status) + "]")
+
+        if self.shard_dirs:
+            merge_shard_outputs(self.shard_dirs, self.directory)
+
+        logger.log("gcov terminated in %.3fs" % (time.time() - self.start,))
 
         # Show coverage report
         analysis = CodeAnalysis.get("Coverage")
@@ -48,33 +190,50 @@ class Gcov_Process(GPS.Console, GPS.Process):
 
         analysis.show_analysis_report()
 
+    def start_next(self):
+        input_file, directory = self.pending.pop(0)
+        self.running.append(
+            Gcov_Process(self, "gcov", "@%s" % input_file, directory=directory)
+        )
+
     def on_input(self, input):
-        self.send(input)
+        for p in self.running:
+            p.send(input)
 
     def on_destroy(self):
-        try:
-            self.kill()
-        except GPS.Exception:
-            pass
-
-    def __init__(self, process, args="", directory=""):
+        self.pending = []
+        for p in list(self.running):
+            try:
+                p.kill()
+            except GPS.Exception:
+                pass
+
+    def __init__(self, input_files, jobs, directory="", shard_dirs=[]):
+        """
+        :param List(str) input_files: the response files, one per process.
+        :param int jobs: the number of processes run at the same time.
+        :param str directory: where the .gcov files should be generated.
+        :param List(str) shard_dirs: if not empty, the directory in which
+           each process runs, see `merge_shard_outputs`.
+        """
         GPS.Console.__init__(
             self,
             "Executing gcov",
-            on_input=Gcov_Process.on_input,
-            on_destroy=Gcov_Process.on_destroy,
+            on_input=Gcov_Console.on_input,
+            on_destroy=Gcov_Console.on_destroy,
             force=True,
         )
-
-        GPS.Process.__init__(
-            self,
-            process + " " + args,
-            ".+",
-            remote_server="Build_Server",
-            directory=directory,
-            on_exit=Gcov_Process.on_exit,
-            on_match=Gcov_Process.on_output,
+        self.pending = list(
+            zip(input_files, shard_dirs or [directory] * len(input_files))
         )
+        self.running = []
+        self.status = 0
+        self.directory = directory
+        self.shard_dirs = shard_dirs
+        self.start = time.time()
+
+        for _ in range(min(jobs, len(self.pending))):
+            self.start_next()
 
 
 def using_gcov(context):
@@ -151,51 +310,67 @@ on which you have permission to read and write.
          """
         )
 
-    input_file = os.path.abspath(os.path.join(gcov_dir, "gcov_input.txt"))
-
     # List all the projects
     projects = root_project.dependencies(True)
     # List all object dirs
     object_dirs = root_project.object_dirs(True)
 
-    # Write the response file
-    res = open(input_file, "w")
-
-    gcda_file_found = False
+    start = time.time()
+    index = index_object_dirs(object_dirs)
+    gcda_files = index[".gcda"]
+    gcno_files = index[".gcno"]
     gcno_file_found = False
 
-    for p in projects:
-        sources = p.sources(False)
+    # Compute the response files
+    lines = []
+    nb_sources = 0
 
-        for s in sources:
+    for p in projects:
+        for s in p.sources(False):
+            nb_sources += 1
             n = s.path
             basename = n[max(n.rfind("\\"), n.rfind("/")) + 1 : len(n)]
             unit = basename[0 : basename.rfind(".")]
 
-            for object_dir in object_dirs:
-                gcda = object_dir + os.sep + unit + ".gcda"
-
-                # If we have not yet found at least one .gcno file, attempt to
-                # find one. This is to improve the precision of error messages,
-                # and detect the case where compilation was successful but the
-                # executable has never been run.
+            # Look for at least one .gcno file. This is to improve the
+            # precision of error messages, and detect the case where
+            # compilation was successful but the executable has never been
+            # run.
+            if not gcno_file_found:
+                gcno_file_found = unit in gcno_files
 
-                if not gcno_file_found:
-                    gcno = object_dir + os.sep + unit + ".gcno"
-                    if os.access(gcno, os.F_OK):
-                        gcno_file_found = True
+            gcda = gcda_files.get(unit)
+            if gcda is not None:
+                lines.append(gcda)
 
-                if os.access(gcda, os.F_OK):
-                    gcda_file_found = True
-                    # Write one entry in response file
+    gcda_file_found = bool(lines)
 
-                    # Escape all backslashes.
-                    gcda = gcda.replace("\\", "\\\\")
+    jobs = GPS.Preference(JOBS_PREF).get() or os.cpu_count() or 1
+    shards = shard_gcda_files(lines, jobs)
+    input_files = []
+    shard_dirs = []
 
-                    res.write('"' + gcda + '"' + "\n")
-                    break
+    for idx, shard in enumerate(shards):
+        if len(shards) == 1:
+            name = "gcov_input.txt"
+        else:
+            name = "gcov_input_%d.txt" % (idx + 1,)
+            shard_dir = os.path.join(gcov_dir, "gcov_%d" % (idx + 1,))
+            os.makedirs(shard_dir, exist_ok=True)
+            shard_dirs.append(shard_dir)
+        input_file = os.path.abspath(os.path.join(gcov_dir, name))
+        input_files.append(input_file)
+
+        # Write one entry per file in response file, escaping all backslashes
+        with open(input_file, "w") as res:
+            res.writelines(
+                '"' + gcda.replace("\\", "\\\\") + '"' + "\n" for gcda in shard
+            )
 
-    res.close()
+    logger.log(
+        "%d response files for %d sources and %d object dirs written in %.3fs"
+        % (len(input_files), nb_sources, len(object_dirs), time.time() - start)
+    )
 
     if not gcno_file_found:
         # No gcno file was found: display an appropriate message.
@@ -218,7 +393,7 @@ Make sure you have run the executable(s) at least once.
 
         else:
             # Run gcov
-            Gcov_Process("gcov", "@%s" % input_file, directory=gcov_dir)
+            Gcov_Console(input_files, jobs, directory=gcov_dir, shard_dirs=shard_dirs)
 
 
 @interactive(name="gcov remove coverage files", filter=using_gcov)
@@ -232,14 +407,17 @@ def remove_gcov():
 
     # Look in all the projects
 
+    start = time.time()
+
     for p in Project.root().dependencies(True):
         object_dirs = p.object_dirs(False)
 
         if len(object_dirs) > 0:
-            object_dir = object_dirs[0]
+            index = index_object_dirs(object_dirs[0:1])
+
+            # Remove the .gcda and .gcov files of the object dir
+            for ext in (".gcda", ".gcov"):
+                for f in index[ext].values():
+                    os.remove(f)
 
-            # Browse in the object dirs
-            for f in os.listdir(object_dir):
-                #  if f is a .gcda or a .gcov, remove it
-                if f.find(".gcda") != -1 or f.find(".gcov") != -1:
-                    os.remove(object_dir + os.sep + f)
+    logger.log("coverage files removed in %.3fs" % (time.time() - start,))
@@ -15,6 +15,7 @@ import traceback
 import os_utils
 import gnat_switches
 import gs_utils
+from gs_utils import tool_probes
 from gs_utils.switches import Check, Spin
 from xml.sax.saxutils import escape
 
@@ -461,13 +462,18 @@ class gnatMakeProc:
             # The behavior is then to try getting a valid gnat make command
             # from the local machine, and fallback to the default switches if
             # not found.
-            process = GPS.Process(
-                '"""' + gnatCmd + '""" ' + args,
-                "^.+\r?$",
-                on_match=self.__add_switch_callback,
-                remote_server="Build_Server",
+            output = tool_probes.probe(
+                gnatCmd, args.split(), remote_server="Build_Server"
             )
-            process.get_result()
+
+            # Feed the lines of the output to the parser, as they would be
+            # matched by "^.+\r?$"
+            unmatched = ""
+            for line in output.split("\n"):
+                if line:
+                    self.__add_switch_callback(None, line, unmatched)
+                    unmatched = ""
+                unmatched += "\n"
         return True
 
 
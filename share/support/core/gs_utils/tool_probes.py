@@ -0,0 +1,129 @@
+"""
+A cache for the output of the commands run only to learn about a tool: its
+version, its categories of messages, its switches...
+
+The output of these commands is kept in memory and in GNAT Studio's home
+directory, indexed by the full path of the executable, its modification
+time and the arguments. Starting GNAT Studio or evaluating a filter does
+not need to spawn the tool again as long as it has not been replaced.
+The first time a cached output is used in a session, the command is run
+again in the background to update the cache if needed.
+"""
+
+import GPS
+import json
+import os
+import os_utils
+
+CACHE_FILE_NAME = "tool_probes.json"
+# Name of the file, in the home directory, where the cache is saved
+
+logger = GPS.Logger("GS_UTILS.TOOL_PROBES")
+
+_cache = None
+# For each key (see `_key`), the output of the command
+
+_checked = set()
+# The keys whose output has been computed or checked in this session
+
+
+def _cache_file():
+    return os.path.join(GPS.get_home_dir(), CACHE_FILE_NAME)
+
+
+def _get_cache():
+    """Return the cache, loading it from disk the first time"""
+    global _cache
+    if _cache is None:
+        try:
+            with open(_cache_file()) as f:
+                _cache = json.load(f)
+        except (IOError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache():
+    """Save the cache on disk"""
+    try:
+        with open(_cache_file() + ".tmp", "w") as f:
+            json.dump(_cache, f)
+        os.replace(_cache_file() + ".tmp", _cache_file())
+    except (IOError, OSError) as e:
+        logger.log("could not save %s: %s" % (_cache_file(), e))
+
+
+def _key(exe, args):
+    """
+    Return the key of the cache for the given command, or None if the
+    executable cannot be found.
+    """
+    path = exe if os.path.isfile(exe) else os_utils.locate_exec_on_path(exe)
+    if not path:
+        return None
+
+    path = os.path.realpath(path)
+    return json.dumps([path, os.stat(path).st_mtime, list(args)])
+
+
+def _check_in_background(key, command):
+    """
+    Run command in the background, and update the cache if its output is
+    not the one cached for key.
+    """
+    output = []
+
+    def on_match(process, matched, unmatched):
+        output.append(unmatched + matched)
+
+    def on_exit(process, status, remaining_output):
+        output.append(remaining_output)
+        text = "".join(output)
+        if status == 0 and _get_cache().get(key) != text:
+            logger.log("output changed for %s" % (key,))
+            _get_cache()[key] = text
+            _save_cache()
+
+    GPS.Process(
+        command,
+        regexp=".+",
+        single_line_regexp=True,
+        on_match=on_match,
+        on_exit=on_exit,
+        task_manager=False,
+        block_exit=False,
+    )
+
+
+def probe(exe, args, remote_server=""):
+    """
+    Return the output of the command `exe args`, as returned by
+    :func:`GPS.Process.get_result`.
+
+    :param str exe: the name or path of the executable.
+    :param List(str) args: the arguments of the command.
+    :param str remote_server: the server the command should run on. The
+       output is only cached when this server is the local host.
+    """
+    command = [exe] + list(args)
+    key = None
+    if not remote_server or GPS.is_server_local(remote_server):
+        key = _key(exe, args)
+
+    if key is None:
+        return GPS.Process(command, remote_server=remote_server).get_result()
+
+    cache = _get_cache()
+    output = cache.get(key)
+
+    if output is None:
+        output = GPS.Process(command).get_result()
+        cache[key] = output
+        _checked.add(key)
+        _save_cache()
+
+    elif key not in _checked:
+        _checked.add(key)
+        _check_in_background(key, command)
+
+    return output
@@ -2,6 +2,7 @@
 """
 
 import GPS
+import bisect
 import os
 import libadalang
 from modules import Module
@@ -14,6 +15,39 @@ COL_START_LINE = 2
 COL_START_COLUMN = 3
 COL_END_LINE = 4
 COL_END_COLUMN = 5
+COL_KIND = 6
+
+PLACEHOLDER_LINE = -1
+# The start line of the placeholder rows, added to the rows whose children
+# have not been created yet, so that they can be expanded
+
+FULL_MODE_EXPANDED_ROWS = 1000
+# In full mode, the number of rows created and expanded when the view is
+# refreshed. The others are created when their parent is expanded.
+
+REFRESH_DELAY = 300
+# The delay, in milliseconds, between an edit and the refresh of the view
+
+
+def sloc_key(sloc):
+    return (sloc.line, sloc.column)
+
+
+def get_lines_diff(old, new):
+    """
+    Compare two lists of lines.
+    :return: (first, last, delta), where first .. last are the lines of
+       old that were modified, and delta is the number of lines added after
+       them.
+    """
+    max_common = min(len(old), len(new))
+    prefix = 0
+    while prefix < max_common and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < max_common - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return prefix + 1, len(old) - suffix, len(new) - len(old)
 
 
 class LAL_View_Widget:
@@ -35,7 +69,7 @@ class LAL_View_Widget:
         self.message_label.set_ellipsize(Pango.EllipsizeMode.END)
 
         # The model: see COL_* constants above
-        self.store = Gtk.TreeStore(str, Gdk.RGBA, int, int, int, int)
+        self.store = Gtk.TreeStore(str, Gdk.RGBA, int, int, int, int, str)
 
         # Initialize the tree view
         self.view = Gtk.TreeView(self.store)
@@ -47,6 +81,7 @@ class LAL_View_Widget:
         self.node_col.add_attribute(cell, "foreground-rgba", COL_FOREGROUND)
         self.view.append_column(self.node_col)
         self.view.connect("button_press_event", self._on_view_button_press)
+        self.view.connect("test-expand-row", self._on_test_expand_row)
 
         full_mode_toggle = Gtk.CheckButton("full tree (slow)")
         full_mode_toggle.set_name("lal_view full toggle")
@@ -76,10 +111,18 @@ class LAL_View_Widget:
         self.column = 1
         self.unit = None  # The current successfully loaded AU, if any
         self.token = None  # The current token, if any
+        self.lines = []  # The lines of the buffer when self.unit was loaded
+
+        # For each node of self.unit already visited, a tuple
+        # (children, start slocs, end slocs), sorted by start sloc
+        self.children_index = {}
 
         # The list of iters that are currently highlighted
         self.highlighted_iters = []
 
+        # The pending refresh after an edit, if any
+        self.refresh_source = None
+
         # The colors to highlight the tree with
         self.default_fg = Gdk.RGBA()
         self.highlight_fg = Gdk.RGBA()
@@ -161,77 +204,155 @@ class LAL_View_Widget:
         if prev != (self.default_fg, self.highlight_fg):
             self.show_current_location(self.line, self.column)
 
-    def _add_node(self, parent, node):
-        """Add a node as child of parent. parent can be None"""
-        if not node:
-            return
-
-        start_line = node.sloc_range.start.line
-        start_column = node.sloc_range.start.column
-        end_line = node.sloc_range.end.line
-        end_column = node.sloc_range.end.column
-
-        if not self.compact_mode or (
-            (start_line, start_column)
-            <= (self.line, self.column)
-            <= (end_line, end_column)
-        ):
-            it = self.store.append(parent)
-            text = "<b>{}</b>{}".format(
-                # Uncomment this for a representation useful for debug:
-                # GLib.markup_escape_text(repr(node)),
-                node.kind_name,
-                " {}".format(GLib.markup_escape_text(node.text))
-                if start_line == end_line
-                else "",
+    def _children(self, node):
+        """
+        Return the children of node, with their start and end slocs
+        """
+        result = self.children_index.get(node)
+        if result is None:
+            children = [c for c in node.children if c is not None]
+            result = (
+                children,
+                [sloc_key(c.sloc_range.start) for c in children],
+                [sloc_key(c.sloc_range.end) for c in children],
             )
+            self.children_index[node] = result
+        return result
+
+    def _label_for(self, node):
+        """Return the label of the row for node"""
+        return "<b>{}</b>{}".format(
+            # Uncomment this for a representation useful for debug:
+            # GLib.markup_escape_text(repr(node)),
+            node.kind_name,
+            " {}".format(GLib.markup_escape_text(node.text))
+            if node.sloc_range.start.line == node.sloc_range.end.line
+            else "",
+        )
 
-            self.store[it] = [
-                text,
-                self.default_fg,
-                start_line,
-                start_column,
-                end_line,
-                end_column,
-            ]
+    def _row_for(self, node):
+        """Return the contents of the row for node"""
+        return [
+            self._label_for(node),
+            self.default_fg,
+            node.sloc_range.start.line,
+            node.sloc_range.start.column,
+            node.sloc_range.end.line,
+            node.sloc_range.end.column,
+            node.kind_name,
+        ]
+
+    def _insert_node(self, parent, sibling, node):
+        """
+        Add a row for node as child of parent, before sibling. parent and
+        sibling can be None. The row for the children of node is only
+        created when it is expanded.
+        """
+        it = self.store.insert_before(parent, sibling, self._row_for(node))
+        if self._children(node)[0]:
+            self.store.append(it, ["", self.default_fg, PLACEHOLDER_LINE, 0, 0, 0, ""])
+        return it
+
+    def _node_at(self, path):
+        """Return the node displayed at path, in full mode"""
+        node = self.unit.root
+        for index in path.get_indices()[1:]:
+            node = self._children(node)[0][index]
+        return node
+
+    def _fill(self, it):
+        """Create the rows for the children of it, if not done yet"""
+        child = self.store.iter_children(it)
+        if child is None or self.store[child][COL_START_LINE] != PLACEHOLDER_LINE:
+            return
 
-            for n in node.children:
-                self._add_node(it, n)
+        self.store.remove(child)
+        for node in self._children(self._node_at(self.store.get_path(it)))[0]:
+            self._insert_node(it, None, node)
 
-    def _traverse_and_highlight(self, it, line, column):
-        """Traverse the subtree starting at iter it, and highlight the
-        nodes that encompass the location at line/column.
+    def _on_test_expand_row(self, view, it, path):
+        """Create the children of a row when it is expanded"""
+        if self.unit:
+            self._fill(it)
+        return False
 
-        Return the deepest iter found that matches.
+    def _expand_first_rows(self):
         """
-        lowest_found = None
-        child = self.store.iter_children(it)
-        while child:
-            row = self.store[child]
-
-            if row[COL_START_LINE] > line:
-                # We are past the point where the nodes will match the
-                # location: we can stop traversing.
-                return lowest_found
-
-            if (
-                (row[COL_START_LINE], row[COL_START_COLUMN])
-                <= (line, column)
-                <= (row[COL_END_LINE], row[COL_END_COLUMN])
-            ):
-                # This node encompasses the location: highlight it...
-                lowest_found = child
-                self.highlighted_iters.append(child)
-                row[COL_FOREGROUND] = self.highlight_fg
-
-                # ... and look below it for more
-                below = self._traverse_and_highlight(child, line, column)
-                if below:
-                    lowest_found = below
+        In full mode, expand the rows in breadth-first order, until
+        FULL_MODE_EXPANDED_ROWS have been created
+        """
+        count = 0
+        queue = [self.store.get_iter_first()]
+        while queue and count < FULL_MODE_EXPANDED_ROWS:
+            it = queue.pop(0)
+            if it is None or not self.store.iter_has_child(it):
+                continue
+            self.view.expand_row(self.store.get_path(it), False)
+            child = self.store.iter_children(it)
+            while child:
+                count += 1
+                queue.append(child)
+                child = self.store.iter_next(child)
+
+    def _lookup(self, line, column):
+        """
+        Return the nodes that encompass the location at line/column, from
+        the root to the deepest one, and the index of each of them among
+        the children of its parent.
+        """
+        loc = (line, column)
+        node = self.unit.root
+        if not (
+            sloc_key(node.sloc_range.start) <= loc <= sloc_key(node.sloc_range.end)
+        ):
+            return [], []
+
+        nodes = [node]
+        indices = [0]
+        while True:
+            children, starts, ends = self._children(node)
+            i = bisect.bisect_right(starts, loc) - 1
+            found = None
+            for j in (i, i - 1):
+                if j >= 0 and starts[j] <= loc <= ends[j]:
+                    found = j
+                    break
+
+            if found is None:
+                return nodes, indices
+
+            node = children[found]
+            nodes.append(node)
+            indices.append(found)
+
+    def _clear_highlighting(self):
+        for j in self.highlighted_iters:
+            self.store[j][COL_FOREGROUND] = self.default_fg
+        self.highlighted_iters = []
 
-            child = self.store.iter_next(child)
+    def _show_path(self, nodes):
+        """
+        In compact mode, show the nodes as a single path, reusing the rows
+        already displayed for the beginning of this path
+        """
+        parent = None
+        it = self.store.get_iter_first()
+        for index, node in enumerate(nodes):
+            if it is not None and self._same_node(it, node, 0):
+                parent = it
+                it = self.store.iter_children(it)
+                continue
+
+            if it is not None:
+                self.store.remove(it)
+            for n in nodes[index:]:
+                parent = self.store.append(parent, self._row_for(n))
+            break
+        else:
+            if it is not None:
+                self.store.remove(it)
 
-        return lowest_found
+        self.view.expand_all()
 
     def show_current_location(self, line, column):
         """Highlight the given location in the tree and scroll to it"""
@@ -242,23 +363,29 @@ class LAL_View_Widget:
         self.line = line
         self.column = column
 
+        nodes, indices = self._lookup(line, column)
+
         if self.compact_mode:
-            self.store.clear()
-            self._add_node(None, self.unit.root)
-            self.view.expand_all()
+            self._show_path(nodes)
         else:
             # Clear all previous highlighting
-            for j in self.highlighted_iters:
-                self.store[j][COL_FOREGROUND] = self.default_fg
-            self.highlighted_iters = []
-
-            lowest_found = self._traverse_and_highlight(None, line, column)
+            self._clear_highlighting()
+
+            lowest_found = None
+            for depth in range(len(indices)):
+                if lowest_found is not None:
+                    self._fill(lowest_found)
+                lowest_found = self.store.get_iter(
+                    Gtk.TreePath.new_from_indices(indices[: depth + 1])
+                )
+                self.highlighted_iters.append(lowest_found)
+                self.store[lowest_found][COL_FOREGROUND] = self.highlight_fg
 
             # If we have finished iterating, scroll to the lowest found
             if lowest_found:
-                self.view.scroll_to_cell(
-                    self.store.get_path(lowest_found), self.node_col, True, 0.5, 0.5
-                )
+                path = self.store.get_path(lowest_found)
+                self.view.expand_to_path(path)
+                self.view.scroll_to_cell(path, self.node_col, True, 0.5, 0.5)
 
         # Display the current token in the label
         self.token = self.unit.lookup_token(libadalang.Sloc(line, column))
@@ -271,22 +398,12 @@ class LAL_View_Widget:
         else:
             self.message_label.set_text("")
 
-    def refresh(self):
-        """Refresh the contents of the view"""
-        buf = GPS.EditorBuffer.get(open=False)
-
-        if not buf:
-            return
-
-        self.view.set_model(None)
-        self.store.clear()
-        self.highlighted_iters = []
-
-        self.file = buf.file()
-        if not self.file.language().lower() == "ada":
-            return
-
-        self.store.clear()
+    def _load_unit(self, buf):
+        """
+        Load the analysis unit of buf.
+        Return False if this is not possible.
+        """
+        self.children_index = {}
         unit = buf.get_analysis_unit()
 
         if not unit.root:
@@ -300,23 +417,179 @@ class LAL_View_Widget:
                 )
 
             self.unit = None
-            return
+            return False
         else:
             self.unit = unit
+            # Libadalang only counts newlines as line breaks, unlike
+            # str.splitlines which also splits on form feeds
+            self.lines = buf.get_chars().split("\n")
             self.message_label.set_text(
                 "{} loaded ok".format(os.path.basename(buf.file().name()))
             )
+            return True
+
+    def refresh(self):
+        """Refresh the contents of the view"""
+        buf = GPS.EditorBuffer.get(open=False)
+
+        if not buf:
+            return
+
+        self.view.set_model(None)
+        self.store.clear()
+        self.highlighted_iters = []
+
+        self.file = buf.file()
+        if not self.file.language().lower() == "ada":
+            return
+
+        if not self._load_unit(buf):
+            return
 
         if self.compact_mode:
             # In compact mode, the view is regenerated when we change
             # locations
             pass
         else:
-            # In full mode, display the whole tree now
-            self._add_node(None, unit.root)
+            # In full mode, display the top of the tree now, the other
+            # rows are created when expanded
+            self._insert_node(None, None, self.unit.root)
 
         self.view.set_model(self.store)
-        self.view.expand_all()
+        if self.compact_mode:
+            self.view.expand_all()
+        else:
+            self._expand_first_rows()
+
+    def _same_node(self, it, node, delta):
+        """
+        Whether the row at it displays node, once its lines are moved by
+        delta
+        """
+        row = self.store[it]
+        return (
+            row[COL_KIND] == node.kind_name
+            and (row[COL_START_LINE] + delta, row[COL_START_COLUMN])
+            == sloc_key(node.sloc_range.start)
+            and (row[COL_END_LINE] + delta, row[COL_END_COLUMN])
+            == sloc_key(node.sloc_range.end)
+            and row[COL_LABEL] == self._label_for(node)
+        )
+
+    def _shift_rows(self, it, delta):
+        """Move the lines of the row at it and its children by delta"""
+        row = self.store[it]
+        if row[COL_START_LINE] != PLACEHOLDER_LINE:
+            row[COL_START_LINE] += delta
+            row[COL_END_LINE] += delta
+            child = self.store.iter_children(it)
+            while child:
+                self._shift_rows(child, delta)
+                child = self.store.iter_next(child)
+
+    def _update_row(self, it, node, first, last, delta):
+        """
+        Update the row at it, which displays node, and its children, after
+        the lines first .. last were modified and delta lines were added.
+        Only the children that intersect the modified lines are created
+        again.
+        """
+        self.store[it] = self._row_for(node)
+        children = self._children(node)[0]
+
+        rows = []
+        child = self.store.iter_children(it)
+        while child:
+            rows.append(child)
+            child = self.store.iter_next(child)
+
+        if not rows or self.store[rows[0]][COL_START_LINE] == PLACEHOLDER_LINE:
+            # The children were not created yet
+            for r in rows:
+                self.store.remove(r)
+            if children:
+                self.store.append(
+                    it, ["", self.default_fg, PLACEHOLDER_LINE, 0, 0, 0, ""]
+                )
+            return
+
+        # The children before and after the modified lines are the same
+        max_common = min(len(rows), len(children))
+        prefix = 0
+        while (
+            prefix < max_common
+            and self.store[rows[prefix]][COL_END_LINE] < first
+            and self._same_node(rows[prefix], children[prefix], 0)
+        ):
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < max_common - prefix
+            and self.store[rows[-1 - suffix]][COL_START_LINE] > last
+            and self._same_node(rows[-1 - suffix], children[-1 - suffix], delta)
+        ):
+            suffix += 1
+
+        for r in rows[len(rows) - suffix :]:
+            self._shift_rows(r, delta)
+
+        old = rows[prefix : len(rows) - suffix]
+        new = children[prefix : len(children) - suffix]
+        if (
+            len(old) == 1
+            and len(new) == 1
+            and self.store[old[0]][COL_KIND] == (new[0].kind_name)
+        ):
+            self._update_row(old[0], new[0], first, last, delta)
+        else:
+            for r in old:
+                self.store.remove(r)
+            sibling = rows[len(rows) - suffix] if suffix else None
+            for n in new:
+                self._insert_node(it, sibling, n)
+
+    def update(self):
+        """
+        Update the contents of the view after the buffer was edited
+        """
+        buf = GPS.EditorBuffer.get(open=False)
+        root = self.store.get_iter_first()
+        if (
+            not buf
+            or buf.file() != self.file
+            or not self.unit
+            or (not self.compact_mode and root is None)
+        ):
+            self.refresh()
+            return
+
+        old_lines = self.lines
+        self._clear_highlighting()
+        if not self._load_unit(buf):
+            self.store.clear()
+            return
+
+        if not self.compact_mode:
+            first, last, delta = get_lines_diff(old_lines, self.lines)
+            self._update_row(root, self.unit.root, first, last, delta)
+
+    def schedule_update(self):
+        """Update the view once the buffer has not changed for a while"""
+        self.cancel_update()
+        self.refresh_source = GLib.timeout_add(REFRESH_DELAY, self._on_update_timeout)
+
+    def cancel_update(self):
+        if self.refresh_source:
+            GLib.source_remove(self.refresh_source)
+            self.refresh_source = None
+
+    def _on_update_timeout(self):
+        self.refresh_source = None
+        self.update()
+        current_loc = GPS.current_context().location()
+        if current_loc:
+            self.show_current_location(current_loc.line(), current_loc.column())
+        return False
 
 
 class LAL_View(Module):
@@ -350,14 +623,11 @@ class LAL_View(Module):
 
     def buffer_edited(self, file):
         if self.widget:
-            current_loc = GPS.current_context().location()
-            if current_loc:
-                self.widget.refresh()
-                self.widget.show_current_location(
-                    current_loc.line(), current_loc.column()
-                )
+            self.widget.schedule_update()
 
     def on_view_destroy(self):
+        if self.widget:
+            self.widget.cancel_update()
         self.widget = None
 
     def create_view(self):
@@ -4,11 +4,17 @@ from modules import Module
 try:
     # While building the doc, we might not have gi.repository
     from gi.repository import Gtk, GLib, Gdk, Pango
-    from pygps import get_gtk_buffer, is_editor_visible
+    from pygps import get_gtk_buffer, get_widgets_by_type, is_editor_visible
 except ImportError:
     pass
 
+import bisect
+import functools
 import re
+import time
+from array import array
+
+logger = GPS.Logger("HIGHLIGHTER")
 
 
 class HighlighterModule(Module):
@@ -25,7 +31,9 @@ class HighlighterModule(Module):
                 gtk_ed = get_gtk_buffer(ed)
                 if gtk_ed and not gtk_ed.highlighting_initialized:
                     highlighter.init_highlighting(ed)
-                    highlighter.gtk_highlight(gtk_ed)
+                    highlighter.gtk_highlight(
+                        gtk_ed, visible_lines(ed, highlighter.nb_lines)
+                    )
 
     def setup(self):
         for ed in GPS.EditorBuffer.list():
@@ -33,6 +41,7 @@ class HighlighterModule(Module):
                 self.init_highlighting(ed.file())
 
     def preferences_changed(self):
+        _cached_markup.cache_clear()
         for key, item in self.preferences.items():
             pref, value = item
             if pref.get() != value and pref.tag:
@@ -98,6 +107,33 @@ def iter_eq(iter_1, iter_2):
     return iter_1.to_tuple() == iter_2.to_tuple()
 
 
+def visible_lines(ed, default_nb_lines):
+    """
+    Return the range of lines currently displayed in the view of ed. When the
+    view is not realized yet, fall back to the lines following the cursor.
+
+    :type ed: GPS.EditorBuffer
+    :type default_nb_lines: int
+    :rtype: (int, int)
+    """
+    view = ed.current_view()
+    if view is None:
+        return (0, default_nb_lines)
+
+    try:
+        tv = get_widgets_by_type(Gtk.TextView, view.pywidget())[-1]
+        rect = tv.get_visible_rect()
+        if rect.height > 0:
+            first = tv.get_line_at_y(rect.y)[0].get_line()
+            last = tv.get_line_at_y(rect.y + rect.height)[0].get_line()
+            return (first, last)
+    except IndexError:
+        pass
+
+    first = view.cursor().line() - 1
+    return (first, first + default_nb_lines)
+
+
 def tag_to_str(gtk_tag):
     return "<TextTag {0}>".format(gtk_tag.props.name)
 
@@ -298,10 +334,86 @@ class RegionRef(BaseMatcher):
 
 
 class HighlighterStacks(object):
-    def __init__(self):
-        # The stack of highlighter at (0, 0) is necessarily the empty stack,
-        # so the stack list comes prepopulated with one empty stack
-        self.stacks_list = [()]
+    """
+    The stack of highlighters at the start of each line of a buffer.
+
+    Identical stacks are interned and each line only stores the id of its
+    stack, in an array used as a gap buffer: inserting or deleting a block
+    of lines only moves the gap to the modified line, instead of shifting
+    the rest of the buffer once per line.
+    """
+
+    # Initial number of lines that can be inserted before growing the array
+    initial_gap = 1024
+
+    def __init__(self, nb_lines=1, stack=()):
+        """
+        :param nb_lines: the number of lines for which a stack is known.
+        :param stack: the stack of these lines. The stack of highlighter at
+          (0, 0) is necessarily the empty stack, so by default the stacks
+          come prepopulated with one empty stack.
+        :type stack: tuple[Struct]
+        """
+        self.__ids = {(): 0}
+        self.__stacks = [()]
+
+        stack_id = self.__intern(stack)
+        self.__lines = array("i", [stack_id] * nb_lines)
+        self.__lines.extend([0] * self.initial_gap)
+        self.__gap_start = nb_lines
+        self.__gap_end = len(self.__lines)
+
+    def __intern(self, stack):
+        """
+        Return the id of stack, allocating a new one if needed.
+
+        :type stack: tuple[Struct]
+        :rtype: int
+        """
+        stack_id = self.__ids.get(stack)
+        if stack_id is None:
+            stack_id = len(self.__stacks)
+            self.__ids[stack] = stack_id
+            self.__stacks.append(stack)
+        return stack_id
+
+    def __physical(self, index):
+        """
+        Return the position in the array of the given line.
+
+        :type index: int
+        :rtype: int
+        """
+        if index < self.__gap_start:
+            return index
+        return index + self.__gap_end - self.__gap_start
+
+    def __move_gap(self, index, min_size):
+        """
+        Move the gap so that it starts at line index, and make sure it can
+        hold at least min_size lines.
+
+        :type index: int
+        :type min_size: int
+        """
+        lines = self.__lines
+        gap_start, gap_end = self.__gap_start, self.__gap_end
+
+        if index < gap_start:
+            count = gap_start - index
+            lines[gap_end - count : gap_end] = lines[index:gap_start]
+            gap_start, gap_end = index, gap_end - count
+        elif index > gap_start:
+            count = index - gap_start
+            lines[gap_start:index] = lines[gap_end : gap_end + count]
+            gap_start, gap_end = index, gap_end + count
+
+        if gap_end - gap_start < min_size:
+            grow = max(len(lines), min_size)
+            lines[gap_end:gap_end] = array("i", [0] * grow)
+            gap_end += grow
+
+        self.__gap_start, self.__gap_end = gap_start, gap_end
 
     def set(self, index, stack):
         """
@@ -312,24 +424,32 @@ class HighlighterStacks(object):
         :type stack: tuple[Struct]
         @rtype:      bool
         """
-        assert 0 <= index <= len(self.stacks_list)
-
-        tpstack = tuple(stack)
-        if index == len(self.stacks_list):
-            self.stacks_list.append(tpstack)
+        length = len(self)
+        assert 0 <= index <= length
+
+        stack_id = self.__intern(tuple(stack))
+        if index == length:
+            if (
+                self.__gap_end != len(self.__lines)
+                or self.__gap_start == self.__gap_end
+            ):
+                self.__move_gap(index, 1)
+            self.__lines[self.__gap_start] = stack_id
+            self.__gap_start += 1
             return False
         else:
-            current_stack = self.stacks_list[index]
-            self.stacks_list[index] = tpstack
-            return tpstack == current_stack
+            pos = self.__physical(index)
+            current_id = self.__lines[pos]
+            self.__lines[pos] = stack_id
+            return stack_id == current_id
 
     def get(self, start_line):
         """
         :type start_line: int
         @rtype:           tuple[Struct]|None
         """
-        if start_line < len(self.stacks_list):
-            return self.stacks_list[start_line][:]
+        if start_line < len(self):
+            return self.__stacks[self.__lines[self.__physical(start_line)]]
         else:
             return None
 
@@ -338,22 +458,39 @@ class HighlighterStacks(object):
         :type after_line: int
         :type nb_lines:   int
         """
-        for _ in range(nb_lines):
-            self.stacks_list.insert(after_line + 1, ())
+        # Lines that were not highlighted yet have no stack to shift
+        if nb_lines <= 0 or after_line + 1 >= len(self):
+            return
+
+        self.__move_gap(after_line + 1, nb_lines)
+        start = self.__gap_start
+        self.__lines[start : start + nb_lines] = array("i", [0] * nb_lines)
+        self.__gap_start += nb_lines
 
     def delete_lines(self, nb_deleted_lines, at_line):
         """
         :param nb_deleted_lines: int
         :param at_line: int
         """
-        del self.stacks_list[at_line + 1 : at_line + nb_deleted_lines + 1]
+        start = at_line + 1
+        end = min(at_line + nb_deleted_lines + 1, len(self))
+        if start < end:
+            self.__move_gap(end, 0)
+            self.__gap_start = start
+
+    def __len__(self):
+        """
+        The number of lines for which a stack is known, ie. the first line
+        that has not been highlighted yet.
+        """
+        return len(self.__lines) - self.__gap_end + self.__gap_start
 
     def __str__(self):
         return "{0}".format(
             "\n".join(
                 [
-                    "{0}\t{1}".format(num, [c for c in stack])
-                    for num, stack in enumerate(self.stacks_list)
+                    "{0}\t{1}".format(num, [c for c in self.get(num)])
+                    for num in range(len(self))
                 ]
             )
         )
@@ -400,6 +537,16 @@ class SubHighlighter(object):
 
 
 class Highlighter(object):
+    # Buffers with more lines than this are highlighted in the background:
+    # the visible lines first, then the rest of the buffer in idle slices.
+    background_threshold = 5000
+
+    # Number of lines highlighted by each step of the background highlighting
+    chunk_lines = 500
+
+    # Time in seconds that a single idle slice is allowed to spend
+    idle_budget = 0.01
+
     def __init__(self, spec=(), igncase=False, nb_lines=100):
         """
         :type spec: Iterable[BaseMatcher]
@@ -410,16 +557,22 @@ class Highlighter(object):
         # Nb lines we will rehighlight after a modification
         self.nb_lines = nb_lines
 
-    def highlight_info_gen(self, gtk_ed, start_line, end_line=0):
+    def highlight_info_gen(self, gtk_ed, start_line, end_line=0, stacks=None):
         """
         Returns a generator that will highlight the buffer, one token at a
         time, every time the generator is consumed.
 
         :type gtk_ed: Gtk.TextBuffer
         :type start_line: int
+        :param stacks: the stacks to resume from and to update, defaults to
+          the stacks of gtk_ed.
+        :type stacks: HighlighterStacks
         """
         self.sync_stop = False
 
+        if stacks is None:
+            stacks = gtk_ed.stacks
+
         start = gtk_ed.get_iter_at_line(start_line)
         ":type: Gtk.TextIter"
 
@@ -441,10 +594,10 @@ class Highlighter(object):
 
         if start_line == 0:
             subhl_stack = [self.root_highlighter]
-            gtk_ed.stacks.set(0, subhl_stack)
+            stacks.set(0, subhl_stack)
         else:
             try:
-                subhl_stack = list(gtk_ed.stacks.get(start_line))
+                subhl_stack = list(stacks.get(start_line))
             except TypeError:
                 subhl_stack = [self.root_highlighter]
 
@@ -483,12 +636,12 @@ class Highlighter(object):
 
                 if start_line > current_line:
                     for ll in range(current_line + 1, start_line):
-                        gtk_ed.stacks.set(ll, subhl_stack)
+                        stacks.set(ll, subhl_stack)
                     current_line = start_line
 
                     # We exit because the stack we're setting is == to the
                     # existing one, so the buffer is synced
-                    if gtk_ed.stacks.set(current_line, subhl_stack):
+                    if stacks.set(current_line, subhl_stack):
                         endi = gtk_ed.get_iter_at_line(current_line)
                         endi.backward_char()
                         endo = endi.get_offset()
@@ -546,7 +699,7 @@ class Highlighter(object):
         #  In this case, we want to set the stack correctly for the remaining
         #  lines
         for ll in range(current_line + 1, end.get_line() + 1):
-            gtk_ed.stacks.set(ll, subhl_stack)
+            stacks.set(ll, subhl_stack)
 
         results.append((None, end_offset, end_offset))
         return results
@@ -587,8 +740,118 @@ class Highlighter(object):
 
         # print time() - t
 
-    def gtk_highlight(self, gtk_ed):
-        self.highlight_gen(gtk_ed, -1, -1)
+    def gtk_highlight(self, gtk_ed, visible=None):
+        """
+        Highlight the whole buffer. Large buffers are highlighted in the
+        background, starting with the visible lines.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :param visible: the range of lines displayed in the editor
+        :type visible: (int, int)
+        """
+        start = time.time()
+
+        if gtk_ed.get_line_count() <= self.background_threshold:
+            self.highlight_gen(gtk_ed, -1, -1)
+            logger.log("highlighted buffer in %.3fs" % (time.time() - start,))
+            return
+
+        first, last = visible or (0, self.nb_lines)
+
+        if first <= self.chunk_lines:
+            # The visible lines are close to the top of the buffer: highlight
+            # up to them right away, the stacks will be exact.
+            self.highlight_chunk(gtk_ed, 0, last + 1)
+        else:
+            self.highlight_provisional(gtk_ed, first, last + 1)
+
+        logger.log("time to first paint: %.3fs" % (time.time() - start,))
+
+        if gtk_ed.background_highlight_id:
+            GLib.source_remove(gtk_ed.background_highlight_id)
+        gtk_ed.background_highlight_id = GLib.idle_add(
+            self.__highlight_slice, gtk_ed, start
+        )
+
+    def highlight_chunk(self, gtk_ed, start_line, end_line):
+        """
+        Highlight the lines from start_line to end_line, resuming from the
+        stack computed for start_line, and record the stacks of the following
+        lines.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :type start_line: int
+        :type end_line: int
+        """
+        actions_list = self.highlight_info_gen(gtk_ed, start_line, end_line)
+        if not actions_list:
+            return
+
+        start_it = gtk_ed.get_iter_at_line(start_line)
+        end_it = gtk_ed.get_start_iter()
+
+        # Remove the highlighting done on these lines before the stacks
+        # were known.
+        if gtk_ed.provisional_tags:
+            end_it.set_offset(actions_list[-1][2])
+            for tag in gtk_ed.provisional_tags:
+                gtk_ed.remove_tag(tag, start_it, end_it)
+
+        for tag, start, end in actions_list:
+            if tag:
+                start_it.set_offset(start)
+                end_it.set_offset(end)
+                gtk_ed.apply_tag(tag, start_it, end_it)
+
+    def highlight_provisional(self, gtk_ed, start_line, end_line):
+        """
+        Highlight the lines from start_line to end_line, assuming that no
+        region is open at start_line. This gives an immediate highlighting
+        of lines far from the start of the buffer, corrected later on by
+        highlight_chunk.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :type start_line: int
+        :type end_line: int
+        """
+        stacks = HighlighterStacks(start_line + 1, (self.root_highlighter,))
+
+        start_it = gtk_ed.get_start_iter()
+        end_it = gtk_ed.get_start_iter()
+
+        for tag, start, end in self.highlight_info_gen(
+            gtk_ed, start_line, end_line, stacks
+        ):
+            if tag:
+                start_it.set_offset(start)
+                end_it.set_offset(end)
+                gtk_ed.apply_tag(tag, start_it, end_it)
+                gtk_ed.provisional_tags.add(tag)
+
+    def __highlight_slice(self, gtk_ed, start_time):
+        """
+        Highlight the next chunks of gtk_ed, for at most idle_budget seconds.
+        Return False once the whole buffer has been highlighted.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :type start_time: float
+        """
+        deadline = time.time() + self.idle_budget
+
+        while time.time() < deadline:
+            start_line = len(gtk_ed.stacks) - 1
+            if start_line >= gtk_ed.get_line_count() - 1:
+                gtk_ed.background_highlight_id = None
+                gtk_ed.provisional_tags = set()
+                logger.log(
+                    "highlighted buffer in background in %.3fs"
+                    % (time.time() - start_time,)
+                )
+                return False
+
+            self.highlight_chunk(gtk_ed, start_line, start_line + self.chunk_lines)
+
+        return True
 
     def gtk_highlight_region(self, gtk_ed, start_line, nb_lines):
         self.highlight_gen(gtk_ed, start_line, nb_lines)
@@ -597,14 +860,23 @@ class Highlighter(object):
         gtk_ed = get_gtk_buffer(ed)
         gtk_ed.highlighting_initialized = True
         gtk_ed.stacks = HighlighterStacks()
+        gtk_ed.provisional_tags = set()
 
         if not hasattr(gtk_ed, "idle_highlight_id"):
             gtk_ed.idle_highlight_id = None
+        if not hasattr(gtk_ed, "background_highlight_id"):
+            gtk_ed.background_highlight_id = None
 
         def action_handler(loc, nb_lines):
             """:type loc: Gtk.TextIter"""
             if gtk_ed.idle_highlight_id:
                 GLib.source_remove(gtk_ed.idle_highlight_id)
+                gtk_ed.idle_highlight_id = None
+
+            # The background highlighting has not reached this line yet, it
+            # will take the modification into account when it does.
+            if loc.get_line() >= len(gtk_ed.stacks):
+                return
 
             # Highlight the rest of the buffer
             self.gtk_highlight_region(gtk_ed, loc.get_line(), nb_lines)
@@ -651,101 +923,47 @@ class Highlighter(object):
         # Sort actions_list by start offset
         actions_list.sort(key=lambda x: x[1])
 
-        result = ""
+        def open_span(tag):
+            return '<span foreground="%s">' % get_hex_color(
+                tag.get_property("foreground_rgba")
+            )
+
+        result = []
+        current_offset = 0
         if allow_nested_tag:
             # Map of list of tag for index in the buffer
             start_tag_map = {}
             end_tag_map = {}
-            last_tag = None
             for tag, start, end in actions_list:
-                if tag:
-                    if start in start_tag_map:
-                        start_tag_map[start].append(tag)
-                    else:
-                        start_tag_map[start] = [tag]
-
-                    if end in end_tag_map:
-                        end_tag_map[end].append(tag)
-                    else:
-                        end_tag_map[end] = [tag]
-
-            current_offset = 0
-            max_offset = len(text)
-            start_iter = iter(start_tag_map)
-            end_iter = iter(end_tag_map)
-            start_tag_offset = next(start_iter)
-            end_tag_offset = next(end_iter)
-
-            iterator_stopped = 0
-            # Iter in both map in parallel until both are empty which means
-            # we received 2 StopIteration exception
-            while iterator_stopped < 2:
-                if start_tag_offset < end_tag_offset:
-                    result += text[current_offset:start_tag_offset]
-                    current_offset = start_tag_offset
-                    for tag in start_tag_map[start_tag_offset]:
-                        result += '<span foreground="%s">' % get_hex_color(
-                            tag.get_property("foreground_rgba")
-                        )
-                        try:
-                            start_tag_offset = next(start_iter)
-                        except StopIteration:
-                            iterator_stopped += 1
-                            start_tag_offset = max_offset + 1
-                elif start_tag_offset == end_tag_offset:
-                    result += text[current_offset:end_tag_offset]
-                    current_offset = end_tag_offset
-                    for tag in end_tag_map[end_tag_offset]:
-                        result += "</span>"
-                    for tag in start_tag_map[start_tag_offset]:
-                        result += '<span foreground="%s">' % get_hex_color(
-                            tag.get_property("foreground_rgba")
-                        )
-                        try:
-                            start_tag_offset = next(start_iter)
-                        except StopIteration:
-                            iterator_stopped += 1
-                            start_tag_offset = max_offset + 1
-                        try:
-                            end_tag_offset = next(end_iter)
-                        except StopIteration:
-                            iterator_stopped += 1
-                            end_tag_offset = max_offset + 1
-                elif end_tag_offset <= max_offset:
-                    result += text[current_offset:end_tag_offset]
-                    current_offset = end_tag_offset
-                    for tag in end_tag_map[end_tag_offset]:
-                        result += "</span>"
-                    try:
-                        end_tag_offset = next(end_iter)
-                    except StopIteration:
-                        iterator_stopped += 1
-                        end_tag_offset = max_offset + 1
-
-            # Add the rest of the text
-            result += text[current_offset:]
+                if tag and start < end:
+                    start_tag_map.setdefault(start, []).append(tag)
+                    end_tag_map.setdefault(end, []).append(tag)
+
+            # At each offset, close the spans ending there before opening
+            # the ones starting there.
+            for offset in sorted(set(start_tag_map) | set(end_tag_map)):
+                result.append(text[current_offset:offset])
+                current_offset = offset
+                result.append("</span>" * len(end_tag_map.get(offset, ())))
+                for tag in start_tag_map.get(offset, ()):
+                    result.append(open_span(tag))
         else:
-            current_offset = 0
             for tag, start, end in actions_list:
                 # This check allows to ignore nested span
                 if current_offset <= start:
                     # Add the text before the one in the span
-                    result += text[current_offset:start]
+                    result.append(text[current_offset:start])
                     if tag:
-                        need_close_span = True
-                        result += '<span foreground="%s">' % get_hex_color(
-                            tag.get_property("foreground_rgba")
-                        )
-                        result += text[start:end]
-                        result += "</span>"
+                        result.append(open_span(tag))
+                        result.append(text[start:end])
+                        result.append("</span>")
                     else:
-                        result += text[start:end]
+                        result.append(text[start:end])
                     current_offset = end
 
-            # Add the rest of the text
-            result += text[current_offset:]
-
-        return result
+        # Add the rest of the text
+        result.append(text[current_offset:])
+        return "".join(result)
 
 
 class StringTextIter:
@@ -777,34 +995,34 @@ class StringTextIter:
 class StringTextBuffer:
     """
     A text buffer mimicking the implementation of Gtk.TextBuffer.
+    The offset of the start of each line is computed once, so that creating
+    an iterator does not need to walk the text.
     """
 
     def __init__(self, text):
         self.text = text
-        self.lines = self.text.splitlines()
+        self.line_starts = [0]
+        self.line_starts.extend(m.end() for m in re.finditer("\n", text))
         self.stacks = HighlighterStacks()
         self.tagtable = Gtk.TextTagTable()
 
     def _create_text_iter(self, line, column):
-        offset = 0
-        for i in range(0, len(self.lines)):
-            if offset > 0:
-                offset += 1  # Add the newline
-            if i == line:
-                offset += column
-                return StringTextIter(line, column, offset)
-            else:
-                offset += len(self.lines[i])
+        if 0 <= line < len(self.line_starts):
+            return StringTextIter(line, column, self.line_starts[line] + column)
         return None
 
     def get_iter_at_line(self, line):
         return self._create_text_iter(line, 0)
 
+    def get_iter_at_offset(self, offset):
+        line = bisect.bisect_right(self.line_starts, offset) - 1
+        return self._create_text_iter(line, offset - self.line_starts[line])
+
     def get_end_iter(self):
-        return self._create_text_iter(len(self.lines) - 1, len(self.lines[-1]))
+        return self.get_iter_at_offset(len(self.text))
 
     def get_line_count(self):
-        return len(self.text.splitlines())
+        return len(self.line_starts)
 
     def get_text(self, start, end, ignored):
         return self.text[start.offset : end.offset]
@@ -818,6 +1036,16 @@ class StringTextBuffer:
         return tag
 
 
+@functools.lru_cache(maxsize=128)
+def _cached_markup(language, text, allow_nested_tag):
+    """
+    The markup of text computed by the highlighter of language. The cache is
+    cleared when the preferences, and thus the colors of the tags, change.
+    """
+    highlighter = HighlighterModule.highlighters[language]
+    return highlighter.generate_markup(text, allow_nested_tag=allow_nested_tag)
+
+
 def markup_for_text(language, text, allow_nested_tag=False):
     """
     Reuse the Highlighter engine on a string for the given language.
@@ -829,9 +1057,9 @@ def markup_for_text(language, text, allow_nested_tag=False):
     :param allow_nested_tag: should the markup be complex or simple
     :type allow_nested_tag: bool
     """
-    highlighter = HighlighterModule.highlighters.get(language.lower(), None)
-    if highlighter:
-        return highlighter.generate_markup(text, allow_nested_tag=allow_nested_tag)
+    language = language.lower()
+    if language in HighlighterModule.highlighters:
+        return _cached_markup(language, text, allow_nested_tag)
     else:
         return text
 
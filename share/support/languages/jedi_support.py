@@ -32,6 +32,42 @@ TYPE_LABELS = {
     "statement": completion.CAT_DECLARE_BLOCK,
 }
 
+SCRIPTS_CACHE_SIZE = 8
+# The number of files for which the jedi.Script is kept between completions
+
+
+class JediCompletionProposal(CompletionProposal):
+
+    """
+    A completion proposal for a jedi completion, whose documentation is
+    only computed when needed.
+    """
+
+    def __init__(self, jedi_completion):
+        self.__completion = jedi_completion
+        self.__documentation = None
+        super(JediCompletionProposal, self).__init__(
+            name=jedi_completion.name,
+            label=jedi_completion.name,
+            documentation=None,
+            language_category=TYPE_LABELS.get(
+                jedi_completion.type, completion.CAT_UNKNOWN
+            ),
+        )
+
+    @property
+    def documentation(self):
+        if self.__documentation is None:
+            try:
+                self.__documentation = self.__completion.docstring()
+            except Exception:
+                self.__documentation = ""
+        return self.__documentation
+
+    @documentation.setter
+    def documentation(self, value):
+        self.__documentation = value
+
 
 class PythonResolver(CompletionResolver):
 
@@ -43,6 +79,52 @@ class PythonResolver(CompletionResolver):
         self.__prefix = None
         # additional directories that module search will perform
         self.source_dirs = set([])
+        # the jedi.Project for each set of source dirs
+        self.__projects = {}
+        # file path => (text, jedi.Project, jedi.Script) for the last
+        # completion in the most recently edited files
+        self.__scripts = {}
+
+    def __get_project(self):
+        """
+        Return the jedi.Project for the current source dirs
+        """
+        key = frozenset(self.source_dirs)
+        project = self.__projects.get(key)
+        if project is None:
+            project = jedi.Project(None, sys_path=sys.path + sorted(key))
+            self.__projects[key] = project
+        return project
+
+    def __get_script(self, buffer):
+        """
+        Return a jedi.Script for the current contents of buffer, reusing
+        the one from the previous completion if the buffer has not changed
+        since then.
+        """
+        path = buffer.file().path
+        text = buffer.get_chars()
+        project = self.__get_project()
+        cached = self.__scripts.get(path)
+        if cached is not None and cached[0] == text and cached[1] is project:
+            return cached[2]
+
+        # Giving the path of the file lets jedi reuse its parser cache for
+        # that file, and only parse again the parts that changed.
+        script = jedi.Script(code=text, path=path, project=project)
+        self.__scripts.pop(path, None)
+        self.__scripts[path] = (text, project, script)
+        if len(self.__scripts) > SCRIPTS_CACHE_SIZE:
+            # Forget the least recently created script
+            del self.__scripts[next(iter(self.__scripts))]
+        return script
+
+    def reset(self):
+        """
+        Forget all the cached projects and scripts
+        """
+        self.__projects.clear()
+        self.__scripts.clear()
 
     def get_completions(self, loc):
         """
@@ -71,32 +153,18 @@ class PythonResolver(CompletionResolver):
         #    time when Jedi was imported.
 
         self.source_dirs.update([loc.buffer().file().directory()])
-        project = jedi.Project(None, sys_path=sys.path + list(self.source_dirs))
 
         try:
-            # filter out ^L in source text
-            text = loc.buffer().get_chars()
-            # text = text.replace('\x0c', ' ')
-            # Feed Jedi API
-            script = jedi.Script(code=text, project=project)
+            script = self.__get_script(loc.buffer())
             completions = script.complete(line=loc.line(), column=loc.column() - 1)
 
-            # Sort, filter results
-            result = sorted(
-                (
-                    CompletionProposal(
-                        name=i.name,
-                        label=i.name,
-                        documentation=i.docstring(),
-                        language_category=TYPE_LABELS.get(
-                            i.type, completion.CAT_UNKNOWN
-                        ),
-                    )
-                    for i in completions
-                    if i.name.startswith(self.__prefix)
-                ),
-                key=lambda d: d.name,
+            # Filter and sort the completions first: the proposals, and
+            # their documentation, are only created when needed.
+            completions = sorted(
+                (i for i in completions if i.name.startswith(self.__prefix)),
+                key=lambda i: i.name,
             )
+            result = (JediCompletionProposal(i) for i in completions)
         except:
             jedi_log = GPS.Logger("JEDI_PARSING")
             jedi_log.log("jedi fails to parse:" + loc.buffer().file().path)
@@ -136,6 +204,7 @@ class Jedi_Module(Module):
             )
         except:
             GPS.Logger("JEDI_SUPPORT").log("Dependencies are not processed")
+        self.__resolver.reset()
 
     # The followings are hooks:
 
@@ -26,6 +26,7 @@ following are provided:
 import GPS
 import sys
 import ast
+import itertools
 import os.path
 import gs_utils
 import os_utils
@@ -48,6 +49,10 @@ except ImportError:
     has_pygtk = 0
 
 
+OUTLINES_CACHE_SIZE = 16
+# The number of files whose constructs are kept to be updated incrementally
+
+
 def get_last_body_statement(node):
     if hasattr(node, "body"):
         return get_last_body_statement(node.body[-1])
@@ -55,17 +60,40 @@ def get_last_body_statement(node):
         return node
 
 
-# noinspection PyPep8Naming
-class ASTVisitor(ast.NodeVisitor):
-    def __init__(self, bufstr, clist):
-        self.buflines = bufstr.splitlines()
-        self.lines_offsets = [0 for _ in self.buflines]
+def split_lines(text):
+    """
+    Return the lines of text, as numbered by the Python parser. Unlike
+    str.splitlines, this only splits on newlines, and not on form feeds or
+    other line separators.
+    """
+    lines = text.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def get_lines_offsets(buflines):
+    """
+    Return the offset of the beginning of each line in buflines, as
+    returned by split_lines
+    """
+    return [0] + list(itertools.accumulate(len(line) + 1 for line in buflines[:-1]))
 
-        for i in range(1, len(self.buflines)):
-            self.lines_offsets[i] = (
-                self.lines_offsets[i - 1] + len(self.buflines[i - 1]) + 1
-            )
 
+# noinspection PyPep8Naming
+class ASTVisitor(ast.NodeVisitor):
+    def __init__(self, bufstr, clist, buflines=None, lines_offsets=None):
+        """
+        :param buflines: the lines of bufstr, if already computed
+        :param lines_offsets: the offsets of buflines, as returned by
+           get_lines_offsets, if already computed
+        """
+        self.buflines = buflines if buflines is not None else split_lines(bufstr)
+        self.lines_offsets = (
+            lines_offsets
+            if lines_offsets is not None
+            else get_lines_offsets(self.buflines)
+        )
         self.clist = clist
 
     def get_offset(self, lineno, col):
@@ -175,19 +203,211 @@ class ASTVisitor(ast.NodeVisitor):
         self.add_private_construct(n, CAT_LOOP_STATEMENT)
 
 
+class ConstructsRecorder(object):
+    """
+    A list of constructs, with the same interface as GPS.ConstructsList
+    """
+
+    def __init__(self):
+        self.constructs = []
+
+    def add_construct(self, *args):
+        self.constructs.append(args)
+
+
+class PythonOutline(object):
+    """
+    The constructs of a Python file, grouped by top-level statement so
+    that they can be computed again incrementally when the file changes.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.buflines = split_lines(text)
+        self.lines_offsets = get_lines_offsets(self.buflines)
+        self.regions = []
+        # For each top-level statement, (first line, last line, constructs).
+        # The regions cover all the lines of the file, including the
+        # comments and blank lines between statements.
+
+    def parse(self, start=1, end=None):
+        """
+        Compute the regions for the lines start .. end of the text.
+        Raise SyntaxError if these lines do not parse.
+        :return: the list of regions
+        """
+        if end is None:
+            end = len(self.buflines)
+
+        if start == 1 and end == len(self.buflines):
+            tree = ast.parse(self.text)
+        else:
+            tree = ast.parse("\n".join(self.buflines[start - 1 : end]) + "\n")
+            ast.increment_lineno(tree, start - 1)
+
+        visitor = ASTVisitor(
+            self.text,
+            None,
+            buflines=self.buflines,
+            lines_offsets=self.lines_offsets,
+        )
+        regions = []
+        for stmt in tree.body:
+            stmt_start = min(
+                [stmt.lineno] + [d.lineno for d in getattr(stmt, "decorator_list", [])]
+            )
+            if regions:
+                regions[-1][1] = stmt_start - 1
+            visitor.clist = ConstructsRecorder()
+            visitor.visit(stmt)
+            regions.append([stmt_start, end, visitor.clist.constructs])
+
+        if regions:
+            regions[0][0] = start
+        else:
+            regions.append([start, end, []])
+        return [tuple(r) for r in regions]
+
+    def diff(self, old):
+        """
+        Compare self with the previous outline of the same file.
+        :return: (first, last, delta), where first .. last are the lines
+           of old that were modified, and delta is the number of lines
+           added after them.
+        """
+        old_lines = old.buflines
+        max_common = min(len(old_lines), len(self.buflines))
+        prefix = 0
+        while prefix < max_common and old_lines[prefix] == self.buflines[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < max_common - prefix
+            and old_lines[-1 - suffix] == self.buflines[-1 - suffix]
+        ):
+            suffix += 1
+        return (
+            prefix + 1,
+            len(old_lines) - suffix,
+            len(self.buflines) - len(old_lines),
+        )
+
+    def shift(self, old, regions, last):
+        """
+        Return regions, computed for old, with the lines after last moved
+        to their place in self.
+        """
+        if last >= len(old.buflines):
+            return list(regions)
+
+        delta = len(self.buflines) - len(old.buflines)
+        offset_delta = self.lines_offsets[last + delta] - old.lines_offsets[last]
+
+        def shift_pos(pos):
+            if pos[0] > last:
+                return (pos[0] + delta, pos[1], pos[2] + offset_delta)
+            return pos
+
+        return [
+            (
+                start + delta if start > last else start,
+                end + delta if end > last else end,
+                [c[:5] + tuple(shift_pos(p) for p in c[5:]) for c in constructs],
+            )
+            for start, end, constructs in regions
+        ]
+
+    def update(self, old):
+        """
+        Compute the regions of self, reusing those of old for the top-level
+        statements that have not changed.
+        Raise SyntaxError if the text does not parse.
+        """
+        if old.buflines == self.buflines:
+            self.regions = old.regions
+            return
+
+        first, last, delta = self.diff(old)
+
+        # The regions affected by the change, including the one before it,
+        # since the modified lines might be a continuation of it
+        low = max(first - 1, 1)
+        high = max(last, first)
+        affected = [
+            i
+            for i, (start, end, _) in enumerate(old.regions)
+            if end >= low and start <= high
+        ]
+        if not affected:
+            self.regions = self.parse()
+            return
+
+        i, j = affected[0], affected[-1]
+        start = old.regions[i][0]
+        end = old.regions[j][1] + delta
+
+        try:
+            changed = self.parse(start, end)
+        except SyntaxError:
+            # The modified statements might only parse in the context of
+            # the whole file
+            self.regions = self.parse()
+            return
+
+        self.regions = (
+            old.regions[:i]
+            + changed
+            + self.shift(old, old.regions[j + 1 :], old.regions[j][1])
+        )
+
+    def constructs(self):
+        for _, _, constructs in self.regions:
+            for c in constructs:
+                yield c
+
+
 # noinspection PyMethodMayBeStatic
 class PythonLanguage(GPS.Language):
     def __init__(self):
-        pass
+        self.__outlines = {}
+        # file path => the last PythonOutline of that file that parsed
 
-    def parse_constructs(self, constructs_list, gps_file, string):
-        del gps_file
+    def __get_constructs(self, gps_file, string):
+        """
+        Return the constructs for the file, reusing as much as possible the
+        result of its previous parsing.
+        """
+        key = gps_file.path if gps_file else None
+        old = self.__outlines.get(key)
+        if old is not None and old.text == string:
+            return old.constructs()
+
+        outline = PythonOutline(string)
         try:
-            tree = ast.parse(string)
-            tree.lineno = 0
-            ASTVisitor(string, constructs_list).visit(tree)
+            if old is None:
+                outline.regions = outline.parse()
+            else:
+                outline.update(old)
         except SyntaxError:
-            pass
+            if old is None:
+                return []
+
+            # Keep the last constructs that could be computed, moved to
+            # follow the lines that were added or removed
+            _, last, _ = outline.diff(old)
+            outline.regions = outline.shift(old, old.regions, last)
+            return outline.constructs()
+
+        self.__outlines.pop(key, None)
+        self.__outlines[key] = outline
+        if len(self.__outlines) > OUTLINES_CACHE_SIZE:
+            # Forget the least recently parsed file
+            del self.__outlines[next(iter(self.__outlines))]
+        return outline.constructs()
+
+    def parse_constructs(self, constructs_list, gps_file, string):
+        for c in self.__get_constructs(gps_file, string):
+            constructs_list.add_construct(*c)
 
 
 class PythonSupport(object):
@@ -60,7 +60,7 @@ import xml.sax.saxutils
 
 import GPS
 from extensions.private.xml import X
-from gs_utils import interactive
+from gs_utils import interactive, tool_probes
 from gs_utils.internal.dialogs import Project_Properties_Editor
 from modules import Module
 import os_utils
@@ -645,8 +645,7 @@ class GNATcovPlugin(Module):
 
         # Update the GNATcoverage workflow Build Targets, creating them and
         # showing/hiding them appropriately. Also fill the custom targets.
-        process = GPS.Process(["gnatcov", "--help"])
-        help_msg = process.get_result()
+        help_msg = tool_probes.probe("gnatcov", ["--help"])
 
         # Load the gnatcov's build targets, with the retrieved help message.
         # If an exception happens while loading the XML, try to load the build
@@ -768,7 +767,7 @@ class GNATcovPlugin(Module):
         """
         Run the "`exe` --version" command and return its output.
         """
-        return GPS.Process(exe + " --version").get_result()
+        return tool_probes.probe(exe, ["--version"])
 
     # Return the tool version as (major version, minor version)
     @classmethod
@@ -160,6 +160,9 @@ class JSON_Diagram_File:
         self.templates = {}  # id -> template (JSON data)
         self.diagrams = []
         self.index = []  # (id, children (JSON Array))
+        self.children = {}  # id -> children (JSON Array)
+        self.__diagrams = {}  # id -> JSON_Diagram
+        self.__item_diagrams = {}  # item id -> diagram id
         self.factory = factory
         self.__load(data)
 
@@ -169,10 +172,7 @@ class JSON_Diagram_File:
         without loading it.
         :return boolean: Existence of diagram with name id within self
         """
-        for d in self.diagrams:
-            if d.id == id:
-                return True
-        return False
+        return id in self.__diagrams
 
     def get(self, id=None):
         """
@@ -180,29 +180,41 @@ class JSON_Diagram_File:
         :param str id: if None, returns the first diagram
         :return: an instance of JSON_Diagram
         """
-        for d in self.diagrams:
-            if d.id == id:
-                d.ensure()
-                return d
-
-        if self.diagrams:
+        d = self.__diagrams.get(id)
+        if d is None and self.diagrams:
             d = self.diagrams[0]
+
+        if d is not None:
             d.ensure()
-            return d
-        return None
+        return d
 
     def get_diagram_for_item(self, id):
         """
-        Return the diagram to use for a given item
+        Return the diagram to use for a given item.
+        Only that diagram is created, if needed.
         :return:  (GPS.Diagram, Item)
         """
-        for d in self.diagrams:
+        d = self.__diagrams.get(self.__item_diagrams.get(id))
+        if d is not None:
             d.ensure()
             it = d.get_item(id)
             if it:
                 return (d, it)
         return None
 
+    def extend(self, other):
+        """
+        Add the diagrams of another JSON_Diagram_File to self.
+        :param JSON_Diagram_File other: the file to get the diagrams from
+        """
+        self.index.extend(other.index)
+        for id, children in other.index:
+            self.children.setdefault(id, children)
+        for d in other.diagrams:
+            self.__add_diagram(d)
+        for id, diag_id in other.__item_diagrams.items():
+            self.__item_diagrams.setdefault(id, diag_id)
+
     def clear_selection(self):
         """
         Clear the selection in all diagrams.
@@ -257,13 +269,50 @@ class JSON_Diagram_File:
         for d in data.get("diagrams", []):
             # ??? should build diagrams only when they are displayed
             self.index.append((d.get("id"), d.get("children", [])))
+            self.children.setdefault(d.get("id"), d.get("children", []))
+
+            for id in self.__item_ids(d.get("items", []) + d.get("links", [])):
+                self.__item_diagrams.setdefault(id, d.get("id"))
 
             if self.factory is None:
                 diag = JSON_Diagram(file=self, json=d)  # A new diagram
             else:
                 diag = self.factory(file=self, json=d)
 
-            self.diagrams.append(diag)
+            self.__add_diagram(diag)
+
+    def __add_diagram(self, diag):
+        """
+        Add a diagram to self, the first one wins when several diagrams
+        have the same id.
+        """
+        self.diagrams.append(diag)
+        self.__diagrams.setdefault(diag.id, diag)
+
+    def __item_ids(self, objects):
+        """
+        Return the ids of the items and links described by objects and their
+        children, without creating them.
+        :param objects: a list of JSON data for items or links
+        """
+        stack = list(objects)
+        while stack:
+            o = stack.pop()
+            if not isinstance(o, dict):
+                continue
+
+            id = o.get("id")
+            if id is not None:
+                yield id
+
+            if "template" in o:
+                stack.append(self.templates.get(o["template"]))
+
+            stack.extend(o.get("vbox") or o.get("hbox") or [])
+            stack.append(o.get("label"))
+            for end in ("from", "to"):
+                if isinstance(o.get(end), dict):
+                    stack.append(o[end].get("label"))
 
 
 class JSON_Diagram(B.Diagram):
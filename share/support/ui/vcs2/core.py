@@ -485,6 +485,15 @@ class VCS(GPS.VCS2):
                 s.set_status(file2, ...)
             # on exit, automatically set status of remaining files
 
+        Files can also be given by their path relative to the working
+        directory, in batches. This avoids creating a `GPS.File` for each
+        file, and is much faster when setting the status of a large number
+        of files::
+
+            with self.set_status_for_all_files() as s:
+                s.set_relative_statuses(
+                    [('src/file1.adb', status1), ('src/file2.adb', status2)])
+
         You can also use the returned value as a standard object:
 
             s = self.set_status_for_all_files()
@@ -509,10 +518,9 @@ class VCS(GPS.VCS2):
         class _CM(object):
             def __init__(self):
                 self._seen = set()
+                self._seen_paths = set()
                 self._cache = {}  # (status,version,repo_version) -> [File]
-                self.__iterator = None
-                self.__status = None
-                self.__index = 0
+                self._relative_cache = {}  # same, but -> [relative path]
 
             def __enter__(self):
                 return self
@@ -524,6 +532,32 @@ class VCS(GPS.VCS2):
                 """
                 return self._seen
 
+            @property
+            def paths_with_explicit_status(self):
+                """
+                Return the set of relative paths for which an explicit status
+                was set via `set_relative_statuses`
+                """
+                return self._seen_paths
+
+            def set_relative_statuses(self, statuses, version="", repo_version=""):
+                """
+                Set the status for a batch of files. These statuses are sent
+                to GPS with one call per status, instead of creating a
+                GPS.File for each file. This bypasses emulated staging.
+
+                :param statuses: the files and their status
+                :type statuses: iterable of (str, GPS.VCS2.Status), where the
+                    paths are relative to the working directory
+                :param str version:
+                :param str repo_version:
+                """
+                seen = self._seen_paths
+                cache = self._relative_cache
+                for path, status in statuses:
+                    seen.add(path)
+                    cache.setdefault((status, version, repo_version), []).append(path)
+
             def set_status(self, file, status, version="", repo_version=""):
                 """
                 Set the status for one file
@@ -545,10 +579,15 @@ class VCS(GPS.VCS2):
                 """
                 for s, s_files in self._cache.items():
                     vcs._set_file_status(s_files, s[0], s[1], s[2])
+                for s, s_paths in self._relative_cache.items():
+                    vcs._set_relative_files_status(s_paths, s[0], s[1], s[2])
 
                 to_set = []
                 for f in files:
-                    if f not in self._seen:
+                    if f not in self._seen and (
+                        not self._seen_paths
+                        or vcs._relpath(f.path) not in self._seen_paths
+                    ):
                         to_set.append(f)
                 vcs._set_file_status(to_set, vcs.default_status)
 
@@ -561,36 +600,29 @@ class VCS(GPS.VCS2):
                 of files at once.
                 """
 
+                # The batches to send to GPS: (setter, status, files)
+                batches = [
+                    (vcs._set_file_status, s, s_files)
+                    for s, s_files in self._cache.items()
+                ] + [
+                    (vcs._set_relative_files_status, s, s_paths)
+                    for s, s_paths in self._relative_cache.items()
+                ]
+                index = [0]
+
                 def handler():
-                    if self.__status:
-                        s_files = self._cache[self.__status]
-                        if self.__index + step > len(s_files):
-                            vcs._set_file_status(
-                                s_files[self.__index :],
-                                self.__status[0],
-                                self.__status[1],
-                                self.__status[2],
-                            )
-                            self.__index = 0
-                            try:
-                                self.__status = next(self.__iter)
-                            except StopIteration:
-                                GPS.Hook("vcs_file_status_finished").run()
-                                return False
-                        else:
-                            vcs._set_file_status(
-                                s_files[self.__index : self.__index + step],
-                                self.__status[0],
-                                self.__status[1],
-                                self.__status[2],
-                            )
-                            self.__index = self.__index + step
+                    setter, s, s_files = batches[0]
+                    setter(s_files[index[0] : index[0] + step], s[0], s[1], s[2])
+                    index[0] += step
+                    if index[0] >= len(s_files):
+                        batches.pop(0)
+                        index[0] = 0
+                        if not batches:
+                            GPS.Hook("vcs_file_status_finished").run()
+                            return False
                     return True
 
-                self.__iter = iter(list(self._cache))
-                try:
-                    self.__status = next(self.__iter)
-                except StopIteration:
+                if not batches:
                     GPS.Hook("vcs_file_status_finished").run()
                     return False
                 GLib.timeout_add(msecs, handler)
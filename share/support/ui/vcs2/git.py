@@ -1,7 +1,10 @@
 import GPS
 from . import core
+import hashlib
 import os
 import os_utils
+import platform
+import posixpath
 import re
 import workflows
 from workflows.promises import ProcessWrapper, join, Promise
@@ -23,6 +26,131 @@ LOCAL_CHANGES_ID = "Local change"
 _version = None
 # Git version
 
+HISTORY_CACHE_SIZE = 8
+# Number of history filters for which the commits are kept in memory
+
+HISTORY_BRANCH_COMMITS_FACTOR = 10
+# When only the commits related to branching points are displayed, number
+# of commits first fetched for each line of the History view
+
+
+def _branch_commits_end(commits, max_lines, has_local):
+    """
+    When only the commits related to branching points are displayed, return
+    the number of commits needed to display max_lines lines in the History
+    view, or None if the commits are not enough. This follows the rules of
+    the History view to decide which commits are visible.
+
+    :param commits: as in `_History_Page.commits`
+    """
+    visibility = {}  # for each commit: [visibility, number of children]
+    always_visible = 2
+    lines = 0
+
+    for idx, (id, parents, _, names, _, _) in enumerate(commits):
+        parents = parents.split()
+        node_lines = [(id, parents, names)]
+        if has_local and any(b.strip().startswith("HEAD") for b in names.split(",")):
+            # The dummy commit for local changes
+            node_lines.insert(0, (LOCAL_CHANGES_ID, [id], ""))
+
+        for node_id, node_parents, node_names in node_lines:
+            node = visibility.get(node_id)
+            if node is None:
+                node = visibility[node_id] = [always_visible, 0]
+            elif node_names or len(node_parents) > 1:
+                node[0] = always_visible
+
+            for p in node_parents:
+                parent = visibility.get(p)
+                if parent is None:
+                    parent = visibility[p] = [1, 1]
+                else:
+                    parent[0] += 1
+                    parent[1] += 1
+                    if parent[1] > 1:
+                        node[0] = always_visible
+                if len(node_parents) > 1:
+                    parent[0] = always_visible
+
+            if node[0] >= always_visible:
+                lines += 1
+                if lines >= max_lines:
+                    return idx + 1
+
+    return None
+
+
+class _History_Page(object):
+    """
+    The commits of the history fetched so far for a given filter, as lists
+    of [id, parents, author, refs, date, subject].
+    """
+
+    def __init__(self):
+        self.commits = []
+        self.complete = False  # whether all commits have been fetched
+
+
+ANNOTATIONS_CACHE_SIZE = 16
+# Number of files for which the annotations are kept in memory
+
+ANNOTATIONS_VISIBLE_LINES = 100
+# Number of lines around the cursor whose annotations are reported first
+
+_commit_annotations = {}
+# For each commit id, the annotation displayed in editors. Commits never
+# change, so this is shared by all files and repositories.
+
+
+def _status_from_xy(xy):
+    """
+    Convert the two-letters status code output by "git status --porcelain"
+    to a GPS.VCS2.Status.
+
+    :param str xy: the status of the index and of the work tree
+    """
+    if xy in ("DD", "AU", "UD", "UA", "DU", "AA", "UU"):
+        return GPS.VCS2.Status.CONFLICT
+
+    status = 0
+
+    if xy[0] == "M":
+        status = GPS.VCS2.Status.STAGED_MODIFIED
+    elif xy[0] == "A":
+        status = GPS.VCS2.Status.STAGED_ADDED
+    elif xy[0] == "D":
+        status = GPS.VCS2.Status.STAGED_DELETED
+    elif xy[0] == "R":
+        status = GPS.VCS2.Status.STAGED_RENAMED
+    elif xy[0] == "C":
+        status = GPS.VCS2.Status.STAGED_COPIED
+    elif xy[0] == "?":
+        status = GPS.VCS2.Status.UNTRACKED
+    elif xy[0] == "!":
+        status = GPS.VCS2.Status.IGNORED
+
+    if xy[1] == "M":
+        status = status | GPS.VCS2.Status.MODIFIED
+    elif xy[1] == "D":
+        status = status | GPS.VCS2.Status.DELETED
+
+    return status
+
+
+def _version_at_least(*version):
+    """
+    Whether the version of git is at least the given one.
+    """
+    return _version is not None and _version >= list(version)
+
+
+def _glob_escape(path):
+    """
+    Escape the special characters of a pathspec using the glob magic.
+    """
+    return re.sub(r"([*?[\]\\])", r"\\\1", path)
+
 
 @core.register_vcs(default_status=GPS.VCS2.Status.NO_VCS)
 class Git(core.VCS):
@@ -45,6 +173,13 @@ class Git(core.VCS):
 
         self._non_default_files = None
         # Files with a non-default status
+
+        self._annotations_cache = {}
+        # For each file, the key and result of the last "git blame"
+
+        self._history_cache = {}
+        # The commits already fetched, indexed by filter and refs
+
         self.__set_git_version()
 
     def _git(self, args, block_exit=False, **kwargs):
@@ -67,53 +202,87 @@ class Git(core.VCS):
         f = f.replace("\\", "/")
         return f
 
+    def __ls_tree_cache_file(self):
+        """
+        The file in which the list of files under version control is saved
+        across sessions.
+        """
+        key = hashlib.sha1(self.working_dir.path.encode("utf-8")).hexdigest()
+        return os.path.join(GPS.get_home_dir(), "vcs_cache", "git_ls_tree_" + key)
+
+    def __load_ls_tree_cache(self, tree):
+        """
+        Return the list of files saved for the given tree id, or None if
+        the cache is missing or was computed for another tree.
+
+        :param str tree: the id of the tree object for HEAD
+        """
+        try:
+            with open(self.__ls_tree_cache_file(), encoding="utf-8") as f:
+                if f.readline().rstrip("\n") != tree:
+                    return None
+                return f.read().split("\0")
+        except (IOError, OSError, UnicodeDecodeError):
+            return None
+
+    def __save_ls_tree_cache(self, tree, paths):
+        """
+        Save the list of files under version control for the given tree id.
+        """
+        cache_file = self.__ls_tree_cache_file()
+        try:
+            if not os.path.isdir(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            with open(cache_file, "w", encoding="utf-8") as f:
+                f.write(tree + "\n")
+                f.write("\0".join(paths))
+        except (IOError, OSError):
+            GPS.Logger("GIT").log("could not write %s" % (cache_file,))
+
     def __git_ls_tree(self, s):
         """
-        Compute all files under version control
-        :param list all_files: will be modified to include the list of files
+        Compute all files under version control, reusing the list saved in
+        a previous session when HEAD still points to the same tree.
+
+        :param s: the result of calling self.set_status_for_all_files
         """
-        non_default_files = s.files_with_explicit_status
-        p = self._git(["ls-tree", "-r", "HEAD", "--name-only"])
-        while True:
-            line = yield p.wait_line()
-            if line is None:
-                break
-            f = GPS.File(os.path.join(self.working_dir.path, line))
-            if f not in non_default_files:
-                s.set_status(f, GPS.VCS2.Status.UNMODIFIED)
+        p = self._git(["rev-parse", "HEAD^{tree}"], ignore_error=True)
+        status, output = yield p.wait_until_terminate()
+        tree = output.strip() if status == 0 else ""
 
-    def __git_status(self, s):
+        paths = self.__load_ls_tree_cache(tree) if tree else None
+        if paths is None:
+            p = self._git(["ls-tree", "-r", "-z", "--name-only", "HEAD"])
+            status, output = yield p.wait_until_terminate()
+            paths = [path for path in output.split("\0") if path]
+            if status == 0 and tree:
+                self.__save_ls_tree_cache(tree, paths)
+        else:
+            GPS.Logger("GIT").log("reusing ls-tree cache for %s" % (tree,))
+
+        non_default_files = s.paths_with_explicit_status
+        s.set_relative_statuses(
+            (path, GPS.VCS2.Status.UNMODIFIED)
+            for path in paths
+            if path not in non_default_files
+        )
+
+    def __git_status(self, s, dirs=None):
         """
         Run and parse "git status"
         :param s: the result of calling self.set_status_for_all_files
+        :param set(str) dirs: if specified, only compute the status of the
+           files directly in these directories (requires git 2.11)
         """
+        if _version_at_least(2, 11):
+            yield self.__git_status_v2(s, dirs)
+            return
+
+        statuses = []
 
         def on_line(line):
             if len(line) > 3:
-                if line[0:2] in ("DD", "AU", "UD", "UA", "DU", "AA", "UU"):
-                    status = GPS.VCS2.Status.CONFLICT
-                else:
-                    status = 0
-
-                    if line[0] == "M":
-                        status = GPS.VCS2.Status.STAGED_MODIFIED
-                    elif line[0] == "A":
-                        status = GPS.VCS2.Status.STAGED_ADDED
-                    elif line[0] == "D":
-                        status = GPS.VCS2.Status.STAGED_DELETED
-                    elif line[0] == "R":
-                        status = GPS.VCS2.Status.STAGED_RENAMED
-                    elif line[0] == "C":
-                        status = GPS.VCS2.Status.STAGED_COPIED
-                    elif line[0] == "?":
-                        status = GPS.VCS2.Status.UNTRACKED
-                    elif line[0] == "!":
-                        status = GPS.VCS2.Status.IGNORED
-
-                    if line[1] == "M":
-                        status = status | GPS.VCS2.Status.MODIFIED
-                    elif line[1] == "D":
-                        status = status | GPS.VCS2.Status.DELETED
+                status = _status_from_xy(line[0:2])
 
                 # Filter some obvious files to speed things up
                 if line[-3:] != ".o" and line[-5:] != ".ali":
@@ -123,9 +292,7 @@ class Git(core.VCS):
                         path = line[4:-1]
                     else:
                         path = line[3:]
-                    s.set_status(
-                        GPS.File(os.path.join(self.working_dir.path, path)), status
-                    )
+                    statuses.append((path, status))
 
         if _version and _version in [1, 7, 2]:
             ignored = []
@@ -134,6 +301,68 @@ class Git(core.VCS):
 
         p = self._git(["status", "--porcelain"] + ignored)
         yield p.lines.subscribe(on_line)  # wait until p terminates
+        s.set_relative_statuses(statuses)
+
+    def __git_status_v2(self, s, dirs=None):
+        """
+        Run and parse "git status --porcelain=v2 -z", which needs no
+        unquoting of file names.
+        Object files are filtered by git itself, and the untracked cache and
+        the file system monitor are enabled when git supports them.
+
+        :param s: the result of calling self.set_status_for_all_files
+        :param set(str) dirs: if specified, only compute the status of the
+           files directly in these directories.
+        """
+        config = []
+        if _version_at_least(2, 8):
+            config += ["-c", "core.untrackedCache=true"]
+        if _version_at_least(2, 36) and platform.system() in ("Windows", "Darwin"):
+            config += ["-c", "core.fsmonitor=true"]
+
+        if dirs is None:
+            pathspecs = ["."]
+        else:
+            pathspecs = [
+                ":(glob)%s*" % (_glob_escape(d) + "/" if d else "") for d in dirs
+            ]
+
+        p = self._git(
+            config
+            + ["status", "--porcelain=v2", "-z", "--ignored", "--"]
+            + pathspecs
+            + [":(exclude)*.o", ":(exclude)*.ali"]
+        )
+        _, output = yield p.wait_until_terminate()
+
+        statuses = []
+        fields = iter(output.split("\0"))
+        for entry in fields:
+            kind = entry[0:1]
+            if kind == "1":
+                # 1 XY sub mH mI mW hH hI path
+                path = entry.split(" ", 8)[8]
+                status = _status_from_xy(entry[2:4])
+            elif kind == "2":
+                # 2 XY sub mH mI mW hH hI Xscore path, then the original path
+                path = entry.split(" ", 9)[9]
+                status = _status_from_xy(entry[2:4])
+                next(fields, None)
+            elif kind == "u":
+                path = entry.split(" ", 10)[10]
+                status = GPS.VCS2.Status.CONFLICT
+            elif kind == "?":
+                path = entry[2:]
+                status = GPS.VCS2.Status.UNTRACKED
+            elif kind == "!":
+                path = entry[2:]
+                status = GPS.VCS2.Status.IGNORED
+            else:
+                continue
+
+            statuses.append((path, status))
+
+        s.set_relative_statuses(statuses)
 
     @workflows.run_as_workflow
     def __set_git_version(self):
@@ -155,13 +384,21 @@ class Git(core.VCS):
             _version = [int(x) for x in version]
 
     def async_fetch_status_for_files(self, files):
-        self.async_fetch_status_for_all_files(from_user=False, extra_files=files)
+        # Only refresh the directories of the files, which are typically
+        # the files saved since the last refresh.
+        dirs = set(posixpath.dirname(self.__git_path(f)) for f in files)
+        self.async_fetch_status_for_all_files(
+            from_user=False, extra_files=files, dirs=dirs
+        )
 
     @core.run_in_background
-    def async_fetch_status_for_all_files(self, from_user, extra_files=[]):
+    def async_fetch_status_for_all_files(self, from_user, extra_files=[], dirs=None):
         """
         :param List(GPS.File) extra_files: files for which we need to
            set the status eventually
+        :param set(str) dirs: if specified, only refresh the status of the
+           files directly in these directories, relative to the working
+           directory.
         """
 
         s = self.set_status_for_all_files()
@@ -171,7 +408,7 @@ class Git(core.VCS):
         # output of "git status", so we do not need to execute it again.
         if from_user or self._non_default_files is None:
             yield self.__git_status(s)
-            self._non_default_files = s.files_with_explicit_status
+            self._non_default_files = set(s.paths_with_explicit_status)
             yield self.__git_ls_tree(s)
         else:
             # Reuse caches: we do not need to recompute the full list of files
@@ -183,12 +420,26 @@ class Git(core.VCS):
             # instance modified files), and are no longer there (either after
             # a "reset" or a "commit").
 
-            yield self.__git_status(s)
-            nondefault = s.files_with_explicit_status
-            now_default = self._non_default_files.difference(nondefault)
-            self._non_default_files = nondefault
-            for f in now_default:
-                s.set_status(f, GPS.VCS2.Status.UNMODIFIED)
+            if dirs is not None and not _version_at_least(2, 11):
+                dirs = None
+
+            yield self.__git_status(s, dirs)
+            nondefault = set(s.paths_with_explicit_status)
+            if dirs is None:
+                now_default = self._non_default_files.difference(nondefault)
+                self._non_default_files = nondefault
+            else:
+                in_dirs = set(
+                    path
+                    for path in self._non_default_files
+                    if posixpath.dirname(path.rstrip("/")) in dirs
+                )
+                now_default = in_dirs.difference(nondefault)
+                self._non_default_files.difference_update(in_dirs)
+                self._non_default_files.update(nondefault)
+            s.set_relative_statuses(
+                (path, GPS.VCS2.Status.UNMODIFIED) for path in now_default
+            )
 
         s.async_set_status_for_remaining_files()
 
@@ -293,11 +544,75 @@ class Git(core.VCS):
         status, _ = yield p.wait_until_terminate()
         yield status != 0
 
+    def __history_key(self, filter):
+        """
+        Compute the key of the history cache for the given filter: the
+        history only changes when HEAD, or the other refs when all branches
+        are displayed, change.
+        """
+        for_file = filter[1]
+        current_branch_only = filter[3]
+
+        if current_branch_only:
+            p = self._git(["rev-parse", "HEAD"], ignore_error=True)
+        else:
+            p = self._git(
+                ["for-each-ref", "--format=%(objectname)", "--", "refs", "HEAD"],
+                ignore_error=True,
+            )
+        _, output = yield p.wait_until_terminate()
+        head = hashlib.sha1(output.encode("utf-8")).hexdigest()
+
+        yield (
+            for_file.path if for_file else None,
+            filter[2],
+            current_branch_only,
+            filter[4],
+            head,
+        )
+
+    def __fetch_history_page(self, git_cmd, page, count):
+        """
+        Fetch the next `count` commits of the history, and append them to
+        `page`. The last commit already in page is fetched again, to check
+        that the history has not changed since the previous page.
+
+        :param List(str) git_cmd: the "git log" command, without paging
+        :param _History_Page page: the commits fetched so far
+        :param int count: the number of commits to fetch
+        """
+        skip = max(0, len(page.commits) - 1)
+        if page.commits:
+            count += 1
+
+        p = self._git(
+            git_cmd[:1] + ["--skip=%d" % skip, "--max-count=%d" % count] + git_cmd[1:]
+        )
+        _, output = yield p.wait_until_terminate()
+
+        # Each record is made of 6 NUL-terminated fields
+        fields = output.split("\0")
+        records = [fields[idx : idx + 6] for idx in range(0, len(fields) - 5, 6)]
+
+        if page.commits:
+            if not records or records[0][0] != page.commits[-1][0]:
+                GPS.Logger("GIT").log("history changed, fetching from start")
+                page.commits = []
+                page.complete = False
+                return
+            records.pop(0)
+            count -= 1
+
+        page.commits.extend(records)
+        page.complete = len(records) < count
+
     @core.run_in_background
     def async_fetch_history(self, visitor, filter):
         # Compute, in parallel, needed pieces of information
-        (unpushed, has_local) = yield join(
-            self._unpushed_local_changes(), self._has_local_changes()
+        (unpushed, has_local, key) = yield join(
+            self._unpushed_local_changes(),
+            self._has_local_changes(),
+            self.__history_key(filter),
         )
 
         # Then fetch the history
@@ -319,8 +634,9 @@ class Git(core.VCS):
 
         git_cmd = [
             "log",
-            # use tformat to get final newline
-            "--pretty=tformat:%H@@%P@@%an@@%D@@%cD@@%s",
+            # NUL-separated fields, and NUL after each commit
+            "--pretty=tformat:%H%x00%P%x00%an%x00%D%x00%cD%x00%s",
+            "-z",
         ]
         if not current_branch_only:
             git_cmd.append("--branches")
@@ -331,20 +647,37 @@ class Git(core.VCS):
         git_cmd += [
             "--topo-order",  # children before parents
             filter_switch,
-            "--max-count=%d" % max_lines if not branch_commits_only else "",
             "%s" % for_file.path if for_file else "",
         ]
-        p = self._git(git_cmd)
 
-        nb_added_lines = 0
+        page = self._history_cache.pop(key, None)
+        if page is None:
+            page = _History_Page()
+            if len(self._history_cache) >= HISTORY_CACHE_SIZE:
+                self._history_cache.pop(next(iter(self._history_cache)))
+        self._history_cache[key] = page
+
+        # When only the commits related to branching points are displayed
+        # (which is only possible when the graph is displayed), we do not
+        # know in advance how many commits are needed to fill the view.
+        if branch_commits_only and not pattern and not for_file:
+            count = max_lines * HISTORY_BRANCH_COMMITS_FACTOR
+            while True:
+                end = _branch_commits_end(page.commits, max_lines, has_local)
+                if end is not None or page.complete:
+                    break
+                yield self.__fetch_history_page(git_cmd, page, count)
+                count *= 2
+        else:
+            end = max_lines
+            while not page.complete and len(page.commits) < max_lines:
+                yield self.__fetch_history_page(
+                    git_cmd, page, max_lines - len(page.commits)
+                )
 
-        while True:
-            line = yield p.wait_line()
-            if line is None or "@@" not in line:
-                GPS.Logger("GIT").log("finished git-status")
-                break
+        nb_added_lines = 0
 
-            id, parents, author, branches, date, subject = line.split("@@")
+        for id, parents, author, branches, date, subject in page.commits[:end]:
             parents = parents.split()
             branches = None if not branches else branches.split(",")
 
@@ -488,37 +821,103 @@ class Git(core.VCS):
         else:
             GPS.Logger("GIT").log("Error computing diff: %s" % output)
 
+    def __annotations_key(self, file):
+        """
+        Compute the key of the annotations cache for file: the annotations
+        only change when HEAD or the contents of the file change.
+        """
+        head, blob = yield join(
+            self._git(["rev-parse", "HEAD"], ignore_error=True).wait_until_terminate(),
+            self._git(
+                ["hash-object", "--", file.path], ignore_error=True
+            ).wait_until_terminate(),
+        )
+        yield (head[1].strip(), blob[1].strip())
+
     @core.run_in_background
     def async_annotations(self, visitor, file):
-        info = {}  # for each commit id, the annotation
-        current_id = None
-        first_line = 1
-        lines = []
-        ids = []
+        key = yield self.__annotations_key(file)
+        cached = self._annotations_cache.get(file.path)
+        if cached is not None and cached[0] == key:
+            visitor.annotations(file, 1, cached[1], cached[2])
+            return
 
-        p = self._git(["blame", "--porcelain", file.path])
+        # The lines visible in the editor, reported as soon as they are known
+        first_visible = 1
+        buffer = GPS.EditorBuffer.get(file, open=False)
+        view = buffer.current_view() if buffer else None
+        if view is not None:
+            first_visible = max(
+                1, view.cursor().line() - ANNOTATIONS_VISIBLE_LINES // 2
+            )
+        last_visible = first_visible + ANNOTATIONS_VISIBLE_LINES - 1
+        nb_visible = 0
+        visible_reported = False
+
+        info = {}  # annotations for commits seen in this file
+        by_line = {}  # for each line, the commit id
+        current = None  # (commit id, first line, number of lines)
+        author = ""
+
+        # With --incremental, git reports blocks of lines as soon as they
+        # are blamed, and commit details only once per commit.
+        p = self._git(["blame", "--incremental", "--", file.path])
         while True:
             line = yield p.wait_line()
             if line is None:
                 break
 
-            if current_id is None:
-                current_id = line.split(" ", 1)[0]
-
-            elif line[0] == "\t":
-                # The line of code, which we ignore
-                lines.append(info[current_id])
-                ids.append(current_id)
-                current_id = None
+            if current is None:
+                fields = line.split(" ")
+                current = (fields[0], int(fields[2]), int(fields[3]))
 
             elif line.startswith("author "):
-                info[current_id] = line[7:17]  # at most 10 chars
+                author = line[7:17]  # at most 10 chars
 
             elif line.startswith("committer-time "):
-                d = datetime.datetime.fromtimestamp(int(line[15:])).strftime("%Y%m%d")
-                info[current_id] = "%s %10s %s" % (d, info[current_id], current_id[0:7])
+                id = current[0]
+                if id not in _commit_annotations:
+                    d = datetime.datetime.fromtimestamp(int(line[15:])).strftime(
+                        "%Y%m%d"
+                    )
+                    info[id] = "%s %10s %s" % (d, author, id[0:7])
+
+                    # Uncommitted lines have a null id, and are not shared
+                    if id.strip("0"):
+                        _commit_annotations[id] = info[id]
+
+            elif line.startswith("filename "):
+                id, start, count = current
+                current = None
+                for num in range(start, start + count):
+                    by_line[num] = id
+                nb_visible += max(
+                    0,
+                    min(last_visible, start + count - 1)
+                    - max(first_visible, start)
+                    + 1,
+                )
+
+                if not visible_reported and nb_visible == ANNOTATIONS_VISIBLE_LINES:
+                    visible_reported = True
+                    ids = [
+                        by_line[num] for num in range(first_visible, last_visible + 1)
+                    ]
+                    visitor.annotations(
+                        file,
+                        first_visible,
+                        ids,
+                        [info.get(i) or _commit_annotations[i] for i in ids],
+                    )
+
+        ids = [by_line[num] for num in range(1, len(by_line) + 1)]
+        lines = [info.get(i) or _commit_annotations[i] for i in ids]
+
+        if len(self._annotations_cache) >= ANNOTATIONS_CACHE_SIZE:
+            self._annotations_cache.pop(next(iter(self._annotations_cache)))
+        self._annotations_cache[file.path] = (key, ids, lines)
 
-        visitor.annotations(file, first_line, ids, lines)
+        visitor.annotations(file, 1, ids, lines)
 
     def _branches(self, visitor):
         """
@@ -486,6 +486,47 @@ def wait_signal(widget, signal_name, *args):
     return p
 
 
+class LineSplitter(object):
+    """
+    Split a stream of output chunks into lines, without the trailing \\n.
+    Each chunk is only scanned once, whatever the number of lines it
+    contains.
+
+        splitter = LineSplitter()
+        splitter.feed("a\\nb")   # returns ["a"]
+        splitter.feed("c\\n")    # returns ["bc"]
+        splitter.flush()         # returns "", the incomplete last line
+    """
+
+    def __init__(self):
+        self.__partial = ""
+
+    def feed(self, output):
+        """
+        Return the list of lines completed by output.
+
+        :param str output: the next chunk of output
+        :rtype: list[str]
+        """
+        if "\n" not in output:
+            self.__partial += output
+            return []
+
+        lines = (self.__partial + output).split("\n")
+        self.__partial = lines.pop()
+        return lines
+
+    def flush(self):
+        """
+        Return the last incomplete line, if any, and reset the splitter.
+
+        :rtype: str
+        """
+        partial = self.__partial
+        self.__partial = ""
+        return partial
+
+
 class ProcessWrapper(object):
     """
     ProcessWrapper is an advanced process manager
@@ -505,6 +546,9 @@ class ProcessWrapper(object):
 
     """
 
+    # The pattern used by wait_line
+    __line_pattern = re.compile("^.*\n", re.MULTILINE)
+
     def __init__(
         self,
         cmdargs=[],
@@ -553,9 +597,20 @@ class ProcessWrapper(object):
         # __current_pattern = regexp that user waiting for in the output
         self.__current_pattern = None
 
+        # Whether the trailing newline should be removed from the match
+        self.__strip_newline = False
+
+        # The maximal number of lines the user is waiting for (0 for no
+        # limit), or None if waiting for __current_pattern
+        self.__max_lines = None
+
         # __output = a buffer for current output of self.__process
         self.__output = ""
 
+        # __cursor = the position in __output of the first character that
+        # was not consumed by a previous match
+        self.__cursor = 0
+
         # __whether process has finished
         self.finished = False
 
@@ -643,13 +698,21 @@ class ProcessWrapper(object):
 
             self.stream.subscribe(__display_output, oncompleted=__show_console_on_exit)
 
+    def __append_output(self, output):
+        """
+        Add output to the buffer, discarding the part already consumed.
+        """
+        if self.__cursor:
+            self.__output = self.__output[self.__cursor :]
+            self.__cursor = 0
+        self.__output += output
+
     def __on_match(self, process, match, unmatch):
         """
         Called by GPS everytime there's output coming
         """
         if self.__current_promise is not None:
-            self.__output += unmatch
-            self.__output += match
+            self.__append_output(unmatch + match)
             self.__check_pattern_and_resolve()
         if self.__stream is not None:
             self.__stream.emit(unmatch)
@@ -669,14 +732,54 @@ class ProcessWrapper(object):
         Check whether the current pattern matches the already known output
         of the tool, and resolve the promise if possible.
         """
-        if self.__current_promise is not None:
-            p = self.__current_pattern.search(self.__output)
-            if p:
-                self.__output = self.__output[p.end(0) :]
+        if self.__current_promise is None:
+            return
+
+        if self.__max_lines is not None:
+            self.__check_lines_and_resolve()
+            return
+
+        # Patterns are matched against the output that was not consumed
+        # yet, so that "^" and "\A" match at its start and lookbehinds do
+        # not see the consumed output. The pattern of wait_line can start
+        # at the cursor instead, as long as the cursor is at the start of
+        # a line.
+        if self.__cursor and (
+            self.__current_pattern is not self.__line_pattern
+            or self.__output[self.__cursor - 1] != "\n"
+        ):
+            self.__output = self.__output[self.__cursor :]
+            self.__cursor = 0
+
+        p = self.__current_pattern.search(self.__output, self.__cursor)
+        if p:
+            self.__cursor = p.end(0)
+            if self.__strip_newline:
+                self.__resolve_promise(p.group(0)[:-1])
+            else:
                 self.__resolve_promise(p.group(0))
-            elif self.finished:
-                # We will never be able to match anyway
-                self.__resolve_promise(None)
+        elif self.finished:
+            # We will never be able to match anyway
+            self.__resolve_promise(None)
+
+    def __check_lines_and_resolve(self):
+        """
+        Resolve the current promise with the complete lines available in
+        the output, if any.
+        """
+        end = self.__output.rfind("\n", self.__cursor)
+        if end != -1:
+            lines = self.__output[self.__cursor : end].split("\n")
+            if self.__max_lines and len(lines) > self.__max_lines:
+                del lines[self.__max_lines :]
+                self.__cursor += sum(len(line) for line in lines) + len(lines)
+            else:
+                self.__cursor = end + 1
+            self.__resolve_promise(lines)
+        elif self.finished:
+            last = self.__output[self.__cursor :]
+            self.__cursor = len(self.__output)
+            self.__resolve_promise([last] if last else None)
 
     def __on_exit(self, process, status, remaining_output):
         """
@@ -685,8 +788,10 @@ class ProcessWrapper(object):
         Current_promise will be solved with False
         """
         self.finished = True
+        # Keep the output even if no promise is pending: wait_lines still
+        # returns the lines not consumed yet.
+        self.__append_output(remaining_output)
         if self.__current_promise is not None:
-            self.__output += remaining_output
             self.__check_pattern_and_resolve()
 
         if self.__stream is not None:
@@ -734,6 +839,15 @@ class ProcessWrapper(object):
         else:
             self.__current_pattern = pattern
 
+        self.__strip_newline = False
+        self.__max_lines = None
+        return self.__wait(timeout)
+
+    def __wait(self, timeout=0):
+        """
+        Create the promise for the current pattern or number of lines, and
+        try to resolve it with the output already known.
+        """
         p = self.__current_promise = Promise()
 
         # Can we resolve immediately ?
@@ -754,15 +868,44 @@ class ProcessWrapper(object):
 
         :return: a promise
         """
-        p = Promise()
+        if self.finished:
+            p = Promise()
+            p.resolve(None)
+            return p
 
-        s = self.wait_until_match("^.*\n")
-        if s is None:
-            p.resolve(None)  # already finished
-        else:
-            s.then(lambda line: p.resolve(line[:-1] if line else None))
+        self.__current_pattern = self.__line_pattern
+        self.__strip_newline = True
+        self.__max_lines = None
+        return self.__wait()
+
+    def wait_lines(self, max_lines=0):
+        """
+        Wait for one or more lines to be available, and return all the
+        complete lines already received (at most max_lines if it is not 0),
+        as a list of strings without the trailing \\n.
+        The last line of the output is returned once the process has
+        terminated, even if it does not end with a newline. The promise is
+        resolved with None when there is no more output.
+        This is much faster than `wait_line` when the process outputs a large
+        number of lines::
+
+            lines = yield p.wait_lines()
+            while lines is not None:
+                for line in lines:
+                    pass  # do something with the line
+                lines = yield p.wait_lines()
+
+        :param int max_lines: the maximal number of lines to return.
+        :return: a promise
+        """
+        if self.finished and self.__cursor >= len(self.__output):
+            p = Promise()
+            p.resolve(None)
+            return p
 
-        return p
+        self.__current_pattern = None
+        self.__max_lines = max_lines
+        return self.__wait()
 
     @property
     def stream(self):
@@ -825,24 +968,55 @@ class ProcessWrapper(object):
 
         class map_to_line:
             def __init__(self):
-                self.buffer = ""
-                self.__re = re.compile("^.*\n")
+                self.splitter = LineSplitter()
 
             def __call__(self, out_stream, output):
-                self.buffer += output
-                while True:
-                    p = self.__re.search(self.buffer)
-                    if not p:
-                        break
-                    out_stream.emit(p.group(0)[:-1])
-                    self.buffer = self.buffer[p.end(0) :]
+                for line in self.splitter.feed(output):
+                    out_stream.emit(line)
 
             def oncompleted(self, out_stream, status):
-                if self.buffer:
-                    out_stream.emit(self.buffer)
+                last = self.splitter.flush()
+                if last:
+                    out_stream.emit(last)
 
         return self.stream.flatMap(map_to_line())
 
+    @property
+    def lines_batched(self):
+        """
+        A stream similar to `lines`, but which emits one event for each
+        chunk of output, with the list of lines completed by that chunk.
+        This avoids one call per line when the process outputs a large
+        number of lines::
+
+            def onlines(lines):
+                for line in lines:
+                    pass   # do something with the line
+
+            @run_as_workflow
+            def execute():
+                p = ProcessWrapper(...)
+                yield p.lines_batched.subscribe(onlines)
+
+        :returntype: a stream
+        """
+
+        class map_to_lines:
+            def __init__(self):
+                self.splitter = LineSplitter()
+
+            def __call__(self, out_stream, output):
+                lines = self.splitter.feed(output)
+                if lines:
+                    out_stream.emit(lines)
+
+            def oncompleted(self, out_stream, status):
+                last = self.splitter.flush()
+                if last:
+                    out_stream.emit([last])
+
+        return self.stream.flatMap(map_to_lines())
+
     def wait_until_terminate(self, show_if_error=False):
         """
         Called by user. Make a promise to them that:
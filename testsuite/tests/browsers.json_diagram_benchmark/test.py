@@ -0,0 +1,83 @@
+"""
+Benchmark the loading of a large synthetic JSON diagram file, and check
+that looking up an item only creates the diagram that contains it.
+"""
+
+import time
+import tracemalloc
+
+from GPS import *
+from gs_utils.internal.utils import *
+
+NB_DIAGRAMS = 2000
+NB_ITEMS = 50  # per diagram
+
+
+def diagram(d):
+    items = [
+        {
+            "id": "d%d/block%d" % (d, i),
+            "x": i * 50,
+            "y": 0,
+            "vbox": [{"text": "block%d" % i, "id": "d%d/block%d/label" % (d, i)}],
+        }
+        for i in range(NB_ITEMS)
+    ]
+    links = [
+        {
+            "id": "d%d/link%d" % (d, i),
+            "from": {"ref": "d%d/block%d" % (d, i)},
+            "to": {"ref": "d%d/block%d" % (d, i + 1)},
+            "label": {"text": "0", "id": "d%d/link%d/label" % (d, i)},
+        }
+        for i in range(NB_ITEMS - 1)
+    ]
+    return {"id": "diagram%d" % d, "items": items, "links": links}
+
+
+def is_created(diag):
+    return diag._JSON_Diagram__json is None
+
+
+@run_test_driver
+def run_test():
+    data = {"diagrams": [diagram(d) for d in range(NB_DIAGRAMS)]}
+
+    tracemalloc.start()
+    t0 = time.time()
+    diags = GPS.Browsers.Diagram.load_json_data(data)
+    load_time = time.time() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    GPS.Logger("TESTSUITE").log(
+        "%d diagrams loaded in %.3fs, peak memory %d bytes"
+        % (NB_DIAGRAMS, load_time, peak)
+    )
+
+    gps_assert(len(diags.diagrams), NB_DIAGRAMS, "wrong number of diagrams")
+    gps_assert(
+        any(is_created(d) for d in diags.diagrams),
+        False,
+        "no diagram should be created when loading",
+    )
+
+    last = NB_DIAGRAMS - 1
+    gps_assert(diags.contains("diagram%d" % last), True, "last diagram missing")
+    gps_assert(diags.contains("diagram%d" % NB_DIAGRAMS), False, "extra diagram")
+
+    t0 = time.time()
+    info = diags.get_diagram_for_item("d%d/link%d/label" % (last, NB_ITEMS - 2))
+    lookup_time = time.time() - t0
+    GPS.Logger("TESTSUITE").log("item found in %.3fs" % (lookup_time,))
+
+    gps_assert(info is not None, True, "item not found")
+    gps_assert(info[0].id, "diagram%d" % last, "wrong diagram for the item")
+    gps_assert(
+        [d.id for d in diags.diagrams if is_created(d)],
+        ["diagram%d" % last],
+        "only the diagram containing the item should be created",
+    )
+    gps_assert(diags.get_diagram_for_item("unknown"), None, "unknown item found")
+    gps_assert(diags.get("diagram0").id, "diagram0", "wrong diagram")
+
+    record_time(load_time + lookup_time)
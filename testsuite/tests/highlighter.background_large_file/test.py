@@ -0,0 +1,33 @@
+"""
+Check that large files are highlighted in the background: the visible lines
+are highlighted right away, the rest of the buffer once GPS is idle.
+"""
+
+from GPS import *
+from gs_utils.internal.utils import *
+
+NB_LINES = 20000
+
+
+def has_comment(buf, line):
+    overlays = buf.at(line, 8).get_overlays()
+    return "comments_hl" in [o.name() for o in overlays]
+
+
+@run_test_driver
+def run_test():
+    with open("large.py", "w") as f:
+        f.write("x = 1  # first\n")
+        for _ in range(NB_LINES):
+            f.write("y = 2\n")
+        f.write("z = 3  # last\n")
+
+    buf = GPS.EditorBuffer.get(GPS.File("large.py"))
+    gps_assert(has_comment(buf, 1), True, "Visible lines should be highlighted")
+
+    yield wait_until_true(lambda: has_comment(buf, NB_LINES + 2))
+    gps_assert(
+        has_comment(buf, NB_LINES + 2),
+        True,
+        "The end of the buffer should be highlighted in the background",
+    )
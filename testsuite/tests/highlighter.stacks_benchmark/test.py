@@ -0,0 +1,39 @@
+"""
+Benchmark the paste and deletion of blocks of lines in the HighlighterStacks
+of a buffer of the same size. The time of the largest case is recorded.
+"""
+
+import time
+
+from GPS import *
+from gs_utils.internal.utils import *
+from highlighter.engine import HighlighterStacks
+
+
+def bench(nb_lines):
+    stacks = HighlighterStacks()
+    for line in range(1, nb_lines):
+        stacks.set(line, ("region",) if line % 2 else ())
+
+    t0 = time.time()
+    stacks.insert_newlines(nb_lines, nb_lines // 2)
+    t1 = time.time()
+    stacks.delete_lines(nb_lines, nb_lines // 2)
+    t2 = time.time()
+
+    gps_assert(len(stacks), nb_lines, "Wrong number of lines after paste/delete")
+    gps_assert(stacks.get(nb_lines - 1), ("region",), "Wrong stack after delete")
+    GPS.Logger("TESTSUITE").log(
+        "%s lines: paste %.4fs, delete %.4fs" % (nb_lines, t1 - t0, t2 - t1)
+    )
+    return t2 - t0
+
+
+@run_test_driver
+def run_test():
+    for nb_lines in (1000, 10000):
+        bench(nb_lines)
+
+    elapsed = bench(100000)
+    record_time(elapsed)
+    gps_assert(elapsed < 1, True, "Paste/delete of 100k lines took too long")
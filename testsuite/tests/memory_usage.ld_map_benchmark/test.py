@@ -0,0 +1,69 @@
+"""
+Benchmark the parsing of a large synthetic ld map file by the LD provider
+of the Memory Usage view.
+"""
+
+import os
+import time
+
+from GPS import *
+from gs_utils.internal.utils import *
+from memory_usage_providers.ld import MapFileParser
+
+NB_REGIONS = 64
+NB_MODULES = 3000  # per section
+
+
+@run_test_driver
+def run_test():
+    with open("map.txt", "w") as f:
+        f.write("Memory Configuration\n\n")
+        f.write("Name             Origin             Length             Attributes\n")
+        for r in range(NB_REGIONS):
+            f.write("REGION%d 0x%016x 0x%016x xrw\n" % (r, r * 0x100000, 0x100000))
+        f.write("*default*        0x0000000000000000 0xffffffffffffffff\n\n")
+        f.write("Linker script and memory map\n\n")
+        for s in range(NB_REGIONS):
+            f.write(".text%d 0x%016x 0x%016x\n" % (s, s * 0x100000, 0x100000))
+            for m in range(NB_MODULES):
+                f.write(" *(.text.unit_%d)\n" % (m,))
+                f.write(
+                    " .text          0x%016x       0x10 obj/unit_%d.o\n"
+                    % (s * 0x100000 + m * 0x10, m)
+                )
+                f.write(
+                    "                0x%016x                unit_%d__%d\n"
+                    % (s * 0x100000 + m * 0x10, m, s)
+                )
+
+    t0 = time.time()
+    parser = MapFileParser(os.getcwd())
+    with open("map.txt") as f:
+        parser.feed(f)
+    parser.flush_symbols()
+    regions, sections, modules = parser.result()
+    elapsed = time.time() - t0
+    GPS.Logger("TESTSUITE").log("map file parsed in %.3fs" % (elapsed,))
+
+    gps_assert(len(regions), NB_REGIONS + 1, "wrong number of regions")
+    gps_assert(len(sections), NB_REGIONS, "wrong number of sections")
+    gps_assert(len(modules), NB_REGIONS * NB_MODULES, "wrong number of modules")
+    gps_assert(len(parser.symbols), NB_REGIONS * NB_MODULES, "wrong number of symbols")
+    gps_assert(
+        list(parser.symbols)[-1],
+        (
+            (NB_REGIONS - 1) * 0x100000 + (NB_MODULES - 1) * 0x10,
+            0x10,
+            ".text%d" % (NB_REGIONS - 1),
+            "obj/unit_%d.o" % (NB_MODULES - 1),
+            "unit_%d__%d" % (NB_MODULES - 1, NB_REGIONS - 1),
+        ),
+        "wrong last symbol",
+    )
+    gps_assert(
+        [s[3] for s in sections],
+        ["REGION%d" % r for r in range(NB_REGIONS)],
+        "sections should belong to the first region declared at their address",
+    )
+
+    record_time(elapsed)
@@ -0,0 +1,42 @@
+"""
+Verify that the incremental computation of the Python outline gives the
+same constructs as parsing the whole file, including for files with form
+feeds, which str.splitlines would count as line breaks.
+"""
+
+from GPS import *
+from gs_utils.internal.utils import *
+from python_support import PythonOutline
+
+TEXT = "import os\n\x0c\ndef f():\n    pass\n\n\x0c\ndef g():\n    pass\n"
+
+EDITS = [
+    ("def g():", "def g(a):"),
+    ("    pass\n\n\x0c", "    pass\n\nclass A:\n    x = 1\n\x0c"),
+    ("def f():", "def f(b):  # \x0b"),
+]
+
+
+def parse(text):
+    outline = PythonOutline(text)
+    outline.regions = outline.parse()
+    return outline
+
+
+@run_test_driver
+def run_test():
+    old = parse(TEXT)
+    text = TEXT
+    for before, after in EDITS:
+        text = text.replace(before, after)
+        outline = PythonOutline(text)
+        outline.update(old)
+        gps_assert(
+            list(outline.constructs()),
+            list(parse(text).constructs()),
+            "Wrong constructs after replacing %r with %r" % (before, after),
+        )
+        old = outline
+
+    names = {c[3]: c[5][0] for c in old.constructs()}
+    gps_assert(names["g"], 9, "Wrong line for g")
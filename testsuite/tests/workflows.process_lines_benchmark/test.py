@@ -0,0 +1,72 @@
+"""
+Benchmark the splitting of a large process output into lines, through the
+wait_lines and lines_batched APIs of ProcessWrapper.
+"""
+
+import time
+
+from GPS import *
+from gs_utils.internal.utils import *
+from workflows.promises import LineSplitter, ProcessWrapper
+
+NB_LINES = 1000000
+
+
+@run_test_driver
+def run_test():
+    with open("output.txt", "w") as f:
+        for i in range(NB_LINES):
+            f.write("line %s\n" % i)
+
+    # Feed the synthetic output directly, in chunks that split lines
+    with open("output.txt") as f:
+        text = f.read()
+    t0 = time.time()
+    splitter = LineSplitter()
+    count = 0
+    for start in range(0, len(text), 4093):
+        count += len(splitter.feed(text[start : start + 4093]))
+    gps_assert(count, NB_LINES, "LineSplitter lost some lines")
+    gps_assert(splitter.flush(), "", "LineSplitter should have no partial line")
+    GPS.Logger("TESTSUITE").log("LineSplitter: %.3fs" % (time.time() - t0,))
+
+    # Same output through a process
+    t0 = time.time()
+    p = ProcessWrapper(["cat", "output.txt"])
+    count = 0
+    last = None
+    lines = yield p.wait_lines()
+    while lines is not None:
+        count += len(lines)
+        last = lines[-1]
+        lines = yield p.wait_lines()
+    gps_assert(count, NB_LINES, "wait_lines lost some lines")
+    gps_assert(last, "line %s" % (NB_LINES - 1), "wrong last line")
+    elapsed = time.time() - t0
+    GPS.Logger("TESTSUITE").log("wait_lines: %.3fs" % (elapsed,))
+
+    t0 = time.time()
+    p = ProcessWrapper(["cat", "output.txt"])
+    counts = [0]
+
+    def on_lines(lines):
+        counts[0] += len(lines)
+
+    yield p.lines_batched.subscribe(on_lines)
+    gps_assert(counts[0], NB_LINES, "lines_batched lost some lines")
+    GPS.Logger("TESTSUITE").log("lines_batched: %.3fs" % (time.time() - t0,))
+
+    # The lines still buffered when the process exits are all returned,
+    # including the last one without a newline, before None
+    with open("short.txt", "w") as f:
+        f.write("a\nb\nc\nd\ne\nf\ng")
+    p = ProcessWrapper(["cat", "short.txt"])
+    result = []
+    lines = yield p.wait_lines(2)
+    while lines is not None:
+        gps_assert(len(lines) <= 2, True, "wait_lines returned too many lines")
+        result.extend(lines)
+        lines = yield p.wait_lines(2)
+    gps_assert(result, list("abcdefg"), "wait_lines lost the last lines")
+
+    record_time(elapsed)
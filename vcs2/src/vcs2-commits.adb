@@ -621,10 +621,14 @@ package body VCS2.Commits is
       Kernel        : not null access Kernel_Handle_Record'Class;
       Is_File_Saved : Boolean)
    is
-      pragma Unreferenced (Self, Is_File_Saved);
+      pragma Unreferenced (Self);
       View : constant Commit_View := Commit_Views.Retrieve_View (Kernel);
    begin
-      if View /= null then
+      --  When a file is saved, the engine has already been asked to refresh
+      --  the status of that file only (see Invalidate_File_Status_Cache),
+      --  and the view is updated when that status changes.
+
+      if View /= null and then not Is_File_Saved then
          Refresh (View, From_User => True);
       end if;
    end Execute;
@@ -1401,11 +1401,12 @@ package body VCS2.Engines is
          C := Self.Cache.Find (File);
          if Has_Element (C) then
             Self.Cache.Reference (C).Need_Update := True;
-
-            --  Force a refresh immediately in this case since we
-            --  know what needs refreshing
-            Self.Ensure_Status_For_Files ((1 => File));
          end if;
+
+         --  Force a refresh immediately in this case since we
+         --  know what needs refreshing. This is also needed for files
+         --  not in the cache yet, for instance new files.
+         Self.Ensure_Status_For_Files ((1 => File));
       end if;
    end Invalidate_File_Status_Cache;
 
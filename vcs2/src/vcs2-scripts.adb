@@ -702,6 +702,33 @@ package body VCS2.Scripts is
             Free (List);
          end;
 
+      elsif Command = "_set_relative_files_status" then
+         declare
+            Status : constant VCS_File_Status := VCS_File_Status
+               (Integer'(Data.Nth_Arg (3, Integer (Status_Unmodified))));
+            Version : constant Unbounded_String :=
+               To_Unbounded_String (Data.Nth_Arg (4, ""));
+            Repo_Version : constant Unbounded_String :=
+               To_Unbounded_String (Data.Nth_Arg (5, ""));
+            Root  : constant Virtual_File := VCS.Working_Directory;
+            List  : List_Instance := Data.Nth_Arg (2);
+            Count : constant Integer := List.Number_Of_Arguments;
+            Files : GNATCOLL.VFS.File_Array (1 .. Count);
+         begin
+            for Idx in 1 .. Count loop
+               Files (Idx) := Create_From_Dir
+                 (Root, +String'(List.Nth_Arg (Idx)));
+            end loop;
+
+            VCS.Set_Files_Status_In_Cache
+              (Files => Files,
+               Props =>
+                 (Status       => Status,
+                  Version      => Version,
+                  Repo_Version => Repo_Version));
+            Free (List);
+         end;
+
       elsif Command = "invalidate_status_cache" then
          VCS.Invalidate_File_Status_Cache;
 
@@ -1037,6 +1064,14 @@ package body VCS2.Scripts is
                            4 => Param ("repo_version", Optional => True)),
          Class         => VCS,
          Handler       => VCS_Handler'Access);
+      Kernel.Scripts.Register_Command
+        ("_set_relative_files_status",
+         Params        => (1 => Param ("paths"),
+                           2 => Param ("status", Optional => True),
+                           3 => Param ("version",    Optional => True),
+                           4 => Param ("repo_version", Optional => True)),
+         Class         => VCS,
+         Handler       => VCS_Handler'Access);
       Kernel.Scripts.Register_Command
         ("_override_status_display",
          Params        => (1 => Param ("status"),